@@ -7,3 +7,7 @@ from .base_elements import patch
 #from .text_elements import text
 #from .wrappers import wrapper_plotnine, wrapper_matplotlib, wrapper_seaborn
 from .config import rcParams
+from .cache import size_cache_info, clear_size_cache, \
+    fragment_cache_info, clear_fragment_cache, output_cache_info, \
+    clear_output_cache
+from .batch import save_all
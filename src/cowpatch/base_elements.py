@@ -2,16 +2,25 @@ import numpy as np
 import plotnine as p9
 import matplotlib.pyplot as plt
 import svgutils.transform as sg
+from lxml import etree
+from PIL import Image
 
 from .svg_utils import gg_to_svg, _save_svg_wrapper, _show_image, \
-                    _raw_gg_to_svg, _select_correcting_size_svg, \
-                    _uniquify_svg_safe
+                    _uniquify_svg_safe, _dedup_svg_defs, _gg_num_elements, \
+                    _minify_svg, _raw_gg_to_image, _save_image_wrapper, \
+                    _file_format, _raster_file_options, _svg_bytes_to_image
 from .utils import to_inches, from_inches, inherits_plotnine, inherits, \
-                    _flatten_nested_list
+                    _flatten_nested_list, _run_in_executor
 from .layout_elements import layout
-from .config import rcParams
+from .config import rcParams, _rcParams_context
+from .cache import _cached_select_correcting_size_svg, _cached_build_gg, \
+    _parallel_cached_select_correcting_size_svg, _cached_gg_to_svg, \
+    _output_cache_keys, _output_cache_get, _output_cache_put
+from .exceptions import CowpatchWarning
 
 import copy
+import io
+import warnings
 
 class patch:
     def __init__(self, *args, grobs=None):
@@ -213,7 +222,9 @@ class patch:
     def __and__(self, other):
         raise ValueError("currently not implimented &")
 
-    def _svg(self, width_pt, height_pt, sizes=None, num_attempts=None, _u_idx=None):
+    def _svg(self, width_pt, height_pt, sizes=None, num_attempts=None,
+             _u_idx=None, renders=None, max_workers=None, rasterize=None,
+             raster_dpi=96):
         """
         Internal function to create an svg representation of the patch
 
@@ -223,6 +234,26 @@ class patch:
             desired width of svg object in points
         height_pt : float
             desired height of svg object in points
+        sizes : nested list
+            sizes of plotnine objects (see ``_svg_get_sizes``). If None, they
+            are calculated (and the global size may be corrected w.r.t.
+            ``num_attempts``)
+        num_attempts : int
+            number of attempts to correct the global size (see
+            ``cow.rcParams``). Each retry starts the size solver of each
+            plotnine object from its previous solution (see
+            ``_svg_warm_starts``)
+        renders : nested list
+            svg objects already rendered at ``sizes`` (see
+            ``_svg_get_sizes``), None values (or a None list) are rendered
+        max_workers : int
+            maximum number of worker processes to solve the sizes of the
+            plotnine objects (see ``_svg_get_sizes``)
+        rasterize : boolean or nested list
+            logic if the data layers of the plotnine objects should be
+            rasterized (see ``_svg_rasterize_logics``)
+        raster_dpi : int
+            dots per inch of the rasterized data layers
 
         Returns
         -------
@@ -244,26 +275,21 @@ class patch:
             _u_idx = str(self.__hash__())
 
 
+        rasterize = self._svg_rasterize_logics(rasterize)
+
         # examine if sizing is possible and update or error if not
         # --------------------------------------------------------
-        if sizes is None: # top layer
-            #pdb.set_trace()
-            while num_attempts > 0:
-                sizes, logics = self._svg_get_sizes(width_pt=width_pt,
-                                                    height_pt=height_pt)
-                out_info = self._process_sizes(sizes, logics)
-
-                if type(out_info) is list:
-                    num_attempts = -412 # strictly less than 0
-                else: # out_info is a scaling
-                    width_pt = width_pt*out_info
-                    height_pt = height_pt*out_info
-
-                num_attempts -= 1
-
-            if num_attempts == 0:
-                raise StopIteration("Attempts to find the correct sizing of inner"+
-                            "plots failed with provided parameters")
+        top_layer = sizes is None
+        if top_layer:
+            # (rasterized plotnine objects are rendered again, so vector
+            # renders of all objects are only kept if none are rasterized)
+            sizes, renders, width_pt, height_pt = \
+                self._svg_solve_sizes(width_pt=width_pt,
+                                      height_pt=height_pt,
+                                      num_attempts=num_attempts,
+                                      max_workers=max_workers,
+                                      return_renders=not np.any(
+                                        _flatten_nested_list(rasterize)))
 
         layout = self.layout
 
@@ -287,17 +313,22 @@ class patch:
             # TODO: how to deal with ggplot objects vs patch objects
             if inherits(self.grobs[p_idx], patch):
                 inner_width_pt, inner_height_pt = inner_area.width, inner_area.height
+                inner_renders = None if renders is None else renders[p_idx]
                 inner_svg, _ = self.grobs[p_idx]._svg(width_pt = inner_width_pt,
                                                    height_pt = inner_height_pt,
                                                    sizes = sizes[p_idx],
-                                                   _u_idx = inner_u_idx)
+                                                   _u_idx = inner_u_idx,
+                                                   renders = inner_renders,
+                                                   rasterize = rasterize[p_idx],
+                                                   raster_dpi = raster_dpi)
             elif inherits_plotnine(self.grobs[p_idx]):
-                inner_gg_width_in, inner_gg_height_in = sizes[p_idx]
-                inner_svg = _raw_gg_to_svg(self.grobs[p_idx],
-                                      width = inner_gg_width_in,
-                                      height = inner_gg_height_in,
-                                      dpi = 96)
-                inner_svg = _uniquify_svg_safe(inner_svg, inner_u_idx)
+                inner_svg = self._svg_leaf(p_idx,
+                                           size = sizes[p_idx],
+                                           render = None if renders is None \
+                                                else renders[p_idx],
+                                           _u_idx = inner_u_idx,
+                                           rasterize = rasterize[p_idx],
+                                           raster_dpi = raster_dpi)
 
             else:
                 raise ValueError("grob idx %i is not a patch object nor"+
@@ -310,8 +341,444 @@ class patch:
                               y=inner_area.y_top)
             base_image.append(inner_root)
 
+        # share definitions (glyphs, clip paths, markers) across plotnine
+        # objects
+        if top_layer and rcParams["svg_dedup_defs"]:
+            _dedup_svg_defs(base_image)
+
         return base_image, (width_pt, height_pt)
 
+    def _svg_solve_sizes(self, width_pt, height_pt, num_attempts=None,
+                         max_workers=None, return_renders=True):
+        """
+        (Internal) solve the sizes of the plotnine objects (correcting the
+        global size if needed)
+
+        Arguments
+        ---------
+        width_pt : float
+            desired width of svg object in points
+        height_pt : float
+            desired height of svg object in points
+        num_attempts : int
+            number of attempts to correct the global size (see
+            ``cow.rcParams``). Each retry starts the size solver of each
+            plotnine object from its previous solution (see
+            ``_svg_warm_starts``)
+        max_workers : int
+            maximum number of worker processes to solve the sizes of the
+            plotnine objects (see ``_svg_get_sizes``)
+        return_renders : boolean
+            logic if the plotnine objects should also be rendered with their
+            solved sizes (see ``_svg_get_sizes``)
+
+        Returns
+        -------
+        sizes : nested list
+            sizes of plotnine objects (see ``_svg_get_sizes``)
+        renders : nested list
+            svg objects rendered at ``sizes`` (None if ``return_renders`` is
+            False)
+        width_pt : float
+            corrected width of svg object in points
+        height_pt : float
+            corrected height of svg object in points
+        """
+        if num_attempts is None:
+            num_attempts = rcParams["num_attempts"]
+
+        renders = None
+        warm_starts = None
+        while num_attempts > 0:
+            out = self._svg_get_sizes(width_pt=width_pt,
+                                      height_pt=height_pt,
+                                      return_renders=return_renders,
+                                      max_workers=max_workers,
+                                      _warm_starts=warm_starts)
+            sizes, logics = out[0], out[1]
+            if return_renders:
+                renders = out[2]
+            out_info = self._process_sizes(sizes, logics)
+
+            if type(out_info) is list:
+                num_attempts = -412 # strictly less than 0
+            else: # out_info is a scaling
+                # retries start from the current solutions
+                warm_starts = self._svg_warm_starts(width_pt=width_pt,
+                                                    height_pt=height_pt,
+                                                    sizes=sizes,
+                                                    logics=logics)
+                width_pt = width_pt*out_info
+                height_pt = height_pt*out_info
+
+            num_attempts -= 1
+
+        if num_attempts == 0:
+            raise StopIteration("Attempts to find the correct sizing of inner"+
+                        "plots failed with provided parameters")
+
+        return sizes, renders, width_pt, height_pt
+
+    def _svg_leaf(self, p_idx, size, render=None, _u_idx=None,
+                  rasterize=False, raster_dpi=96):
+        """
+        (Internal) svg object of a plotnine object in the patch
+
+        Arguments
+        ---------
+        p_idx : int
+            index of the plotnine object in the patch's grobs
+        size : tuple
+            width and height (in inches) to request from the plotnine object
+            (see ``_svg_get_sizes``)
+        render : svgutils.transforms object
+            svg object already rendered at ``size`` (if None, it is rendered)
+        _u_idx : str
+            string addition for the svg object's ids
+        rasterize : boolean
+            logic if the data layers of the plotnine object should be
+            rasterized (if True, ``render`` is ignored)
+        raster_dpi : int
+            dots per inch of the rasterized data layers
+
+        Returns
+        -------
+        svg_object : ``svgutils.transforms`` object
+        """
+        if render is None or rasterize:
+            render = self._svg_leaf_render(p_idx, size,
+                                           rasterize = rasterize,
+                                           raster_dpi = raster_dpi)
+        return _uniquify_svg_safe(render, _u_idx)
+
+    def _svg_leaf_render(self, p_idx, size, rasterize=False, raster_dpi=96):
+        """
+        (Internal) render a plotnine object in the patch (see ``_svg_leaf``)
+
+        Arguments
+        ---------
+        p_idx : int
+            index of the plotnine object in the patch's grobs
+        size : tuple
+            width and height (in inches) to request from the plotnine object
+        rasterize : boolean
+            logic if the data layers of the plotnine object should be
+            rasterized
+        raster_dpi : int
+            dots per inch of the rasterized data layers
+
+        Returns
+        -------
+        svg_object : ``svgutils.transforms`` object
+
+        Notes
+        -----
+        Renders are reused across calls if the plotnine object's content and
+        size haven't changed (see ``cache._cached_gg_to_svg``).
+        """
+        return _cached_gg_to_svg(self.grobs[p_idx], size,
+                                 rasterize = rasterize,
+                                 raster_dpi = raster_dpi)
+
+    def _svg_rasterize_logics(self, rasterize=None):
+        """
+        (Internal) logics if the data layers of each plotnine object should be
+        rasterized
+
+        Arguments
+        ---------
+        rasterize : boolean or nested list
+            if True (False), all plotnine objects are (not) rasterized. If
+            None, plotnine objects are rasterized if their number of data
+            elements is greater than rcParams's ``rasterize_threshold``. This
+            can also be a (nested) list with the structure of the patch's
+            grobs with a value (True, False or None) for each plotnine object,
+            which overrides the threshold for specific plotnine objects.
+
+        Returns
+        -------
+        rasterize : nested list
+            For each element in the patch (with nesting structure in the list),
+            this contains a boolean value if the plotnine object should be
+            rasterized.
+        """
+        logics = []
+        for p_idx in np.arange(len(self.grobs)):
+            inner_rasterize = rasterize[p_idx] if type(rasterize) is list \
+                                else rasterize
+            if inherits(self.grobs[p_idx], patch):
+                logics.append(
+                    self.grobs[p_idx]._svg_rasterize_logics(inner_rasterize))
+            elif inherits_plotnine(self.grobs[p_idx]):
+                if inner_rasterize is None:
+                    threshold = rcParams["rasterize_threshold"]
+                    inner_rasterize = threshold is not None and \
+                        _gg_num_elements(
+                            _cached_build_gg(self.grobs[p_idx])) > threshold
+                logics.append(bool(inner_rasterize))
+            else:
+                raise ValueError("grob idx %i is not a patch object nor"+
+                                 "a ggplot object" % p_idx)
+        return logics
+
+    def _svg_stream(self, fid, width_pt, height_pt, sizes, rasterize=None,
+                    raster_dpi=96, minify=False):
+        """
+        (Internal) write the svg representation of the patch into a file,
+        one plotnine object at a time
+
+        Arguments
+        ---------
+        fid : str or file object
+            file name or binary file object (e.g. ``io.BytesIO``) to write to
+        width_pt : float
+            width of svg object in points
+        height_pt : float
+            height of svg object in points
+        sizes : nested list
+            solved sizes of plotnine objects (see ``_svg_solve_sizes``)
+        rasterize : boolean or nested list
+            logic if the data layers of the plotnine objects should be
+            rasterized (see ``_svg_rasterize_logics``)
+        raster_dpi : int
+            dots per inch of the rasterized data layers
+        minify : boolean
+            logic if each plotnine object's svg should be minified before it
+            is written (see ``_minify_svg``, with rcParams's
+            ``minify_precision``)
+
+        Returns
+        -------
+        None
+            writes to ``fid``
+
+        Notes
+        -----
+        This creates the same svg as ``_svg`` (up to whitespace) but each
+        plotnine object is rendered, positioned and serialized before the
+        next one is rendered (so only one plotnine object's svg tree is in
+        memory at a time). Shared definitions (see ``_dedup_svg_defs``) stay
+        where they first appear instead of being moved to the top.
+        """
+        with etree.xmlfile(fid, encoding="ASCII") as xf:
+            xf.write_declaration(standalone=True)
+            with xf.element(sg.SVG + "svg",
+                            {"version": "1.1",
+                             "width": str(width_pt)+"pt",
+                             "height": str(height_pt)+"pt",
+                             "viewBox": "0 0 %s %s" % (str(width_pt),
+                                                       str(height_pt))},
+                            nsmap=sg.NSMAP):
+                self._svg_stream_elements(xf, width_pt=width_pt,
+                                          height_pt=height_pt,
+                                          sizes=sizes,
+                                          rasterize=rasterize,
+                                          raster_dpi=raster_dpi,
+                                          _seen_defs=dict(),
+                                          _short_ids=dict() if minify \
+                                            else None)
+
+    def _svg_stream_elements(self, xf, width_pt, height_pt, sizes,
+                             rasterize=None, raster_dpi=96, _u_idx=None,
+                             _seen_defs=None, _short_ids=None):
+        """
+        (Internal) write the svg elements of the patch (see ``_svg_stream``)
+
+        Arguments
+        ---------
+        xf : lxml.etree.xmlfile
+            incremental xml writer
+        width_pt : float
+            width of the patch in points
+        height_pt : float
+            height of the patch in points
+        sizes : nested list
+            solved sizes of plotnine objects (see ``_svg_solve_sizes``)
+        rasterize : boolean or nested list
+            logic if the data layers of the plotnine objects should be
+            rasterized (see ``_svg_rasterize_logics``)
+        raster_dpi : int
+            dots per inch of the rasterized data layers
+        _u_idx : str
+            string addition for the svg elements' ids (see ``_svg``)
+        _seen_defs : dict
+            definitions already written (see ``_dedup_svg_defs``), if None,
+            definitions are not shared across plotnine objects
+        _short_ids : dict
+            short ids already written (see ``_minify_svg``), if None, the
+            plotnine objects' svgs are not minified
+        """
+        self._check_layout()
+
+        if _u_idx is None:
+            _u_idx = str(self.__hash__())
+
+        rasterize = self._svg_rasterize_logics(rasterize)
+
+        areas = self.layout._element_locations(width_pt=width_pt,
+                                               height_pt=height_pt,
+                                               num_grobs=len(self.grobs))
+
+        xf.write(
+            sg.fromstring("<rect width=\"100%\" height=\"100%\" fill=\"#FFFFFF\"/>").root)
+
+        for p_idx in np.arange(len(self.grobs)):
+            inner_area = areas[p_idx]
+            inner_u_idx = _u_idx + "_" + str(p_idx)
+
+            if inherits(self.grobs[p_idx], patch):
+                # same transform as svgutils's moveto
+                with xf.element(sg.SVG + "g",
+                                {"transform": "translate(%s, %s) scale(1 1) " %
+                                    (inner_area.x_left, inner_area.y_top)}):
+                    self.grobs[p_idx]._svg_stream_elements(xf,
+                                        width_pt = inner_area.width,
+                                        height_pt = inner_area.height,
+                                        sizes = sizes[p_idx],
+                                        rasterize = rasterize[p_idx],
+                                        raster_dpi = raster_dpi,
+                                        _u_idx = inner_u_idx,
+                                        _seen_defs = _seen_defs,
+                                        _short_ids = _short_ids)
+            elif inherits_plotnine(self.grobs[p_idx]):
+                inner_root = self._svg_leaf(p_idx,
+                                            size = sizes[p_idx],
+                                            _u_idx = inner_u_idx,
+                                            rasterize = rasterize[p_idx],
+                                            raster_dpi = raster_dpi
+                                            ).getroot()
+                if _seen_defs is not None and rcParams["svg_dedup_defs"]:
+                    # (kept definitions stay in previously written objects)
+                    _dedup_svg_defs(inner_root, seen_defs = _seen_defs,
+                                    to_top = False)
+                if _short_ids is not None:
+                    _minify_svg(inner_root,
+                                precision = rcParams["minify_precision"],
+                                short_ids = _short_ids)
+                inner_root.moveto(x=inner_area.x_left,
+                                  y=inner_area.y_top)
+                # (svgutils's group element has no namespace map)
+                inner_element = etree.Element(sg.SVG + "g",
+                                              dict(inner_root.root.attrib),
+                                              nsmap=sg.NSMAP)
+                inner_element.extend(list(inner_root.root))
+                xf.write(inner_element)
+                del inner_root # release the plotnine object's svg tree
+            else:
+                raise ValueError("grob idx %i is not a patch object nor"+
+                                 "a ggplot object within patch with hash %i" % p_idx, self.__hash__())
+
+    def _raster(self, width_pt, height_pt, dpi, num_attempts=None,
+                max_workers=None):
+        """
+        Internal function to create a raster image of the patch (without
+        creating an svg)
+
+        Arguments
+        ---------
+        width_pt : float
+            desired width of the image in points
+        height_pt : float
+            desired height of the image in points
+        dpi : int
+            dots per inch of the image
+        num_attempts : int
+            number of attempts to correct the global size (see ``_svg``)
+        max_workers : int
+            maximum number of worker processes to solve the sizes of the
+            plotnine objects (see ``_svg_get_sizes``)
+
+        Returns
+        -------
+        image : PIL.Image.Image
+            RGB image of the patch
+        size : tuple
+            corrected width and height of the image in points
+
+        Notes
+        -----
+        Each plotnine object is rendered with matplotlib's Agg renderer at
+        its solved size (the same sizes as ``_svg``) and pasted into the
+        image at its location (see ``_raster_paste``).
+        """
+        self._check_layout()
+
+        sizes, _, width_pt, height_pt = \
+            self._svg_solve_sizes(width_pt=width_pt,
+                                  height_pt=height_pt,
+                                  num_attempts=num_attempts,
+                                  max_workers=max_workers,
+                                  return_renders=False)
+
+        image = Image.new("RGB",
+                          (int(np.round(to_inches(width_pt, "pt") * dpi)),
+                           int(np.round(to_inches(height_pt, "pt") * dpi))),
+                          "#FFFFFF")
+        self._raster_paste(image, width_pt=width_pt, height_pt=height_pt,
+                           sizes=sizes, dpi=dpi)
+
+        return image, (width_pt, height_pt)
+
+    def _raster_paste(self, image, width_pt, height_pt, sizes, dpi,
+                      x_left_pt=0, y_top_pt=0):
+        """
+        (Internal) paste the raster images of the plotnine objects of the
+        patch into an image (see ``_raster``)
+
+        Arguments
+        ---------
+        image : PIL.Image.Image
+            image to paste into (updated in place)
+        width_pt : float
+            width of the patch in points
+        height_pt : float
+            height of the patch in points
+        sizes : nested list
+            solved sizes of plotnine objects (see ``_svg_solve_sizes``)
+        dpi : int
+            dots per inch of the image
+        x_left_pt : float
+            location of the patch's left side in the image (in points)
+        y_top_pt : float
+            location of the patch's top side in the image (in points)
+        """
+        self._check_layout()
+
+        areas = self.layout._element_locations(width_pt=width_pt,
+                                               height_pt=height_pt,
+                                               num_grobs=len(self.grobs))
+
+        for p_idx in np.arange(len(self.grobs)):
+            inner_area = areas[p_idx]
+            inner_x_left_pt = x_left_pt + inner_area.x_left
+            inner_y_top_pt = y_top_pt + inner_area.y_top
+
+            if inherits(self.grobs[p_idx], patch):
+                self.grobs[p_idx]._raster_paste(image,
+                                                width_pt = inner_area.width,
+                                                height_pt = inner_area.height,
+                                                sizes = sizes[p_idx],
+                                                dpi = dpi,
+                                                x_left_pt = inner_x_left_pt,
+                                                y_top_pt = inner_y_top_pt)
+            elif inherits_plotnine(self.grobs[p_idx]):
+                inner_gg_width_in, inner_gg_height_in = sizes[p_idx]
+                inner_image = _raw_gg_to_image(
+                                    _cached_build_gg(self.grobs[p_idx]),
+                                    width = inner_gg_width_in,
+                                    height = inner_gg_height_in,
+                                    dpi = 96,
+                                    raster_dpi = dpi)
+                image.paste(inner_image,
+                            (int(np.round(to_inches(inner_x_left_pt, "pt") *
+                                          dpi)),
+                             int(np.round(to_inches(inner_y_top_pt, "pt") *
+                                          dpi))),
+                            mask = inner_image)
+            else:
+                raise ValueError("grob idx %i is not a patch object nor"+
+                                 "a ggplot object within patch with hash %i" % p_idx, self.__hash__())
+
     def _size_dive(self, parents_areas=None):
         """
         (Internal) calculate a suggested overall size that ensures a minimum
@@ -431,7 +898,8 @@ class patch:
                 width = _width / _height * height
         return width, height
 
-    def _svg_get_sizes(self, width_pt, height_pt):
+    def _svg_get_sizes(self, width_pt, height_pt, return_renders=False,
+                       max_workers=None, _requests=None, _warm_starts=None):
         """
         (Internal) Calculates required sizes for plot objects to meet required
         sizes and logics if the requested sizing was possible
@@ -442,6 +910,18 @@ class patch:
             overall width of the image in points
         height_pt : float
             overall height of the image in points
+        return_renders : boolean
+            logic if the svg objects rendered while sizing the plotnine
+            objects should also be returned (if False, the plotnine objects
+            are only sized, not rendered)
+        max_workers : int
+            maximum number of worker processes to solve (and render) the
+            plotnine objects in parallel. If None, rcParams's ``max_workers``
+            is used. A value of 1 solves the plotnine objects in serial.
+        _warm_starts : nested list
+            optional (requested, obtained) sizes of a previous solve of each
+            plotnine object (see ``_svg_warm_starts``), used as starting
+            points of the size solver
 
         Returns
         -------
@@ -458,13 +938,55 @@ class patch:
             For each element in the patch (with nesting structure in the list),
             this contains a boolean value if the ggplot object was able to
             be correctly size.
+        renders : nested list
+            Only returned if ``return_renders`` is True. For each element in
+            the patch (with nesting structure in the list), this contains the
+            svg object of the ggplot rendered with the size in ``sizes`` (or
+            None if it wasn't rendered / correctly sized).
 
         Notes
         -----
-        Internally this function uses rcParams's ``eps``, ``mini_size_px`` and
-        ``maxIter`` to determine the parameters to be put in
-        .svg_utils._select_correcting_size_svg.
+        Internally this function uses rcParams's ``eps``, ``mini_size_px``,
+        ``maxIter``, ``size_solver`` and ``size_solver_reuse_figure`` to
+        determine the parameters to be put in
+        .svg_utils._select_correcting_size_svg. Solved sizes are memoized
+        (see ``cow.size_cache_info``), bounded by rcParams's
+        ``size_cache_maxsize``.
+
+        If ``max_workers`` is greater than 1, the size requests of all
+        plotnine objects (including those of nested patches) are first
+        collected and then solved in a process pool (see
+        .cache._parallel_cached_select_correcting_size_svg). The output is
+        the same as the serial approach.
         """
+        if max_workers is None:
+            max_workers = rcParams["max_workers"]
+
+        # collect plotnine size requests (top layer)
+        # ------------------------------------------
+        if _requests is None and max_workers > 1:
+            requests = []
+            sizes, logics, renders = \
+                self._svg_get_sizes(width_pt=width_pt,
+                                    height_pt=height_pt,
+                                    return_renders=True,
+                                    _requests=requests,
+                                    _warm_starts=_warm_starts)
+
+            outputs = _parallel_cached_select_correcting_size_svg(
+                                [request for request, _, _ in requests],
+                                max_workers=max_workers,
+                                return_svg=return_renders)
+            for (_, out_lists, out_idx), out in zip(requests, outputs):
+                for out_list, value in zip(out_lists,
+                                           [out[:2], out[2], out[3]]):
+                    out_list[out_idx] = value
+
+            if return_renders:
+                return sizes, logics, renders
+
+            return sizes, logics
+
         layout = self.layout
 
         areas = layout._element_locations(width_pt=width_pt,
@@ -473,42 +995,126 @@ class patch:
 
         sizes = []
         logics = []
+        renders = []
 
         for p_idx in np.arange(len(self.grobs)):
             inner_area = areas[p_idx]
 
             inner_width_pt = inner_area.width
             inner_height_pt = inner_area.height
+            inner_warm_starts = None if _warm_starts is None \
+                                    else _warm_starts[p_idx]
 
             # TODO: how to deal with ggplot objects vs patch objects
             if inherits(self.grobs[p_idx], patch):
-                inner_sizes_list, logic_list = \
+                inner_out = \
                     self.grobs[p_idx]._svg_get_sizes(width_pt = inner_width_pt,
-                                                 height_pt = inner_height_pt)
-                sizes.append(inner_sizes_list)
-                logics.append(logic_list)
+                                                 height_pt = inner_height_pt,
+                                                 return_renders = \
+                                                    return_renders or
+                                                    _requests is not None,
+                                                 max_workers = max_workers,
+                                                 _requests = _requests,
+                                                 _warm_starts = inner_warm_starts)
+                sizes.append(inner_out[0])
+                logics.append(inner_out[1])
+                renders.append(inner_out[2] if len(inner_out) == 3 else None)
             elif inherits_plotnine(self.grobs[p_idx]):
-                inner_w, inner_h, inner_logic = \
-                    _select_correcting_size_svg(self.grobs[p_idx],
-                                      width=to_inches(inner_width_pt,
-                                                        units="pt",
-                                                        dpi=96),
-                                      height=to_inches(inner_height_pt,
-                                                        units="pt",
-                                                        dpi=96),
-                                      dpi=96,
-                                      eps=rcParams["eps"],
-                                      min_size_px=rcParams["min_size_px"],
-                                      maxIter=rcParams["maxIter"],
-                                      throw_error=False)
-                sizes.append((inner_w,inner_h))
-                logics.append(inner_logic)
+                request = dict(gg=self.grobs[p_idx],
+                               width=to_inches(inner_width_pt,
+                                               units="pt",
+                                               dpi=96),
+                               height=to_inches(inner_height_pt,
+                                                units="pt",
+                                                dpi=96),
+                               dpi=96,
+                               limitsize=True,
+                               eps=rcParams["eps"],
+                               min_size_px=rcParams["min_size_px"],
+                               maxIter=rcParams["maxIter"],
+                               method=rcParams["size_solver"],
+                               reuse_figure=rcParams[
+                                "size_solver_reuse_figure"],
+                               warm_start=inner_warm_starts)
+
+                if _requests is not None:
+                    # solved later (in parallel), see top layer
+                    _requests.append((request, (sizes, logics, renders),
+                                      len(sizes)))
+                    sizes.append(None)
+                    logics.append(None)
+                    renders.append(None)
+                    continue
+
+                inner_out = \
+                    _cached_select_correcting_size_svg(**request,
+                                                 return_svg=return_renders)
+                sizes.append(tuple(inner_out[:2]))
+                logics.append(inner_out[2])
+                renders.append(inner_out[3] if return_renders else None)
             else:
                 raise ValueError("grob idx %i is not a patch object nor"+
                                  "a ggplot object" % p_idx)
 
+        if return_renders:
+            return sizes, logics, renders
+
         return sizes, logics
 
+    def _svg_warm_starts(self, width_pt, height_pt, sizes, logics):
+        """
+        (Internal) collect the (requested, obtained) sizes of each plotnine
+        object from the output of _svg_get_sizes (to warm start a later
+        call with a rescaled width and height)
+
+        Arguments
+        ---------
+        width_pt : float
+            overall width of the image in points (passed to _svg_get_sizes)
+        height_pt : float
+            overall height of the image in points (passed to _svg_get_sizes)
+        sizes : nested list
+            sizes output of _svg_get_sizes
+        logics : nested list
+            logics output of _svg_get_sizes
+
+        Returns
+        -------
+        warm_starts : nested list
+            For each element in the patch (with nesting structure in the list),
+            a tuple of the requested (solved) (width, height) and the obtained
+            (desired) (width, height) in inches for ggplot objects that were
+            correctly sized, and None for the others (which are solved from
+            scratch).
+        """
+        areas = self.layout._element_locations(width_pt=width_pt,
+                                               height_pt=height_pt,
+                                               num_grobs=len(self.grobs))
+
+        warm_starts = []
+        for p_idx in np.arange(len(self.grobs)):
+            inner_area = areas[p_idx]
+
+            if inherits(self.grobs[p_idx], patch):
+                warm_starts.append(
+                    self.grobs[p_idx]._svg_warm_starts(
+                                            width_pt=inner_area.width,
+                                            height_pt=inner_area.height,
+                                            sizes=sizes[p_idx],
+                                            logics=logics[p_idx]))
+                continue
+
+            if logics[p_idx]:
+                desired = (to_inches(inner_area.width, units="pt", dpi=96),
+                           to_inches(inner_area.height, units="pt", dpi=96))
+                warm_starts.append((tuple(sizes[p_idx]), desired))
+            else:
+                # the obtained size was dominated by fixed decorations (e.g.
+                # legends), which doesn't predict the rescaled solution
+                warm_starts.append(None)
+
+        return warm_starts
+
     def _process_sizes(self, sizes, logics):
         """
         (Internal) draw conclusions about the output of _svg_get_sizes.
@@ -558,15 +1164,19 @@ class patch:
         return max_scaling
 
     def save(self, filename, width=None, height=None, dpi=96, _format=None,
-             verbose=None):
+             verbose=None, max_workers=None, stream=None, rasterize=None,
+             minify=None, raster_backend=None, quality=None,
+             subsampling=None, tile_rows=None):
         """
         save patch to file
 
         Arguments
         ---------
-        filename : str
+        filename : str or list
             local string to save the file to (this can also be at a
-            ``io.BytesIO``)
+            ``io.BytesIO``). This can also be a list of file names (e.g.
+            ``["fig.pdf", "fig.png", "fig.svg"]``), in which case the patch is
+            composed once and saved in each file's format.
         width : float
             width of output image in inches (this should actually be associated
             with the svg...)
@@ -578,11 +1188,70 @@ class patch:
         _format : str
             string of format (error tells options). If provided this is the
             format used, if None, then we'll try to use the ``filename``
-            extension.
+            extension. This includes ``"svgz"`` (gzip compressed svg),
+            ``"webp"`` and ``"tiff"``. If
+            ``filename`` is a list, this can be a list with a format (or None)
+            for each file.
         verbose : bool
             If ``True``, print the saving information. The package default
             is defined by cowpatch's own rcParams (the base default is
             ``True``), which is used if verbose is ``None``. See Notes.
+        max_workers : int
+            maximum number of worker processes used to size and render the
+            plotnine objects in parallel (and of threads used to convert the
+            svg into multiple pdf, ps, eps or raster files). The package
+            default is defined by cowpatch's own rcParams (the base default
+            is ``1``, no parallel processing), which is used if max_workers
+            is ``None``.
+        stream : bool
+            If ``True``, each plotnine object is rendered and written to the
+            file before the next one is rendered (after all sizes are
+            solved), instead of composing the full svg object in memory. The
+            package default is defined by cowpatch's own rcParams (the base
+            default is ``False``), which is used if stream is ``None``.
+        rasterize : bool or list
+            If ``True``, the data layers (e.g. points, lines, bars) of each
+            plotnine object are embedded as an image with resolution ``dpi``
+            (axes, text and legends stay vector graphics). If ``None``,
+            plotnine objects are rasterized when their number of data
+            elements is greater than cowpatch's rcParams
+            ``rasterize_threshold`` (the base default is ``None``, no
+            rasterization). A (nested) list with the structure of the patch's
+            grobs defines this (``True``, ``False`` or ``None``) per plotnine
+            object.
+        minify : bool
+            If ``True``, coordinates are rounded (to cowpatch's rcParams
+            ``minify_precision`` decimals), metadata and whitespace are
+            removed and ids are shortened before saving. The package default
+            is defined by cowpatch's own rcParams (the base default is
+            ``False``), which is used if minify is ``None``. The number of
+            bytes saved is included in the saving information (if
+            ``verbose``, except with ``stream``).
+        raster_backend : str
+            approach to create raster (png, jpeg, webp and tiff) files.
+            ``"svg"`` converts the composed svg (with cairosvg), ``"agg"``
+            renders each plotnine object with matplotlib's Agg renderer and
+            pastes the images into a single image (see ``_raster``), which is
+            much faster for dense plots. The package default is defined by cowpatch's own rcParams
+            (the base default is ``"svg"``), which is used if raster_backend
+            is ``None``. Both backends encode jpeg, webp and tiff files
+            directly from the rendered pixels.
+        quality : int
+            quality of jpeg (1 to 95) and webp (1 to 100) files. If ``None``,
+            PIL's default (``75``) is used.
+        subsampling : int or str
+            chroma subsampling of jpeg files (``"4:4:4"``, ``"4:2:2"`` or
+            ``"4:2:0"``). ``"4:4:4"`` keeps thin colored lines and text sharp.
+            If ``None``, PIL's default (``"4:2:0"``) is used.
+        tile_rows : int
+            If not ``None``, png and tiff files are rasterized (from the
+            svg) in tiles of ``tile_rows`` pixel rows that are written to
+            the file one at a time, so that memory use is bounded by the
+            tile size (e.g. for posters at high dpi). Tiles are rendered in
+            parallel with up to ``max_workers`` worker processes. The
+            package default is defined by cowpatch's own rcParams (the base
+            default is ``None``, no tiles), which is used if tile_rows is
+            ``None``. This doesn't apply to the ``"agg"`` raster_backend.
 
         Returns
         -------
@@ -598,6 +1267,11 @@ class patch:
         ``verbose`` input parameter or changing
         ``cow.rcParams["save_verbose"]``.
 
+        If ``cow.rcParams["output_cache_dir"]`` is not None, saved files are
+        stored in that directory and later saves of the same patch (with the
+        same arguments) copy them instead of rendering (see
+        ``_save_output_cached``).
+
         See also
         --------
         io.BytesIO : object that acts like a reading in of bytes
@@ -609,9 +1283,89 @@ class patch:
         if verbose is None:
             verbose = rcParams["save_verbose"]
 
-        svg_obj, (actual_width_pt, actual_height_pt) = \
-            self._svg(width_pt = from_inches(width, "pt", dpi=dpi),
-                            height_pt = from_inches(height, "pt", dpi=dpi))
+        if stream is None:
+            stream = rcParams["save_stream"]
+
+        if minify is None:
+            minify = rcParams["save_minify"]
+
+        if raster_backend is None:
+            raster_backend = rcParams["raster_backend"]
+
+        if tile_rows is None:
+            tile_rows = rcParams["raster_tile_rows"]
+
+        if rcParams["output_cache_dir"] is not None:
+            return self._save_output_cached(filename, width=width,
+                                            height=height, dpi=dpi,
+                                            _format=_format, verbose=verbose,
+                                            max_workers=max_workers,
+                                            stream=stream,
+                                            rasterize=rasterize,
+                                            minify=minify,
+                                            raster_backend=raster_backend,
+                                            quality=quality,
+                                            subsampling=subsampling,
+                                            tile_rows=tile_rows)
+
+        # raster files without the svg
+        if raster_backend == "agg":
+            filenames = filename if type(filename) is list else [filename]
+            if type(_format) is list and len(_format) != len(filenames):
+                raise ValueError("_format must have a format for each file "+\
+                                 "name")
+            formats = _format if type(_format) is list \
+                        else [_format] * len(filenames)
+            formats = [_file_format(f, _format=inner_format)
+                            for f, inner_format in zip(filenames, formats)]
+            is_raster = [f in _raster_file_options for f in formats]
+
+            if np.any(is_raster):
+                image, (actual_width_pt, actual_height_pt) = \
+                    self._raster(width_pt = from_inches(width, "pt", dpi=dpi),
+                                 height_pt = from_inches(height, "pt", dpi=dpi),
+                                 dpi = dpi,
+                                 max_workers = max_workers)
+                _save_image_wrapper(image,
+                    filename=[f for f, r in zip(filenames, is_raster) if r],
+                    width=to_inches(actual_width_pt, "pt", dpi=dpi),
+                    height=to_inches(actual_height_pt, "pt", dpi=dpi),
+                    dpi=dpi,
+                    _format=[f for f, r in zip(formats, is_raster) if r],
+                    verbose=verbose,
+                    quality=quality,
+                    subsampling=subsampling)
+
+                if np.all(is_raster):
+                    return None
+
+                filename = [f for f, r in zip(filenames, is_raster) if not r]
+                _format = [f for f, r in zip(formats, is_raster) if not r]
+        elif raster_backend != "svg":
+            raise ValueError("raster_backend must be \"svg\" or \"agg\"")
+
+        if stream:
+            sizes, _, actual_width_pt, actual_height_pt = \
+                self._svg_solve_sizes(
+                            width_pt = from_inches(width, "pt", dpi=dpi),
+                            height_pt = from_inches(height, "pt", dpi=dpi),
+                            max_workers = max_workers,
+                            return_renders = False)
+
+            svg_obj = lambda fid: self._svg_stream(fid,
+                                                   width_pt = actual_width_pt,
+                                                   height_pt = actual_height_pt,
+                                                   sizes = sizes,
+                                                   rasterize = rasterize,
+                                                   raster_dpi = dpi,
+                                                   minify = minify)
+        else:
+            svg_obj, (actual_width_pt, actual_height_pt) = \
+                self._svg(width_pt = from_inches(width, "pt", dpi=dpi),
+                                height_pt = from_inches(height, "pt", dpi=dpi),
+                                max_workers = max_workers,
+                                rasterize = rasterize,
+                                raster_dpi = dpi)
 
         _save_svg_wrapper(svg_obj,
                            filename=filename,
@@ -619,9 +1373,171 @@ class patch:
                            height=to_inches(actual_height_pt, "pt", dpi=dpi),
                            dpi=dpi,
                            _format=_format,
-                           verbose=verbose)
+                           verbose=verbose,
+                           minify=minify,
+                           precision=rcParams["minify_precision"],
+                           max_workers=max_workers,
+                           quality=quality,
+                           subsampling=subsampling,
+                           tile_rows=tile_rows)
+
+    def _save_output_cached(self, filename, width, height, dpi, _format,
+                            verbose, max_workers, **options):
+        """
+        (Internal) save patch to file(s), copying the files from the output
+        cache if they are stored (see ``save`` for the arguments)
 
-    def show(self, width=None, height=None, dpi=96, verbose=None):
+        Arguments
+        ---------
+        **options
+            other arguments of ``save`` (that change the saved files)
+
+        Notes
+        -----
+        Files are stored w.r.t. a fingerprint of the patch (see
+        ``cache._patch_fingerprint``), the requested size, dpi, format, the
+        other arguments and cowpatch's rcParams. The files are only copied
+        if all of the requested files are stored. Files are stored after
+        they are saved if they are local files (or ``io.BytesIO`` objects).
+        """
+        keys = _output_cache_keys(self, filename, width=width, height=height,
+                                  dpi=dpi, _format=_format, options=options)
+        filenames = filename if type(filename) is list else [filename]
+
+        values = _output_cache_get(keys)
+        if values is not None:
+            if verbose:
+                warnings.warn("Saving {0:,.2g} x {1:,.2g} inch image ".format(
+                    width, height) + "(from the output cache).",
+                    CowpatchWarning)
+            for f, value in zip(filenames, values):
+                if hasattr(f, "write"):
+                    f.write(value)
+                else:
+                    with open(f, "wb") as fid:
+                        fid.write(value)
+            return None
+
+        starts = [f.tell() if hasattr(f, "getvalue") else None
+                    for f in filenames]
+
+        with _rcParams_context({"output_cache_dir": None}):
+            self.save(filename, width=width, height=height, dpi=dpi,
+                      _format=_format, verbose=verbose,
+                      max_workers=max_workers, **options)
+
+        for f, start, key in zip(filenames, starts, keys):
+            if type(f) is str:
+                with open(f, "rb") as fid:
+                    value = fid.read()
+            elif start is not None:
+                value = f.getvalue()[start:]
+            else:
+                continue
+            _output_cache_put(key, value)
+
+    def to_bytes(self, format="png", width=None, height=None, dpi=96,
+                 **kwargs):
+        """
+        render patch into the bytes of a file (without a file)
+
+        Arguments
+        ---------
+        format : str
+            format of the file (one of the formats of ``save``, e.g.
+            ``"png"``, ``"svg"`` or ``"pdf"``). ``"rgba"`` returns the raw
+            pixels of the image instead of an encoded file.
+        width : float
+            width of output image in inches
+        height : float
+            height of output image in inches
+        dpi : int or float
+            dots per square inch, default is 96 (standard)
+        **kwargs
+            additional arguments of ``save`` (e.g. ``raster_backend`` or
+            ``minify``). For ``"rgba"``, only ``max_workers``,
+            ``rasterize`` and ``raster_backend`` apply.
+
+        Returns
+        -------
+        bytes or memoryview
+            content of the file. For ``"rgba"``, a memoryview of the pixels
+            with shape ``(height_px, width_px, 4)``.
+
+        See also
+        --------
+        save : save patch to file
+        arender_bytes : render the patch into bytes (asynchronously)
+        """
+        if format.lower() == "rgba":
+            image = self._image(width=width, height=height, dpi=dpi,
+                                **kwargs)
+            return memoryview(image.tobytes()).cast("B",
+                                    shape=(image.size[1], image.size[0], 4))
+
+        kwargs.setdefault("verbose", False)
+        fid = io.BytesIO()
+        self.save(fid, width=width, height=height, dpi=dpi, _format=format,
+                  **kwargs)
+        return fid.getvalue()
+
+    def _image(self, width=None, height=None, dpi=96, max_workers=None,
+               rasterize=None, raster_backend=None):
+        """
+        (Internal) raster image of the patch
+
+        Arguments
+        ---------
+        width : float
+            width of output image in inches
+        height : float
+            height of output image in inches
+        dpi : int or float
+            dots per square inch
+        max_workers : int
+            maximum number of worker processes used to size and render the
+            plotnine objects in parallel (see ``save``)
+        rasterize : bool or list
+            logic if the data layers of the plotnine objects should be
+            rasterized (see ``save``, only for the ``"svg"`` raster_backend)
+        raster_backend : str
+            approach to create the image (see ``save``)
+
+        Returns
+        -------
+        PIL.Image.Image
+            RGBA image
+        """
+        width, height = self._default_size(width=width,height=height)
+
+        if raster_backend is None:
+            raster_backend = rcParams["raster_backend"]
+
+        if raster_backend == "agg":
+            image, _ = self._raster(width_pt = from_inches(width, "pt",
+                                                           dpi=dpi),
+                                    height_pt = from_inches(height, "pt",
+                                                            dpi=dpi),
+                                    dpi = dpi,
+                                    max_workers = max_workers)
+        elif raster_backend == "svg":
+            svg_obj, (actual_width_pt, actual_height_pt) = \
+                self._svg(width_pt = from_inches(width, "pt", dpi=dpi),
+                          height_pt = from_inches(height, "pt", dpi=dpi),
+                          max_workers = max_workers,
+                          rasterize = rasterize,
+                          raster_dpi = dpi)
+            image = _svg_bytes_to_image(svg_obj.to_str(),
+                            width=to_inches(actual_width_pt, "pt", dpi=dpi),
+                            height=to_inches(actual_height_pt, "pt", dpi=dpi),
+                            dpi=dpi)
+        else:
+            raise ValueError("raster_backend must be \"svg\" or \"agg\"")
+
+        return image.convert("RGBA")
+
+    def show(self, width=None, height=None, dpi=96, verbose=None,
+             max_workers=None, rasterize=None):
         """
         display object from the command line or in a jupyter notebook
 
@@ -639,6 +1555,21 @@ class patch:
             If ``True``, print the saving information. The package default
             is defined by cowpatch's own rcParams (the base default is
             ``True``), which is used if verbose is ``None``. See Notes.
+        max_workers : int
+            maximum number of worker processes used to size and render the
+            plotnine objects in parallel. The package default is defined by
+            cowpatch's own rcParams (the base default is ``1``, no parallel
+            processing), which is used if max_workers is ``None``.
+        rasterize : bool or list
+            If ``True``, the data layers (e.g. points, lines, bars) of each
+            plotnine object are embedded as an image with resolution ``dpi``
+            (axes, text and legends stay vector graphics). If ``None``,
+            plotnine objects are rasterized when their number of data
+            elements is greater than cowpatch's rcParams
+            ``rasterize_threshold`` (the base default is ``None``, no
+            rasterization). A (nested) list with the structure of the patch's
+            grobs defines this (``True``, ``False`` or ``None``) per plotnine
+            object.
 
         Notes
         -----
@@ -663,7 +1594,10 @@ class patch:
 
         svg_obj, (actual_width_pt, actual_height_pt) = \
             self._svg(width_pt = from_inches(width, "pt", dpi=dpi),
-                       height_pt = from_inches(height, "pt", dpi=dpi))
+                       height_pt = from_inches(height, "pt", dpi=dpi),
+                       max_workers = max_workers,
+                       rasterize = rasterize,
+                       raster_dpi = dpi)
 
         _show_image(svg_obj,
                     width=to_inches(actual_width_pt, "pt", dpi=dpi),
@@ -671,6 +1605,276 @@ class patch:
                     dpi=dpi,
                     verbose=verbose)
 
+    async def asave(self, filename, width=None, height=None, dpi=96,
+                    _format=None, verbose=None, max_workers=None,
+                    rasterize=None, minify=None, quality=None,
+                    subsampling=None, tile_rows=None, executor=None):
+        """
+        save patch to file (asynchronously)
+
+        Arguments
+        ---------
+        filename : str or list
+            local string to save the file to (this can also be at a
+            ``io.BytesIO``), or a list of them (see ``save``)
+        width : float
+            width of output image in inches
+        height : float
+            height of output image in inches
+        dpi : int or float
+            dots per square inch, default is 96 (standard)
+        _format : str or list
+            string of format (see ``save``)
+        verbose : bool
+            If ``True``, print the saving information (see ``save``)
+        max_workers : int
+            not supported, requests are sized, rendered and rasterized in
+            this process (values greater than 1 are ignored with a warning,
+            see Notes)
+        rasterize : bool or list
+            logic if the data layers of the plotnine objects should be
+            rasterized (see ``save``)
+        minify : bool
+            logic if the svg should be minified (see ``save``)
+        quality : int
+            quality of jpeg and webp files (see ``save``)
+        subsampling : int or str
+            chroma subsampling of jpeg files (see ``save``)
+        tile_rows : int
+            number of pixel rows of tiles to rasterize png and tiff files
+            (see ``save``)
+        executor : concurrent.futures.Executor
+            executor (a thread pool) that runs the cpu bound stages. If
+            ``None``, the event loop's default executor is used.
+
+        Returns
+        -------
+        None
+            saves to a file
+
+        Notes
+        -----
+        The size solving, the rendering of each plotnine object and the
+        conversion to the file's format are run in the executor (one stage
+        at a time), so that the event loop isn't blocked. Cancelling the
+        request stops it before the next stage (e.g. before the next
+        plotnine object is rendered).
+
+        Each request uses a snapshot of cowpatch's rcParams from the start
+        of the request (later changes don't affect it). Stages that draw
+        with matplotlib hold a lock, so that concurrent requests don't
+        interfere through pyplot's figures or matplotlib's rcParams.
+
+        The svg is composed in memory, as with ``raster_backend = "svg"``
+        and ``stream = False``.
+
+        No worker processes are used (neither ``max_workers`` nor
+        ``cow.rcParams``'s ``max_workers`` apply): the stages run in the
+        executor's threads, and a process forked from them could inherit
+        locks held by other threads (e.g. of concurrent requests) and
+        deadlock. Use ``save`` or ``save_all`` to work across processes.
+
+        See also
+        --------
+        save : save patch to file (synchronously)
+        arender_bytes : render the patch into bytes (asynchronously)
+        """
+        params = {key: rcParams[key] for key in rcParams}
+
+        if max_workers is not None and max_workers > 1:
+            warnings.warn("asave doesn't use worker processes, " +\
+                          "max_workers is ignored",
+                          CowpatchWarning)
+        # (processes forked from the executor's threads could deadlock)
+        max_workers = 1
+
+        # updating width and height if necessary (some combine is none)
+        width, height = self._default_size(width=width,height=height)
+
+        if verbose is None:
+            verbose = params["save_verbose"]
+
+        if minify is None:
+            minify = params["save_minify"]
+
+        if tile_rows is None:
+            tile_rows = params["raster_tile_rows"]
+
+        svg_obj, (actual_width_pt, actual_height_pt) = \
+            await self._asvg(width_pt = from_inches(width, "pt", dpi=dpi),
+                             height_pt = from_inches(height, "pt", dpi=dpi),
+                             params = params,
+                             executor = executor,
+                             max_workers = max_workers,
+                             rasterize = rasterize,
+                             raster_dpi = dpi)
+
+        await _run_in_executor(executor, params, _save_svg_wrapper,
+                               svg_obj,
+                               filename=filename,
+                               width=to_inches(actual_width_pt, "pt", dpi=dpi),
+                               height=to_inches(actual_height_pt, "pt",
+                                                dpi=dpi),
+                               dpi=dpi,
+                               _format=_format,
+                               verbose=verbose,
+                               minify=minify,
+                               precision=params["minify_precision"],
+                               max_workers=max_workers,
+                               quality=quality,
+                               subsampling=subsampling,
+                               tile_rows=tile_rows,
+                               use_lock=False)
+
+    async def arender_bytes(self, format="png", width=None, height=None,
+                            dpi=96, **kwargs):
+        """
+        render patch into the bytes of a file (asynchronously)
+
+        Arguments
+        ---------
+        format : str
+            format of the file (see ``save``'s ``_format``)
+        width : float
+            width of output image in inches
+        height : float
+            height of output image in inches
+        dpi : int or float
+            dots per square inch, default is 96 (standard)
+        **kwargs
+            additional arguments of ``asave`` (e.g. ``executor``)
+
+        Returns
+        -------
+        bytes
+            content of the file
+
+        See also
+        --------
+        asave : save patch to file (asynchronously)
+        """
+        kwargs.setdefault("verbose", False)
+        fid = io.BytesIO()
+        await self.asave(fid, width=width, height=height, dpi=dpi,
+                         _format=format, **kwargs)
+        return fid.getvalue()
+
+    async def _asvg(self, width_pt, height_pt, params, executor=None,
+                    max_workers=None, rasterize=None, raster_dpi=96):
+        """
+        (Internal) asynchronous version of ``_svg`` (of the top layer), with
+        each stage run in an executor
+
+        Arguments
+        ---------
+        width_pt : float
+            desired width of svg object in points
+        height_pt : float
+            desired height of svg object in points
+        params : dict
+            snapshot of cowpatch's rcParams (see ``_run_in_executor``)
+        executor : concurrent.futures.Executor
+            executor that runs the stages
+        max_workers : int
+            maximum number of worker processes to solve the sizes of the
+            plotnine objects (see ``_svg_get_sizes``)
+        rasterize : boolean or nested list
+            logic if the data layers of the plotnine objects should be
+            rasterized (see ``_svg_rasterize_logics``)
+        raster_dpi : int
+            dots per inch of the rasterized data layers
+
+        Returns
+        -------
+        svg_object : ``svgutils.transforms`` object
+        tuple
+            (corrected) width and height of svg object in points
+        """
+        self._check_layout()
+
+        rasterize = await _run_in_executor(executor, params,
+                                           self._svg_rasterize_logics,
+                                           rasterize)
+
+        # (plotnine objects are rendered in their own stages, see
+        # _asvg_renders, so that requests can be cancelled between them)
+        sizes, _, width_pt, height_pt = \
+            await _run_in_executor(executor, params, self._svg_solve_sizes,
+                                   width_pt = width_pt,
+                                   height_pt = height_pt,
+                                   max_workers = max_workers,
+                                   return_renders = False)
+
+        renders = await self._asvg_renders(sizes = sizes,
+                                           renders = None,
+                                           rasterize = rasterize,
+                                           raster_dpi = raster_dpi,
+                                           params = params,
+                                           executor = executor)
+
+        def _compose():
+            # (rendered plotnine objects are already rasterized)
+            svg_obj, _ = self._svg(width_pt = width_pt,
+                                   height_pt = height_pt,
+                                   sizes = sizes,
+                                   renders = renders,
+                                   rasterize = False)
+            if rcParams["svg_dedup_defs"]:
+                _dedup_svg_defs(svg_obj)
+            return svg_obj
+
+        svg_obj = await _run_in_executor(executor, params, _compose,
+                                         use_lock=False)
+
+        return svg_obj, (width_pt, height_pt)
+
+    async def _asvg_renders(self, sizes, renders, rasterize, raster_dpi,
+                            params, executor=None):
+        """
+        (Internal) render the plotnine objects of the patch that don't
+        already have a render, one at a time in an executor
+
+        Arguments
+        ---------
+        sizes : nested list
+            sizes of plotnine objects (see ``_svg_get_sizes``)
+        renders : nested list
+            svg objects already rendered at ``sizes`` (or None)
+        rasterize : nested list
+            logic if the data layers of the plotnine objects should be
+            rasterized (see ``_svg_rasterize_logics``)
+        raster_dpi : int
+            dots per inch of the rasterized data layers
+        params : dict
+            snapshot of cowpatch's rcParams (see ``_run_in_executor``)
+        executor : concurrent.futures.Executor
+            executor that runs the rendering
+
+        Returns
+        -------
+        renders : nested list
+            svg objects rendered at ``sizes``
+        """
+        out_renders = []
+        for p_idx in np.arange(len(self.grobs)):
+            inner_render = None if renders is None else renders[p_idx]
+            if inherits(self.grobs[p_idx], patch):
+                inner_render = await self.grobs[p_idx]._asvg_renders(
+                                                sizes = sizes[p_idx],
+                                                renders = inner_render,
+                                                rasterize = rasterize[p_idx],
+                                                raster_dpi = raster_dpi,
+                                                params = params,
+                                                executor = executor)
+            elif inner_render is None or rasterize[p_idx]:
+                inner_render = await _run_in_executor(executor, params,
+                                                self._svg_leaf_render,
+                                                p_idx, sizes[p_idx],
+                                                rasterize = rasterize[p_idx],
+                                                raster_dpi = raster_dpi)
+            out_renders.append(inner_render)
+        return out_renders
+
     def __str__(self):
         self.show()
         return "<patch (%d)>" % self.__hash__()
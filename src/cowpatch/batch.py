@@ -0,0 +1,197 @@
+import time
+import traceback
+import warnings
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import namedtuple
+
+import matplotlib.pyplot as plt
+
+from .config import rcParams
+from .exceptions import CowpatchWarning
+
+SaveResult = namedtuple("SaveResult", ["filename", "seconds", "error"])
+
+# items being saved by a (forked) worker process of save_all (only set in
+# worker processes, see _pool_init_items)
+_pool_items = None
+
+def save_all(items, max_workers=None, verbose=None, progress=None,
+             **kwargs):
+    """
+    save many patches, across a pool of worker processes
+
+    Arguments
+    ---------
+    items : list
+        list of tuples ``(patch, filename)``, ``(patch, filename, width)``
+        or ``(patch, filename, width, height)``, with the arguments of each
+        ``patch.save`` call. With more than one worker, file names should be
+        local strings (not ``io.BytesIO`` objects).
+    max_workers : int
+        maximum number of worker processes saving patches at the same time.
+        The package default is defined by cowpatch's own rcParams (the base
+        default is ``1``, saving in this process), which is used if
+        max_workers is ``None``.
+    verbose : bool
+        If ``True``, the progress (and each failure) is reported. The
+        package default is defined by cowpatch's own rcParams (the base
+        default is ``True``), which is used if verbose is ``None``.
+    progress : function
+        function called (in this process) after each item is saved (or
+        failed), with the number of finished items, the number of items and
+        the item's ``SaveResult``.
+    **kwargs
+        additional arguments of each ``patch.save`` call (e.g. ``dpi`` or
+        ``_format``)
+
+    Returns
+    -------
+    list
+        list of ``SaveResult`` named tuples (in the order of ``items``) with
+        the ``filename``, the number of ``seconds`` the item took and the
+        ``error`` (traceback string, ``None`` if saved)
+
+    Notes
+    -----
+    Failures of individual items don't stop the batch, they are reported in
+    the item's ``SaveResult``.
+
+    Worker processes are forked, so that they start with cowpatch, plotnine
+    and matplotlib already imported and the patches (which can't always be
+    pickled) and ``cow.rcParams`` are shared with them (the items are handed
+    to each worker by the pool's initializer, so that concurrent calls don't
+    share any state). Each worker saves with ``max_workers = 1`` (unless
+    provided in ``kwargs``) and closes pyplot figures after each item. If forking isn't available, the items
+    are saved in this process (with a warning).
+
+    See also
+    --------
+    patch.save : save a single patch
+    """
+    if max_workers is None:
+        max_workers = rcParams["max_workers"]
+
+    if verbose is None:
+        verbose = rcParams["save_verbose"]
+
+    kwargs = dict(kwargs)
+    kwargs["verbose"] = False
+
+    if max_workers > 1 and \
+        "fork" not in multiprocessing.get_all_start_methods():
+        warnings.warn("forked worker processes aren't available on this "+\
+                      "platform, saving in serial",
+                      CowpatchWarning)
+        max_workers = 1
+
+    results = [None] * len(items)
+    num_done = 0
+
+    def _report(i_idx, result):
+        nonlocal num_done
+        results[i_idx] = result
+        num_done += 1
+        if verbose:
+            if result.error is None:
+                warnings.warn("Saved {}/{}: {} ({:.2f} s)".format(num_done,
+                                len(items), result.filename, result.seconds),
+                              CowpatchWarning)
+            else:
+                warnings.warn("Failed {}/{}: {}\n{}".format(num_done,
+                                len(items), result.filename, result.error),
+                              CowpatchWarning)
+        if progress is not None:
+            progress(num_done, len(items), result)
+
+    if max_workers <= 1 or len(items) <= 1:
+        for i_idx, item in enumerate(items):
+            _report(i_idx, _save_item(item, kwargs))
+        return results
+
+    kwargs.setdefault("max_workers", 1)
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(items)),
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=_pool_init_items,
+                initargs=(items,)) as pool:
+        futures = {pool.submit(_pool_save_item, i_idx, kwargs): i_idx
+                    for i_idx in range(len(items))}
+        for future in as_completed(futures):
+            i_idx = futures[future]
+            try:
+                result = future.result()
+            except Exception: # e.g. a worker process was terminated
+                result = SaveResult(filename=_item_filename(items[i_idx]),
+                                    seconds=None,
+                                    error=traceback.format_exc())
+            _report(i_idx, result)
+
+    return results
+
+def _item_filename(item):
+    """
+    (Internal) file name of an item of ``save_all`` (if it is a string)
+    """
+    filename = item[1]
+    if type(filename) is str or type(filename) is list:
+        return filename
+    return None
+
+def _save_item(item, kwargs):
+    """
+    (Internal) save an item of ``save_all``
+
+    Arguments
+    ---------
+    item : tuple
+        ``(patch, filename, width, height)`` (``width`` and ``height`` are
+        optional)
+    kwargs : dict
+        additional arguments of ``patch.save``
+
+    Returns
+    -------
+    SaveResult
+        file name, time and error (traceback string) of the item
+    """
+    start = time.perf_counter()
+    try:
+        patch, filename = item[0], item[1]
+        width = item[2] if len(item) > 2 else None
+        height = item[3] if len(item) > 3 else None
+        patch.save(filename, width=width, height=height, **kwargs)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        plt.close("all")
+
+    return SaveResult(filename=_item_filename(item),
+                      seconds=time.perf_counter() - start,
+                      error=error)
+
+def _pool_init_items(items):
+    """
+    (Internal) worker process initializer of ``save_all``, stores the items
+    in the worker process
+    """
+    global _pool_items
+    _pool_items = items
+
+def _pool_save_item(i_idx, kwargs):
+    """
+    (Internal) worker process function of ``save_all``
+
+    Arguments
+    ---------
+    i_idx : int
+        index of the item in ``_pool_items``
+    kwargs : dict
+        additional arguments of ``patch.save``
+
+    Returns
+    -------
+    SaveResult
+        file name, time and error (traceback string) of the item
+    """
+    return _save_item(_pool_items[i_idx], kwargs)
@@ -0,0 +1,1123 @@
+import hashlib
+import types
+import os
+import json
+import time
+import tempfile
+import warnings
+import threading
+import multiprocessing
+import importlib.metadata
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+import matplotlib
+import matplotlib.artist
+import matplotlib.font_manager
+import svgutils.transform as sg
+
+from .svg_utils import _select_correcting_size_svg, _build_gg, \
+    _raw_gg_to_svg, _file_format
+from .utils import inherits_plotnine
+from .config import rcParams
+from .exceptions import CowpatchWarning
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+# attributes of a plotnine ggplot object that define what is drawn (others,
+# like `environment`, `figure` and `axs`, are runtime state)
+_gg_content_attributes = ["data", "mapping", "facet", "labels", "layers",
+                          "guides", "scales", "theme", "coordinates",
+                          "watermarks"]
+
+def _update_fingerprint(hasher, obj, _path=None):
+    """
+    (Internal) update a hash object with the content of a python object
+
+    Arguments
+    ---------
+    hasher : hashlib hash object
+        hash object to update (in place)
+    obj : object
+        object to fingerprint. pandas and numpy objects are hashed w.r.t.
+        their values, containers and objects with a ``__dict__`` are walked
+        recursively.
+    _path : set
+        ids of objects currently being walked (to avoid cycles)
+
+    Returns
+    -------
+    None
+        updates ``hasher`` in place
+    """
+    if _path is None:
+        _path = set()
+
+    if obj is None or isinstance(obj, (bool, int, float, complex, str)):
+        hasher.update((type(obj).__name__ + ":" + repr(obj)).encode())
+        return None
+    if isinstance(obj, bytes):
+        hasher.update(b"bytes:" + obj)
+        return None
+
+    if id(obj) in _path:
+        hasher.update(b"<cycle>")
+        return None
+    _path.add(id(obj))
+
+    hasher.update((type(obj).__module__ + "." +
+                   type(obj).__qualname__).encode())
+
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        if isinstance(obj, pd.DataFrame):
+            _update_fingerprint(hasher, list(obj.columns), _path)
+            _update_fingerprint(hasher, [str(d) for d in obj.dtypes], _path)
+        else:
+            _update_fingerprint(hasher, str(obj.dtype), _path)
+        hasher.update(
+            pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+    elif isinstance(obj, np.ndarray):
+        hasher.update((str(obj.dtype) + str(obj.shape)).encode())
+        if obj.dtype == object:
+            _update_fingerprint(hasher, obj.tolist(), _path)
+        else:
+            hasher.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, np.generic):
+        hasher.update(repr(obj.item()).encode())
+    elif isinstance(obj, dict):
+        for key in sorted(obj.keys(), key=repr):
+            _update_fingerprint(hasher, key, _path)
+            _update_fingerprint(hasher, obj[key], _path)
+    elif isinstance(obj, (list, tuple)):
+        hasher.update(str(len(obj)).encode())
+        for item in obj:
+            _update_fingerprint(hasher, item, _path)
+    elif isinstance(obj, (set, frozenset)):
+        for item in sorted(obj, key=repr):
+            _update_fingerprint(hasher, item, _path)
+    elif isinstance(obj, types.ModuleType):
+        hasher.update(obj.__name__.encode())
+    elif isinstance(obj, matplotlib.artist.Artist) or \
+        type(obj).__name__ == "EvalEnvironment":
+        # runtime state (drawn figures and the caller's namespace)
+        pass
+    elif isinstance(obj, (types.FunctionType, types.MethodType)):
+        func = getattr(obj, "__func__", obj)
+        hasher.update((func.__module__ + "." + func.__qualname__).encode())
+        hasher.update(func.__code__.co_code)
+        _update_fingerprint(hasher, func.__code__.co_consts, _path)
+        _update_fingerprint(hasher, func.__defaults__, _path)
+        if func.__closure__ is not None:
+            _update_fingerprint(hasher,
+                                [c.cell_contents for c in func.__closure__],
+                                _path)
+        if isinstance(obj, types.MethodType):
+            _update_fingerprint(hasher, obj.__self__, _path)
+    elif isinstance(obj, types.CodeType):
+        hasher.update(obj.co_code)
+    elif isinstance(obj, type):
+        hasher.update((obj.__module__ + "." + obj.__qualname__).encode())
+    elif hasattr(obj, "__dict__") or hasattr(type(obj), "__slots__"):
+        content = dict(getattr(obj, "__dict__", {}))
+        for slot in getattr(type(obj), "__slots__", []):
+            if hasattr(obj, slot):
+                content[slot] = getattr(obj, slot)
+        _update_fingerprint(hasher, content, _path)
+    else:
+        # may include a memory address, which only leads to cache misses
+        hasher.update(repr(obj).encode())
+
+    _path.discard(id(obj))
+
+    return None
+
+def _gg_fingerprint(gg):
+    """
+    (Internal) deterministic fingerprint of the content of a plotnine ggplot
+    object
+
+    Arguments
+    ---------
+    gg : plotnine.ggplot.ggplot
+        ggplot object to fingerprint
+
+    Returns
+    -------
+    str
+        hex digest that captures the ggplot's data, mapping, layers, theme
+        (and other content that defines the image)
+
+    Notes
+    -----
+    The evaluation environments that plotnine captures (to evaluate
+    expressions in ``aes``) are not part of the fingerprint.
+    """
+    hasher = hashlib.sha1()
+    _update_fingerprint(hasher,
+                        {name: getattr(gg, name, None)
+                            for name in _gg_content_attributes})
+    return hasher.hexdigest()
+
+# matplotlib rcParams (prefixes) that don't change rendered images
+_render_environment_ignored_params = ["keymap.", "webagg.", "animation.",
+                                      "backend", "interactive", "toolbar",
+                                      "tk.", "macosx.", "savefig.directory",
+                                      "figure.max_open_warning",
+                                      "figure.raise_window"]
+
+# packages whose versions can change rendered images
+_render_environment_packages = ["cowpatch", "plotnine", "matplotlib",
+                                "svgutils", "cairosvg", "Pillow"]
+
+_package_versions = None
+
+def _render_environment_fingerprint():
+    """
+    (Internal) fingerprint of the rendering environment, i.e. what (besides
+    a ggplot's content) defines how it is drawn
+
+    Returns
+    -------
+    str
+        hex digest that captures matplotlib's rcParams (e.g. ``font.*``,
+        ``svg.fonttype`` and ``svg.hashsalt``), the fonts matplotlib can find
+        and the versions of the rendering packages
+
+    Notes
+    -----
+    rcParams that only change interactive use (e.g. ``keymap.*`` and
+    ``backend``, see ``_render_environment_ignored_params``) are not part of
+    the fingerprint. The package versions are looked up once per process.
+    """
+    global _package_versions
+
+    if _package_versions is None:
+        versions = []
+        for package in _render_environment_packages:
+            try:
+                versions.append((package, importlib.metadata.version(package)))
+            except importlib.metadata.PackageNotFoundError:
+                versions.append((package, None))
+        _package_versions = repr(versions)
+
+    hasher = hashlib.sha1()
+    hasher.update(_package_versions.encode())
+    hasher.update(repr([(name, value) for name, value
+                            in sorted(matplotlib.rcParams.items())
+                            if not name.startswith(
+                                tuple(_render_environment_ignored_params))]
+                      ).encode())
+    hasher.update(repr(sorted(font.fname for font in
+                        matplotlib.font_manager.fontManager.ttflist)).encode())
+    return hasher.hexdigest()
+
+class _lru_cache:
+    def __init__(self):
+        """
+        (Internal) least recently used cache with hit and miss counters
+
+        Notes
+        -----
+        The maximum size is provided with each ``put`` call (so that it can
+        follow changes to ``cow.rcParams``). A maximum size of 0 turns off
+        the storage of new values.
+
+        Access is guarded by a lock, so that the cache can be shared by the
+        threads of asynchronous requests (see ``patch.asave``).
+        """
+        self.store = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.maxsize = None
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        """
+        obtain value stored w.r.t. key (or None if not stored)
+        """
+        with self._lock:
+            if key in self.store:
+                self.store.move_to_end(key)
+                self.hits += 1
+                return self.store[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value, maxsize):
+        """
+        store value w.r.t. key, evicting least recently used values beyond
+        maxsize
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self.store[key] = value
+            self.store.move_to_end(key)
+            while len(self.store) > maxsize:
+                self.store.popitem(last=False)
+
+    def contains(self, key):
+        """
+        logic if a value is stored w.r.t. key (without counting a hit or miss)
+        """
+        with self._lock:
+            return key in self.store
+
+    def discard(self, key):
+        """
+        remove value stored w.r.t. key (if stored)
+        """
+        with self._lock:
+            self.store.pop(key, None)
+
+    def clear(self):
+        """
+        remove all stored values and reset counters
+        """
+        with self._lock:
+            self.store.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """
+        hit and miss counters (``CacheInfo`` named tuple)
+        """
+        with self._lock:
+            return CacheInfo(hits=self.hits, misses=self.misses,
+                             maxsize=self.maxsize, currsize=len(self.store))
+
+class _bytes_lru_cache(_lru_cache):
+    def __init__(self):
+        """
+        (Internal) least recently used cache of bytes values, bounded by the
+        total number of bytes stored
+
+        Notes
+        -----
+        The maximum number of bytes is provided with each ``put`` call (see
+        ``_lru_cache``). ``info``'s ``maxsize`` and ``currsize`` are in bytes.
+        """
+        super().__init__()
+        self.currbytes = 0
+
+    def put(self, key, value, maxsize):
+        """
+        store value w.r.t. key, evicting least recently used values beyond
+        maxsize bytes (values larger than maxsize aren't stored)
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self.discard(key)
+            if len(value) > maxsize:
+                return None
+
+            self.store[key] = value
+            self.currbytes += len(value)
+            while self.currbytes > maxsize:
+                _, old_value = self.store.popitem(last=False)
+                self.currbytes -= len(old_value)
+
+    def discard(self, key):
+        """
+        remove value stored w.r.t. key (if stored)
+        """
+        with self._lock:
+            value = self.store.pop(key, None)
+            if value is not None:
+                self.currbytes -= len(value)
+
+    def clear(self):
+        """
+        remove all stored values and reset counters
+        """
+        with self._lock:
+            super().clear()
+            self.currbytes = 0
+
+    def info(self):
+        """
+        hit and miss counters (``CacheInfo`` named tuple, sizes in bytes)
+        """
+        with self._lock:
+            return CacheInfo(hits=self.hits, misses=self.misses,
+                             maxsize=self.maxsize, currsize=self.currbytes)
+
+_size_cache = _lru_cache()
+_build_cache = _lru_cache()
+_fragment_cache = _bytes_lru_cache()
+
+class _disk_cache:
+    def __init__(self, suffix=".json", binary=False):
+        """
+        (Internal) directory based cache (one file per key) that can be shared
+        across processes
+
+        Arguments
+        ---------
+        suffix : str
+            file ending of stored values
+        binary : boolean
+            logic if values are bytes (stored as is) instead of json
+            serializable objects
+
+        Notes
+        -----
+        Values are written to a temporary file in the cache directory and
+        then moved into place with ``os.replace`` (which is atomic), so
+        concurrent workers never read partially written values. The cache
+        directory itself is provided with each call (so that it can follow
+        changes to ``cow.rcParams``).
+        """
+        self.suffix = suffix
+        self.binary = binary
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+
+    def _path(self, directory, key):
+        """
+        file path of the value stored w.r.t. key
+        """
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(directory, name + self.suffix)
+
+    def get(self, directory, key):
+        """
+        obtain value stored w.r.t. key (or None if not stored)
+        """
+        path = self._path(directory, key)
+        try:
+            if self.binary:
+                with open(path, "rb") as fid:
+                    value = fid.read()
+            else:
+                with open(path, "r") as fid:
+                    value = json.load(fid)
+            os.utime(path) # keep recently used values from aging out
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, directory, key, value, max_age=None, max_bytes=None):
+        """
+        store value w.r.t. key and then evict values that are older than
+        max_age (seconds) or beyond max_bytes (total size, oldest removed
+        first)
+        """
+        os.makedirs(directory, exist_ok=True)
+        fid, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            if self.binary:
+                with os.fdopen(fid, "wb") as f:
+                    f.write(value)
+            else:
+                with os.fdopen(fid, "w") as f:
+                    json.dump(value, f)
+            os.replace(tmp_path, self._path(directory, key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.evict(directory, max_age=max_age, max_bytes=max_bytes)
+
+    def evict(self, directory, max_age=None, max_bytes=None):
+        """
+        remove stored values older than max_age (seconds) and then the
+        oldest values until the total size is at most max_bytes
+        """
+        if max_age is None and max_bytes is None:
+            return None
+
+        entries = []
+        for name in os.listdir(directory):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError: # removed by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total_bytes = np.sum([e[1] for e in entries])
+        now = time.time()
+
+        for mtime, size, path in entries:
+            too_old = max_age is not None and now - mtime > max_age
+            too_big = max_bytes is not None and total_bytes > max_bytes
+            if not (too_old or too_big):
+                continue
+            try:
+                os.remove(path)
+            except OSError: # removed by another process
+                pass
+            total_bytes -= size
+
+        return None
+
+_size_disk_cache = _disk_cache()
+_output_disk_cache = _disk_cache(suffix=".out", binary=True)
+
+def _reset_cache_locks():
+    """
+    (Internal) replace the locks of the caches in a forked worker process
+    (another thread of the parent process may have held them when forking)
+    """
+    for cache in [_size_cache, _build_cache, _fragment_cache,
+                  _size_disk_cache, _output_disk_cache]:
+        cache._lock = threading.RLock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_cache_locks)
+
+def size_cache_info():
+    """
+    statistics of the in-process cache of solved plotnine ggplot sizes
+
+    Returns
+    -------
+    CacheInfo
+        named tuple with ``hits``, ``misses``, ``maxsize`` and ``currsize``
+
+    See also
+    --------
+    clear_size_cache : remove all stored sizes
+    """
+    return _size_cache.info()
+
+def clear_size_cache():
+    """
+    remove all solved plotnine ggplot sizes from the in-process cache (and
+    reset the hit and miss counters)
+    """
+    _size_cache.clear()
+
+def fragment_cache_info():
+    """
+    statistics of the in-process cache of rendered plotnine ggplot svgs
+
+    Returns
+    -------
+    CacheInfo
+        named tuple with ``hits``, ``misses``, ``maxsize`` and ``currsize``
+        (sizes in bytes)
+
+    See also
+    --------
+    clear_fragment_cache : remove all stored svgs
+    """
+    return _fragment_cache.info()
+
+def clear_fragment_cache():
+    """
+    remove all rendered plotnine ggplot svgs from the in-process cache (and
+    reset the hit and miss counters)
+    """
+    _fragment_cache.clear()
+
+def _fragment_cache_key(gg, size, rasterize=False, raster_dpi=96,
+                        fingerprint=None):
+    """
+    (Internal) key of a rendered ggplot svg in the fragment cache
+
+    Arguments
+    ---------
+    gg : plotnine.ggplot.ggplot
+        ggplot object
+    size : tuple
+        width and height (in inches) requested from the ggplot object
+    rasterize : boolean
+        logic if the data layers are rasterized
+    raster_dpi : int
+        dots per inch of the rasterized data layers
+    fingerprint : str
+        fingerprint of ``gg`` (see ``_gg_fingerprint``), if already
+        calculated
+
+    Returns
+    -------
+    tuple
+        cache key (None if the cache is turned off)
+    """
+    if rcParams["fragment_cache_maxbytes"] <= 0:
+        return None
+
+    if fingerprint is None:
+        fingerprint = _gg_fingerprint(gg)
+
+    return (fingerprint, _render_environment_fingerprint(),
+            float(size[0]), float(size[1]), bool(rasterize),
+            raster_dpi if rasterize else None)
+
+def _cached_gg_to_svg(gg, size, rasterize=False, raster_dpi=96):
+    """
+    (Internal) memoized rendering of a ggplot object into an svg object
+    (``svg_utils._raw_gg_to_svg`` at 96 dpi)
+
+    Arguments
+    ---------
+    gg : plotnine.ggplot.ggplot
+        ggplot object to render
+    size : tuple
+        width and height (in inches) to request from the ggplot object
+    rasterize : boolean
+        logic if the data layers should be rasterized
+    raster_dpi : int
+        dots per inch of the rasterized data layers
+
+    Returns
+    -------
+    svg_object : ``svgutils.transforms`` object
+
+    Notes
+    -----
+    Rendered svgs are stored (as bytes, before their ids are made unique
+    within a patch) w.r.t. the fingerprint of the ggplot's content, the
+    fingerprint of the rendering environment (matplotlib's rcParams, e.g.
+    ``svg.fonttype`` and ``svg.hashsalt``, fonts and package versions, see
+    ``_render_environment_fingerprint``), the requested size and the
+    rasterization. Only ggplot objects whose content
+    or size changed are rendered again. The stored bytes are bounded by
+    ``cow.rcParams``'s ``fragment_cache_maxbytes`` (0 turns the cache off).
+    """
+    fingerprint = None
+    if rcParams["fragment_cache_maxbytes"] > 0:
+        fingerprint = _gg_fingerprint(gg)
+        key = _fragment_cache_key(gg, size, rasterize=rasterize,
+                                  raster_dpi=raster_dpi,
+                                  fingerprint=fingerprint)
+        svg_bytes = _fragment_cache.get(key)
+        if svg_bytes is not None:
+            return sg.fromstring(svg_bytes.decode())
+
+    svg_obj = _raw_gg_to_svg(_cached_build_gg(gg, fingerprint=fingerprint),
+                             width=size[0], height=size[1], dpi=96,
+                             rasterize=rasterize, raster_dpi=raster_dpi)
+
+    if fingerprint is not None:
+        _fragment_cache.put(key, svg_obj.to_str(),
+                            maxsize=rcParams["fragment_cache_maxbytes"])
+
+    return svg_obj
+
+def _fragment_cache_store(gg, size, svg_obj, rasterize=False, raster_dpi=96,
+                          fingerprint=None):
+    """
+    (Internal) store an svg object rendered elsewhere (e.g. by the size
+    solver) in the fragment cache (see ``_cached_gg_to_svg``)
+    """
+    key = _fragment_cache_key(gg, size, rasterize=rasterize,
+                              raster_dpi=raster_dpi, fingerprint=fingerprint)
+    if key is None or _fragment_cache.contains(key):
+        return None
+
+    _fragment_cache.put(key, svg_obj.to_str(),
+                        maxsize=rcParams["fragment_cache_maxbytes"])
+
+def _cached_build_gg(gg, fingerprint=None):
+    """
+    (Internal) memoized version of ``svg_utils._build_gg``
+
+    Arguments
+    ---------
+    gg : plotnine.ggplot.ggplot
+        ggplot object to build
+    fingerprint : str
+        fingerprint of ``gg`` (see ``_gg_fingerprint``), if already
+        calculated
+
+    Returns
+    -------
+    plotnine.ggplot.ggplot
+        built copy of the ggplot object (see ``svg_utils._build_gg``)
+
+    Notes
+    -----
+    Built ggplot objects are stored w.r.t. the fingerprint of the ggplot's
+    content (so changes to the ggplot object are never served a stale
+    build). The number of stored objects is bounded by ``cow.rcParams``'s
+    ``build_cache_maxsize`` (0 turns the cache off).
+    """
+    maxsize = rcParams["build_cache_maxsize"]
+    if maxsize <= 0:
+        return _build_gg(gg)
+
+    if fingerprint is None:
+        fingerprint = _gg_fingerprint(gg)
+
+    built = _build_cache.get(fingerprint)
+    if built is None:
+        built = _build_gg(gg)
+        _build_cache.put(fingerprint, built, maxsize=maxsize)
+
+    return built
+
+def _discard_built_gg(gg):
+    """
+    (Internal) remove the stored build of a ggplot object (see
+    ``_cached_build_gg``), used when the ggplot object is updated
+    """
+    if _build_cache.info().currsize > 0:
+        _build_cache.discard(_gg_fingerprint(gg))
+
+def _cached_select_correcting_size_svg(gg, height, width, dpi, limitsize=True,
+                    eps=1e-2, maxIter=20, min_size_px=10, method="affine",
+                    return_svg=False, reuse_figure=True, warm_start=None):
+    """
+    (Internal) memoized version of
+    ``svg_utils._select_correcting_size_svg`` (with ``throw_error=False``)
+
+    Arguments
+    ---------
+    gg : plotnine.ggplot.ggplot
+        ggplot object to calculate optimal size
+    height : float
+        desired height of svg output (in inches)
+    width : float
+        desired width of svg output (in inches)
+    dpi : float
+        dots per inch of saved object
+    limitsize : boolean
+        logic if plotnine's ggplot.save function should check if the requested
+        width and height in inches are greater than 50
+    eps : float
+        maximum allowed difference between height and width output versus the
+        desired output
+    maxIter : int
+        maximum number of steps that can be used to the difference
+        between desired and output height and width within minimum distance
+    min_size_px : int
+        early stopping rule if converging height or width has a pixel size
+        smaller than or equal to this value
+    method : str
+        size solver to use, either "affine" or "fixed_point"
+    return_svg : boolean
+        logic if the svg object rendered with the returned width and height
+        should also be returned (None if the sizes were obtained from a cache
+        or the process failed to converge)
+    reuse_figure : boolean
+        logic if the drawn plotnine figure should be resized between solver
+        steps (doesn't change the solved size, so it isn't part of the cache
+        key)
+    warm_start : tuple
+        optional (requested, obtained) sizes from a previous solve (see
+        ``svg_utils._select_correcting_size_svg``). Like ``reuse_figure``
+        it isn't part of the cache key (any size within ``eps`` is accepted)
+
+    Returns
+    -------
+    tuple
+        see ``svg_utils._select_correcting_size_svg``
+
+    Notes
+    -----
+    Solved sizes are stored w.r.t. a fingerprint of the ggplot's content
+    (see ``_gg_fingerprint``), a fingerprint of the rendering environment
+    (matplotlib's rcParams, fonts and package versions, see
+    ``_render_environment_fingerprint``), the requested size, dpi and solver
+    parameters.
+    The number of stored sizes is bounded by ``cow.rcParams``'s
+    ``size_cache_maxsize`` (0 turns the cache off).
+
+    If ``cow.rcParams``'s ``size_cache_dir`` is not None, solved sizes are
+    also stored in (and looked up from) that directory, which can be shared
+    by multiple processes. Stored sizes are evicted w.r.t.
+    ``size_cache_dir_max_age`` and ``size_cache_dir_max_bytes``.
+
+    The ggplot object is only built once across calls (see
+    ``_cached_build_gg``).
+    """
+    fingerprint, key, out = _size_cache_lookup(gg, height=height,
+                                               width=width, dpi=dpi,
+                                               limitsize=limitsize, eps=eps,
+                                               maxIter=maxIter,
+                                               min_size_px=min_size_px,
+                                               method=method)
+
+    if out is not None:
+        if return_svg:
+            return out + (None,)
+        return out
+
+    built_gg = _cached_build_gg(gg, fingerprint=fingerprint)
+    out = _select_correcting_size_svg(built_gg, height=height, width=width,
+                                      dpi=dpi, limitsize=limitsize,
+                                      eps=eps, maxIter=maxIter,
+                                      min_size_px=min_size_px,
+                                      method=method,
+                                      throw_error=False,
+                                      return_svg=return_svg,
+                                      reuse_figure=reuse_figure,
+                                      warm_start=warm_start)
+
+    _size_cache_store(key, tuple(out[:3]))
+
+    # (the solver's final render is a vector render, see _cached_gg_to_svg)
+    if return_svg and out[3] is not None and dpi == 96:
+        _fragment_cache_store(gg, out[:2], out[3], fingerprint=fingerprint)
+
+    return out
+
+def _size_cache_lookup(gg, height, width, dpi, limitsize, eps, maxIter,
+                       min_size_px, method):
+    """
+    (Internal) look up a solved size in the in-process and disk caches (see
+    ``_cached_select_correcting_size_svg`` for the arguments)
+
+    Returns
+    -------
+    fingerprint : str
+        fingerprint of ``gg`` (None if the caches are turned off)
+    key : tuple
+        cache key of the request (None if the caches are turned off)
+    out : tuple
+        stored output of ``svg_utils._select_correcting_size_svg`` (None if
+        not stored)
+    """
+    maxsize = rcParams["size_cache_maxsize"]
+    directory = rcParams["size_cache_dir"]
+
+    if maxsize <= 0 and directory is None:
+        return None, None, None
+
+    fingerprint = _gg_fingerprint(gg)
+    key = (fingerprint, _render_environment_fingerprint(), width, height,
+           dpi, limitsize, eps, maxIter, min_size_px, method)
+
+    out = None
+    if maxsize > 0:
+        out = _size_cache.get(key)
+
+    if out is None and directory is not None:
+        out = _size_disk_cache.get(directory, key)
+        if out is not None:
+            out = tuple(out)
+            if maxsize > 0:
+                _size_cache.put(key, out, maxsize=maxsize)
+
+    return fingerprint, key, out
+
+def _size_cache_store(key, out):
+    """
+    (Internal) store a solved size (see ``_size_cache_lookup``) in the
+    in-process and disk caches
+    """
+    if key is None:
+        return None
+
+    maxsize = rcParams["size_cache_maxsize"]
+    directory = rcParams["size_cache_dir"]
+
+    if maxsize > 0:
+        _size_cache.put(key, out, maxsize=maxsize)
+    if directory is not None:
+        _size_disk_cache.put(directory, key, out,
+                             max_age=rcParams["size_cache_dir_max_age"],
+                             max_bytes=rcParams["size_cache_dir_max_bytes"])
+
+# size requests of a (forked) worker process of
+# _parallel_cached_select_correcting_size_svg (only set in worker processes,
+# see _pool_init_requests)
+_pool_requests = None
+
+def _parallel_cached_select_correcting_size_svg(requests, max_workers,
+                                                return_svg=True):
+    """
+    (Internal) solve (and render) multiple size requests in a process pool
+    (see ``_cached_select_correcting_size_svg``)
+
+    Arguments
+    ---------
+    requests : list
+        list of dictionaries of all arguments for
+        ``_cached_select_correcting_size_svg`` (besides ``return_svg``)
+    max_workers : int
+        maximum number of worker processes
+    return_svg : boolean
+        logic if the svg objects rendered with the solved sizes should also
+        be returned
+
+    Returns
+    -------
+    list
+        for each request, the output of
+        ``_cached_select_correcting_size_svg`` with ``return_svg=True``.
+        Sizes obtained from the caches are also rendered (if they converged
+        and ``return_svg`` is True, otherwise the svg objects are None).
+
+    Notes
+    -----
+    Worker processes are forked, so that the ggplot objects (which can't
+    always be pickled) and ``cow.rcParams`` are shared with them. The
+    requests are handed to each worker process by the pool's initializer
+    (arguments of forked processes aren't pickled), so that concurrent calls
+    (e.g. from different threads) don't share any state. Only the solved
+    sizes and svg strings are sent back, the solved sizes are stored in the
+    caches of this process. If forking isn't available, the requests are
+    solved in this process (with a warning).
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        warnings.warn("forked worker processes aren't available on this "+\
+                      "platform, solving sizes in serial",
+                      CowpatchWarning)
+        outputs = [_cached_select_correcting_size_svg(**request,
+                                                      return_svg=return_svg)
+                    for request in requests]
+        if return_svg:
+            return outputs
+        return [out + (None,) for out in outputs]
+
+    tasks = []
+    for request in requests:
+        fingerprint, key, out = _size_cache_lookup(
+                                    **{name: value
+                                        for name, value in request.items()
+                                        if name not in ["reuse_figure",
+                                                        "warm_start"]})
+        tasks.append((fingerprint, key, out))
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(requests)),
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=_pool_init_requests,
+                initargs=(requests,)) as pool:
+        futures = [pool.submit(_pool_select_correcting_size_svg,
+                               r_idx, fingerprint, out, return_svg)
+                    for r_idx, (fingerprint, _, out) in enumerate(tasks)]
+        results = [future.result() for future in futures]
+
+    outputs = []
+    for request, (fingerprint, key, cached_out), (out, svg_str) in \
+            zip(requests, tasks, results):
+        if cached_out is None:
+            _size_cache_store(key, out)
+        img = None if svg_str is None else sg.fromstring(svg_str)
+        if img is not None and request["dpi"] == 96:
+            _fragment_cache_store(request["gg"], out[:2], img,
+                                  fingerprint=fingerprint)
+        outputs.append(out + (img,))
+
+    return outputs
+
+def _pool_init_requests(requests):
+    """
+    (Internal) worker process initializer of
+    ``_parallel_cached_select_correcting_size_svg``, stores the size requests
+    in the worker process
+    """
+    global _pool_requests
+    _pool_requests = requests
+
+def _pool_select_correcting_size_svg(r_idx, fingerprint, out=None,
+                                     return_svg=True):
+    """
+    (Internal) worker process function of
+    ``_parallel_cached_select_correcting_size_svg``
+
+    Arguments
+    ---------
+    r_idx : int
+        index of the request in ``_pool_requests``
+    fingerprint : str
+        fingerprint of the request's ggplot object (or None)
+    out : tuple
+        solved size from the caches (None if the size needs to be solved)
+    return_svg : boolean
+        logic if the ggplot should be rendered with the solved size
+
+    Returns
+    -------
+    out : tuple
+        output of ``svg_utils._select_correcting_size_svg``
+    svg_str : str
+        svg string of the ggplot rendered with the solved size (None if the
+        process failed to converge or ``return_svg`` is False)
+    """
+    request = dict(_pool_requests[r_idx])
+    gg = _cached_build_gg(request.pop("gg"), fingerprint=fingerprint)
+
+    img = None
+    if out is None:
+        out = _select_correcting_size_svg(gg, **request,
+                                          throw_error=False,
+                                          return_svg=return_svg)
+        if return_svg:
+            *out, img = out
+        out = tuple(out)
+    elif out[2] and return_svg:
+        img = _raw_gg_to_svg(gg, width=out[0], height=out[1],
+                             dpi=request["dpi"],
+                             limitsize=request["limitsize"])
+
+    svg_str = None if img is None else img.to_str().decode()
+    return out, svg_str
+
+# cowpatch rcParams that don't change saved images
+_output_cache_ignored_params = ["size_cache_maxsize", "size_cache_dir",
+                                "size_cache_dir_max_age",
+                                "size_cache_dir_max_bytes",
+                                "build_cache_maxsize",
+                                "fragment_cache_maxbytes", "max_workers",
+                                "save_verbose", "show_verbose",
+                                "output_cache_dir",
+                                "output_cache_dir_max_age",
+                                "output_cache_dir_max_bytes"]
+
+def _patch_fingerprint(patch):
+    """
+    (Internal) deterministic fingerprint of the content of a patch
+
+    Arguments
+    ---------
+    patch : cow.patch
+        patch to fingerprint
+
+    Returns
+    -------
+    str
+        hex digest that captures the layout of the patch (and of nested
+        patches) and the content of each plotnine ggplot object (see
+        ``_gg_fingerprint``)
+    """
+    hasher = hashlib.sha1()
+    _update_fingerprint(hasher, patch.layout)
+    for grob in patch.grobs:
+        if inherits_plotnine(grob):
+            hasher.update(b"ggplot:" + _gg_fingerprint(grob).encode())
+        elif hasattr(grob, "grobs"): # (nested patch)
+            hasher.update(b"patch:" + _patch_fingerprint(grob).encode())
+        else:
+            _update_fingerprint(hasher, grob)
+    return hasher.hexdigest()
+
+def _output_cache_keys(patch, filename, width, height, dpi, _format=None,
+                       options=None):
+    """
+    (Internal) keys of the saved files of a patch in the output cache
+
+    Arguments
+    ---------
+    patch : cow.patch
+        patch to save
+    filename : str or list
+        file name(s) to save to (see ``patch.save``)
+    width : float
+        width of output image in inches
+    height : float
+        height of output image in inches
+    dpi : int or float
+        dots per square inch
+    _format : str or list
+        format(s) of the file(s) (see ``patch.save``)
+    options : dict
+        other arguments of ``patch.save`` that change the saved files
+
+    Returns
+    -------
+    list
+        cache key for each file name (None if the cache is turned off)
+
+    Notes
+    -----
+    Besides the patch's content and the saving arguments, the keys capture
+    the rendering environment (matplotlib's rcParams, fonts and package
+    versions, see ``_render_environment_fingerprint``) and cowpatch's
+    rcParams that change saved files.
+    """
+    if rcParams["output_cache_dir"] is None:
+        return None
+
+    filenames = filename if type(filename) is list else [filename]
+    formats = _format if type(_format) is list \
+                else [_format] * len(filenames)
+
+    params = sorted([(name, rcParams[name]) for name in rcParams
+                        if name not in _output_cache_ignored_params])
+    base_key = (_patch_fingerprint(patch), _render_environment_fingerprint(),
+                width, height, dpi, sorted((options or dict()).items()),
+                params)
+
+    return [base_key + (_file_format(f, _format=inner_format),)
+                for f, inner_format in zip(filenames, formats)]
+
+def output_cache_info():
+    """
+    statistics of the cache of saved patches (see ``cow.rcParams``'s
+    ``output_cache_dir``)
+
+    Returns
+    -------
+    CacheInfo
+        named tuple with ``hits`` and ``misses`` (per saved file, the hit
+        rate is ``hits / (hits + misses)``), ``maxsize`` and ``currsize``
+        (number of bytes stored in the directory)
+
+    See also
+    --------
+    clear_output_cache : remove all stored files
+    """
+    directory = rcParams["output_cache_dir"]
+    currsize = 0
+    if directory is not None and os.path.isdir(directory):
+        currsize = int(np.sum([os.path.getsize(os.path.join(directory, name))
+                                for name in os.listdir(directory)
+                                if name.endswith(_output_disk_cache.suffix)]))
+
+    return CacheInfo(hits=_output_disk_cache.hits,
+                     misses=_output_disk_cache.misses,
+                     maxsize=rcParams["output_cache_dir_max_bytes"],
+                     currsize=currsize)
+
+def clear_output_cache():
+    """
+    remove all saved patches from the cache directory (see ``cow.rcParams``'s
+    ``output_cache_dir``) and reset the hit and miss counters
+    """
+    directory = rcParams["output_cache_dir"]
+    if directory is not None and os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith(_output_disk_cache.suffix):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError: # removed by another process
+                    pass
+
+    _output_disk_cache.hits = 0
+    _output_disk_cache.misses = 0
+
+def _output_cache_get(keys):
+    """
+    (Internal) look up the content of saved files in the output cache
+
+    Arguments
+    ---------
+    keys : list
+        cache keys of the files (see ``_output_cache_keys``)
+
+    Returns
+    -------
+    list
+        bytes of each file (None if any file isn't stored)
+    """
+    directory = rcParams["output_cache_dir"]
+    values = [_output_disk_cache.get(directory, key) for key in keys]
+    if np.any([value is None for value in values]):
+        return None
+    return values
+
+def _output_cache_put(key, value):
+    """
+    (Internal) store the content of a saved file in the output cache
+    """
+    _output_disk_cache.put(rcParams["output_cache_dir"], key, value,
+                           max_age=rcParams["output_cache_dir_max_age"],
+                           max_bytes=rcParams["output_cache_dir_max_bytes"])
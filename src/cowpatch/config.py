@@ -1,16 +1,80 @@
-rcParams = dict(maxIter=20,
-                min_size_px=10,
-                eps=1e-2,
+import contextlib
+import contextvars
 
-                save_verbose=True,
-                show_verbose=True,
+class _RcParams(dict):
+    """
+    (Internal) dictionary of cowpatch's parameters, whose values can be
+    overridden within a context (see ``_rcParams_context``)
+    """
+    def __getitem__(self, key):
+        override = _rcParams_override.get()
+        if override is not None and key in override:
+            return override[key]
+        return dict.__getitem__(self, key)
 
-                num_attempts=2,
+# parameters overriding rcParams in the current context (e.g. a snapshot of
+# rcParams for an asynchronous request)
+_rcParams_override = contextvars.ContextVar("_rcParams_override",
+                                            default=None)
 
-                base_height=3.71,
-                base_aspect_ratio=1.618 # the golden ratio
+@contextlib.contextmanager
+def _rcParams_context(params):
+    """
+    (Internal) override rcParams within the current context (e.g. a thread)
 
-                )
+    Arguments
+    ---------
+    params : dict
+        parameters (and values) to use instead of rcParams's values (on top
+        of the overrides of an enclosing context)
+
+    Notes
+    -----
+    Other contexts (e.g. other threads) and the underlying values of rcParams
+    are not changed.
+    """
+    override = _rcParams_override.get()
+    if override is not None:
+        params = {**override, **params}
+
+    token = _rcParams_override.set(params)
+    try:
+        yield params
+    finally:
+        _rcParams_override.reset(token)
+
+rcParams = _RcParams(maxIter=20,
+                     min_size_px=10,
+                     eps=1e-2,
+                     size_solver="affine",
+                     size_solver_reuse_figure=True,
+                     size_cache_maxsize=256,
+                     size_cache_dir=None,
+                     size_cache_dir_max_age=30*24*60*60, # 30 days
+                     size_cache_dir_max_bytes=10*1024**2, # 10 MB
+                     build_cache_maxsize=8,
+                     fragment_cache_maxbytes=32*1024**2, # 32 MB
+                     output_cache_dir=None,
+                     output_cache_dir_max_age=30*24*60*60, # 30 days
+                     output_cache_dir_max_bytes=512*1024**2, # 512 MB
+                     max_workers=1,
+                     svg_dedup_defs=True,
+                     rasterize_threshold=None,
+
+                     save_verbose=True,
+                     save_stream=False,
+                     save_minify=False,
+                     minify_precision=2,
+                     raster_backend="svg",
+                     raster_tile_rows=None,
+                     show_verbose=True,
+
+                     num_attempts=2,
+
+                     base_height=3.71,
+                     base_aspect_ratio=1.618 # the golden ratio
+
+                     )
 """
 underlying parameters of that control the generation of the actual
 images
@@ -26,9 +90,97 @@ eps : float
     difference between desired and converged sizes to successfully
     stop the interation for the conversion a plotnine ggplot
     object output into the correct size
+size_solver : str
+    approach to find the requested size of a plotnine ggplot object that
+    returns the desired output size. "affine" fits an affine model from two
+    renders (and checks it with a third) before falling back to the
+    fixed-point iteration, "fixed_point" only uses the fixed-point iteration
+size_solver_reuse_figure : boolean
+    logic if the size solver should draw a plotnine ggplot object once and
+    resize the drawn figure for each step (instead of drawing it from scratch
+    for each step)
+size_cache_maxsize : int
+    maximum number of solved plotnine ggplot object sizes (w.r.t. the
+    ggplot's content, requested size, dpi, matplotlib's rcParams, fonts and
+    package versions) to keep in memory so that repeated `.show()` and
+    `.save()` calls skip the size solver. A value of 0 turns off this cache.
+size_cache_dir : str
+    optional directory to store solved plotnine ggplot object sizes on disk
+    (shared across processes). If None (the default), sizes are only cached
+    in memory.
+size_cache_dir_max_age : float
+    seconds since last use after which a solved size stored in
+    `size_cache_dir` is removed. If None, there is no age limit.
+size_cache_dir_max_bytes : int
+    maximum total bytes of solved sizes stored in `size_cache_dir` (the
+    least recently used are removed first). If None, there is no size limit.
+build_cache_maxsize : int
+    maximum number of built plotnine ggplot objects (layer data after
+    statistics, scales and facets are computed, w.r.t. the ggplot's content)
+    to keep in memory so that rendering a ggplot object at different sizes
+    skips plotnine's build step. A value of 0 turns off this cache (the
+    build is then only shared within a single size solve).
+fragment_cache_maxbytes : int
+    maximum number of bytes of rendered plotnine ggplot svgs (w.r.t. the
+    ggplot's content and requested size) to keep in memory, so that only
+    the plotnine ggplot objects of a cow.patch arangement that changed are
+    rendered again. Least recently used svgs are removed first. A value of 0
+    turns off this cache.
+output_cache_dir : str
+    directory to store saved files of cow.patch arangements in (w.r.t. a
+    fingerprint of the patch's layouts and plotnine ggplot objects, the
+    requested size, dpi, format, saving options, the other rcParams,
+    matplotlib's rcParams, fonts and package versions).
+    Saving a patch that matches a stored file copies the stored file
+    instead of rendering. If None (the default), saved files aren't stored.
+output_cache_dir_max_age : float
+    number of seconds after which an unused stored file is removed from
+    output_cache_dir
+output_cache_dir_max_bytes : int
+    maximum total size (in bytes) of the files in output_cache_dir (least
+    recently used files are removed first)
+max_workers : int
+    maximum number of worker processes used to size and render the plotnine
+    ggplot objects of an arrangement in parallel (with `.show()` and
+    `.save()`). A value of 1 (the default) sizes and renders them in serial.
+    This is also the maximum number of threads used to convert an arrangement
+    into multiple pdf, ps, eps or raster files at the same time (with
+    `.save()` and a list of file names).
+svg_dedup_defs : boolean
+    logic if identical definitions (font glyphs, clip paths and markers) of
+    the plotnine ggplot objects in an arrangement should be stored once and
+    shared, which reduces the size of the svg (and of the pdf / raster
+    conversions of it).
+rasterize_threshold : int
+    number of data elements (rows of the layers' data after statistics) of a
+    plotnine ggplot object above which its data layers are rasterized (at
+    the output dpi) with `.show()` and `.save()`, while axes, text and
+    legends stay vector graphics. If None (the default), no plotnine ggplot
+    object is rasterized unless requested with the `rasterize` parameter.
 save_verbose : boolean
     logic if saving a cow.patch arangement (with .save) is is done so
     verbosely as a default (can be overridden)
+save_stream : boolean
+    logic if saving a cow.patch arangement (with .save) writes the svg one
+    plotnine ggplot object at a time (rendering each object after the sizes
+    are solved and releasing it once written) instead of composing the full
+    svg object in memory first. The saved image is the same.
+save_minify : boolean
+    logic if saving a cow.patch arangement (with .save) minifies the svg as a
+    default (rounding coordinates, removing metadata and whitespace and
+    shortening ids, can be overridden)
+minify_precision : int
+    number of decimals of coordinates (in points) when minifying the svg.
+    If None, coordinates are not rounded.
+raster_backend : str
+    approach to save a cow.patch arangement as raster files (with
+    .save). "svg" (the default) converts the composed svg with cairosvg, "agg"
+    renders each plotnine ggplot object with matplotlib's Agg renderer and
+    pastes the images together.
+raster_tile_rows : int
+    number of pixel rows of the tiles used to rasterize png and tiff files
+    (with .save) one tile at a time, bounding memory use for very large
+    images. If None (the default), the full image is rasterized at once.
 show_verbose : boolean
     logic if showing a cow.patch arangement (with .show) is is done so
     verbosely as a default (can be overridden)
@@ -1,10 +1,19 @@
 import io
+import sys
+import gzip
+import zlib
+import struct
+import collections
+import multiprocessing
 import plotnine as p9
 import cairosvg
 import svgutils.transform as sg
+from lxml import etree
 from PIL import Image
 import warnings
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from .exceptions import CowpatchWarning
+from .config import rcParams
 
 import re
 from IPython.display import SVG, display
@@ -13,15 +22,22 @@ import IPython
 from .utils import _transform_size_to_pt, _proposed_scaling_both, \
                     to_inches, from_inches
 
+import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.image as mpimg
+from matplotlib.backend_bases import _get_renderer
+from matplotlib.backends.backend_svg import FigureCanvasSVG
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from plotnine.ggplot import plot_context
+from plotnine.exceptions import PlotnineError
 
 import numpy as np
 import copy
 
 import pdb
 
-def _raw_gg_to_svg(gg, width, height, dpi, limitsize=True):
+def _raw_gg_to_svg(gg, width, height, dpi, limitsize=True, rasterize=False,
+                   raster_dpi=None):
     """
     Convert plotnine ggplot figure to svg and return it (pass width, height
     directly to p9.save, no correction to incorrect saving)
@@ -40,6 +56,12 @@ def _raw_gg_to_svg(gg, width, height, dpi, limitsize=True):
         logic if plotnine's ggplot.save function should check if the requested
         width and height in inches are greater than 50 (assumes the user
         accidentally entered in these values w.r.t. pixels)
+    rasterize : boolean
+        logic if the data layers of the ggplot object should be embedded as
+        an image (axes, text and legends stay vector graphics), see
+        ``_rasterize_layers``
+    raster_dpi : int
+        dots per inch of the rasterized data layers. If None, ``dpi`` is used.
 
     Returns
     -------
@@ -50,21 +72,213 @@ def _raw_gg_to_svg(gg, width, height, dpi, limitsize=True):
     -----
     Code idea motified by the stackoverflow question here, https://stackoverflow.com/questions/8598673/how-to-save-a-pylab-figure-into-in-memory-file-which-can-be-read-into-pil-image/8598881
     and truly influenced by svgutils.transform.from_mpl function.
+
+    If ``gg`` was already built (see ``_build_gg``), plotnine's build step
+    is not recomputed.
     """
 
     fid = io.StringIO()
 
-    try:
-        gg.save(fid, format="svg", height=height, width=width,
-            dpi=dpi, units="in", limitsize=limitsize, verbose=False)
-    except ValueError:
-        raise(ValueError, "No ggplot SVG backend")
+    if rasterize:
+        gg = _build_gg(gg)
+
+    if _is_built_gg(gg):
+        _check_limitsize(width=width, height=height, limitsize=limitsize)
+        fig, plot = _draw_gg(gg, width=width, height=height, dpi=dpi)
+        try:
+            with plot_context(plot):
+                if rasterize:
+                    _rasterize_layers(fig)
+                    if raster_dpi is None:
+                        raster_dpi = dpi
+                    fig.savefig(fid, format="svg", bbox_inches="tight",
+                                dpi=raster_dpi)
+                else:
+                    fig.savefig(fid, format="svg", bbox_inches="tight")
+        finally:
+            plt.close(fig)
+    else:
+        try:
+            gg.save(fid, format="svg", height=height, width=width,
+                dpi=dpi, units="in", limitsize=limitsize, verbose=False)
+        except ValueError:
+            raise(ValueError, "No ggplot SVG backend")
     fid.seek(0)
     img = sg.fromstring(fid.read())
 
     return img
 
-def _real_size_out_svg(gg, height, width, dpi, limitsize=True):
+def _raw_gg_to_image(gg, width, height, dpi, limitsize=True, raster_dpi=None):
+    """
+    Convert plotnine ggplot figure to a raster image with matplotlib's Agg
+    renderer (with the same content and size as ``_raw_gg_to_svg``)
+
+    Arguments
+    ---------
+    gg: plotnine.ggplot.ggplot
+        object to convert
+    width : float
+        width of the figure in inches
+    height: float
+        height of the figure in inches
+    dpi: int
+        dots per inch of the figure (w.r.t. its size, see ``_raw_gg_to_svg``)
+    limitsize: boolean
+        logic if the requested width and height in inches should be checked
+        to not be greater than 50 (see ``_raw_gg_to_svg``)
+    raster_dpi : int
+        dots per inch of the image. If None, ``dpi`` is used.
+
+    Returns
+    -------
+    PIL.Image.Image
+        RGBA image of the ggplot object (cropped like the svg with
+        ``bbox_inches="tight"``)
+    """
+    if raster_dpi is None:
+        raster_dpi = dpi
+
+    gg = _build_gg(gg)
+    _check_limitsize(width=width, height=height, limitsize=limitsize)
+    fig, plot = _draw_gg(gg, width=width, height=height, dpi=dpi)
+    try:
+        with plot_context(plot):
+            canvas = FigureCanvasAgg(fig)
+            fid = io.BytesIO()
+            fig.savefig(fid, format="rgba", dpi=raster_dpi,
+                        bbox_inches="tight")
+            # (the renderer has the size of the cropped image)
+            image_size = (int(canvas.renderer.width),
+                          int(canvas.renderer.height))
+            image = Image.frombuffer("RGBA", image_size, fid.getvalue(),
+                                     "raw", "RGBA", 0, 1)
+    finally:
+        plt.close(fig)
+
+    return image
+
+def _rasterize_layers(fig):
+    """
+    (Internal) mark the data layers of a drawn ggplot figure to be rasterized
+    when saved as an svg
+
+    Arguments
+    ---------
+    fig : matplotlib.figure.Figure
+        figure of a drawn ggplot object (see ``_draw_gg``)
+
+    Notes
+    -----
+    The geoms' collections, lines, patches and images of each panel are
+    rasterized (matplotlib embeds them as a single image per panel). The
+    panel backgrounds, grid lines, axes, text (including ``geom_text``) and
+    legends stay vector graphics.
+    """
+    for ax in fig.axes:
+        for artist in list(ax.collections) + list(ax.lines) + \
+                list(ax.patches) + list(ax.images):
+            artist.set_rasterized(True)
+
+def _gg_num_elements(gg):
+    """
+    (Internal) number of data elements of a built ggplot object
+
+    Arguments
+    ---------
+    gg : plotnine.ggplot.ggplot
+        built ggplot object (see ``_build_gg``)
+
+    Returns
+    -------
+    int
+        total number of rows of the layers' data (after statistics), which
+        captures how many elements the layers draw (e.g. points, bars or
+        line vertices)
+    """
+    return int(np.sum([len(l.data) for l in gg.layers]))
+
+def _build_gg(gg):
+    """
+    (Internal) compute plotnine's build step (layer data, statistics, scales
+    and facet layout) of a ggplot object, which doesn't depend on the size
+    of the figure
+
+    Arguments
+    ---------
+    gg : plotnine.ggplot.ggplot
+        ggplot object to build
+
+    Returns
+    -------
+    plotnine.ggplot.ggplot
+        built copy of the ggplot object (the original object is not
+        modified). This object can be passed to ``_draw_gg`` (and the
+        rendering functions in this file) multiple times.
+    """
+    if _is_built_gg(gg):
+        return gg
+
+    built = copy.deepcopy(gg)
+    with plot_context(built):
+        built._build()
+    return built
+
+def _is_built_gg(gg):
+    """
+    (Internal) logic if a ggplot object was built by ``_build_gg``
+    """
+    return gg.layout is not None and gg.figure is None
+
+def _draw_gg(gg, width, height, dpi):
+    """
+    (Internal) draw a ggplot object with a given size (without recomputing
+    plotnine's build step if ``gg`` was already built)
+
+    Arguments
+    ---------
+    gg : plotnine.ggplot.ggplot
+        ggplot object to draw (built or not, see ``_build_gg``)
+    width : float
+        width of the figure (in inches)
+    height : float
+        height of the figure (in inches)
+    dpi : float
+        dots per inch of the figure
+
+    Returns
+    -------
+    tuple
+        of the matplotlib figure and the drawn copy of the ggplot object
+        (the caller is responsible for closing the figure)
+
+    Notes
+    -----
+    Follows ``ggplot.draw``, after the build step.
+    """
+    plot = gg + p9.theme(figure_size=(width, height), dpi=dpi)
+    if not _is_built_gg(plot):
+        return plot.draw(return_ggplot=True)
+
+    with plot_context(plot):
+        figure, axs = plot._create_figure()
+        plot._setup_parameters()
+        plot.facet.strips.generate()
+        plot._resize_panels()
+
+        plot._draw_layers()
+        plot._draw_labels()
+        plot._draw_breaks_and_labels()
+        plot._draw_legend()
+        plot._draw_title()
+        plot._draw_caption()
+        plot._draw_watermarks()
+
+        plot.theme.apply(figure, axs)
+
+    return figure, plot
+
+def _real_size_out_svg(gg, height, width, dpi, limitsize=True,
+                       return_svg=False):
     """
     Calculate the output size for a plotnine.ggplot object saving as an
     svg
@@ -94,12 +308,15 @@ def _real_size_out_svg(gg, height, width, dpi, limitsize=True):
         logic if plotnine's ggplot.save function should check if the requested
         width and height in inches are greater than 50 (assumes the user
         accidentally entered in these values w.r.t. pixels)
+    return_svg : boolean
+        logic if the rendered svg object should also be returned
 
     Returns
     -------
     tuple
         of the actual height and width (in inches) of the svg image that would
-        be created if the above
+        be created if the above (and the svgutils.transform representation of
+        the image if ``return_svg`` is True)
     """
     img = _raw_gg_to_svg(gg,
                          height=height,
@@ -108,10 +325,239 @@ def _real_size_out_svg(gg, height, width, dpi, limitsize=True):
     # TODO: transform this to getting inches right away?
     new_width, new_height = _transform_size_to_pt(img.get_size())
 
+    if return_svg:
+        return to_inches(new_width, "pt", dpi), \
+            to_inches(new_height, "pt", dpi), img
+
     return to_inches(new_width, "pt", dpi), to_inches(new_height, "pt", dpi)
 
+def _real_size_out_bbox(gg, height, width, dpi, limitsize=True):
+    """
+    Calculate the output size for a plotnine.ggplot object saving as an
+    svg (without creating the svg)
+
+    Notes
+    -----
+    This function returns the same values as ``_real_size_out_svg`` but
+    instead of writing (and parsing) the svg, it draws the plotnine figure
+    and calculates the tight bounding box (which matplotlib's ``savefig``
+    uses for ``bbox_inches="tight"``) with the svg backend's renderer
+    directly. Like ``savefig``, the figure's artists are only laid out and
+    not rendered.
+
+    Arguments
+    ---------
+    gg : plotnine.ggplot.ggplot
+        ggplot object to calculate optimal size
+    height : float
+        desired height of svg output (in inches)
+    width : float
+        desired width of svg output (in inches)
+    dpi : float
+        dots per inch of saved object
+    limitsize : boolean
+        logic if plotnine's ggplot.save function should check if the requested
+        width and height in inches are greater than 25 (assumes the user
+        accidentally entered in these values w.r.t. pixels)
+
+    Returns
+    -------
+    tuple
+        of the actual height and width (in inches) of the svg image that would
+        be created if the above
+    """
+    _check_limitsize(width=width, height=height, limitsize=limitsize)
+
+    fig, plot = _draw_gg(gg, width=width, height=height, dpi=dpi)
+    try:
+        with plot_context(plot):
+            new_width, new_height = _tight_bbox_size_pt(fig)
+    finally:
+        plt.close(fig)
+
+    return to_inches(new_width, "pt", dpi), to_inches(new_height, "pt", dpi)
+
+def _check_limitsize(width, height, limitsize=True):
+    """
+    raise plotnine's error if the requested width or height (in inches) is
+    greater than 25 (and limitsize is True)
+    """
+    if limitsize and (width > 25 or height > 25):
+        raise PlotnineError("Dimensions (width={}, height={}) ".format(width,
+                                                                   height) +\
+                            "exceed 25 inches (height and width are "+\
+                            "specified in inches/cm/mm, not pixels). If you "+\
+                            "are sure you want these dimensions, use "+\
+                            "'limitsize=False'.")
+
+def _tight_bbox_size_pt(fig):
+    """
+    Calculate the size (in pt) of a drawn matplotlib figure if it was saved as
+    an svg with ``bbox_inches="tight"``
+
+    Arguments
+    ---------
+    fig : matplotlib.figure.Figure
+        drawn figure (within the plotnine plot_context if it is a plotnine
+        figure)
+
+    Returns
+    -------
+    tuple
+        width and height of the svg image (in pt)
+    """
+    dpi = fig.dpi
+    canvas = FigureCanvasSVG(fig)
+    renderer = _get_renderer(fig, canvas.print_svg)
+    with renderer._draw_disabled():
+        fig.draw(renderer)
+    bbox = fig.get_tightbbox(renderer).padded(
+        matplotlib.rcParams["savefig.pad_inches"])
+    fig.dpi = dpi # the svg renderer sets the figure's dpi to 72
+
+    # svg's size is defined in pt (72 per inch)
+    return bbox.width * 72, bbox.height * 72
+
+class _live_gg_figure:
+    def __init__(self, gg, width, height, dpi, limitsize=True, resize=True):
+        """
+        (Internal) drawn plotnine figure that can be resized and re-measured
+        (see ``_real_size_out_bbox``) without rebuilding the plot
+
+        Arguments
+        ---------
+        gg : plotnine.ggplot.ggplot
+            ggplot object to draw
+        width : float
+            width of the initial figure (in inches)
+        height : float
+            height of the initial figure (in inches)
+        dpi : float
+            dots per inch of saved object
+        limitsize : boolean
+            logic if plotnine's ggplot.save function should check if the
+            requested width and height in inches are greater than 25
+        resize : boolean
+            logic if the drawn figure should be resized between measurements.
+            If False, each measurement draws the plot from scratch.
+
+        Notes
+        -----
+        Should be used as a context manager (``with _live_gg_figure(...) as
+        live:``), which closes the figure when exiting.
+
+        When resized, plotnine's size dependent layout steps (subplot
+        adjustments, strips, legend, title and caption placement) are
+        redone on the existing figure, in the same order as
+        ``ggplot.draw``. Plots with watermarks or arrows (whose drawing
+        depends on the figure size in other ways) are drawn from scratch
+        for each measurement instead.
+        """
+        self.gg = gg
+        self.dpi = dpi
+        self.limitsize = limitsize
+        self.resizable = resize and len(gg.watermarks) == 0 and \
+            all([getattr(l.geom, "params", {}).get("arrow") is None
+                    for l in gg.layers])
+
+        self.figure = None
+        self.plot = None
+        self.context = None
+        self.size = (width, height)
+
+    def __enter__(self):
+        if self.resizable:
+            width, height = self.size
+            _check_limitsize(width=width, height=height,
+                             limitsize=self.limitsize)
+            self.figure, self.plot = _draw_gg(self.gg, width=width,
+                                              height=height, dpi=self.dpi)
+            self.context = plot_context(self.plot)
+            self.context.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close(self):
+        """
+        close the matplotlib figure (and plotnine's plot context)
+        """
+        if self.context is not None:
+            self.context.__exit__(None, None, None)
+            self.context = None
+        if self.figure is not None:
+            plt.close(self.figure)
+            self.figure = None
+
+    def _resize(self, width, height):
+        """
+        resize figure and redo plotnine's size dependent layout steps
+        """
+        figure, plot = self.figure, self.plot
+        figure.set_size_inches(width, height)
+
+        # subplot parameters when plotnine created the figure
+        figure.subplots_adjust(**{param:
+                                    matplotlib.rcParams["figure.subplot." +
+                                                        param]
+                                  for param in ["left", "right", "bottom",
+                                                "top", "wspace", "hspace"]})
+
+        for name in ["legend_background", "plot_title", "plot_caption"]:
+            artist = figure._themeable.pop(name, None)
+            if artist is not None:
+                artist.remove()
+        for name in ["strip_text_x", "strip_text_y",
+                     "strip_background_x", "strip_background_y"]:
+            for artist in figure._themeable.pop(name, []):
+                artist.remove()
+
+        del plot.facet.strips[:]
+        plot.facet.strips.generate()
+        plot._resize_panels()
+        plot._draw_legend()
+        plot._draw_title()
+        plot._draw_caption()
+        plot.facet.strips.draw()
+        plot.theme.apply(figure, plot.axs)
+
+        self.size = (width, height)
+
+    def measure(self, width, height):
+        """
+        Calculate the output size if the figure was saved as an svg with the
+        requested width and height (see ``_real_size_out_bbox``)
+
+        Arguments
+        ---------
+        width : float
+            requested width (in inches)
+        height : float
+            requested height (in inches)
+
+        Returns
+        -------
+        tuple
+            of the actual width and height (in inches) of the svg image
+        """
+        if not self.resizable:
+            return _real_size_out_bbox(self.gg, height=height, width=width,
+                                       dpi=self.dpi, limitsize=self.limitsize)
+
+        _check_limitsize(width=width, height=height, limitsize=self.limitsize)
+        if (width, height) != self.size:
+            self._resize(width, height)
+
+        new_width, new_height = _tight_bbox_size_pt(self.figure)
+
+        return to_inches(new_width, "pt", self.dpi), \
+            to_inches(new_height, "pt", self.dpi)
+
 def _select_correcting_size_svg(gg, height, width, dpi, limitsize=True,
-                    eps=1e-2, maxIter=20, min_size_px=10, throw_error=True):
+                    eps=1e-2, maxIter=20, min_size_px=10, throw_error=True,
+                    method="affine", return_svg=False, reuse_figure=True,
+                    warm_start=None):
     """
     Obtain the correct input saving size plotnine.ggplot object to actual
     obtain desired height and width (inches)
@@ -129,6 +575,25 @@ def _select_correcting_size_svg(gg, height, width, dpi, limitsize=True,
     It is iterative procedure in nature (the reason for eps and maxIter), eps
     looks at the difference between the desired and obtained height and width.
 
+    Each step measures the output size with ``_real_size_out_bbox`` (no svg
+    is written), the svg object is only created for the accepted size (if
+    ``return_svg`` is True). With ``reuse_figure=True``, the plotnine figure
+    is only built once and then resized for each step (see
+    ``_live_gg_figure``). Plotnine's build step is only computed once (see
+    ``_build_gg``).
+
+    With ``method="affine"``, the first two renders are used to fit the
+    (nearly) affine relationship between requested and obtained size under
+    ``bbox_inches="tight"`` (requested size minus fixed decorations) and the
+    third render checks the fitted size. If that check fails the fixed-point
+    iteration continues from there. All renders count towards ``maxIter``.
+
+    With ``warm_start``, the first requested size assumes the previously
+    observed difference between requested and obtained size (the fixed
+    decorations) is unchanged, instead of starting at the desired size. For
+    ``method="affine"``, the warm start is also used as the first point of
+    the affine model (so the second render already checks a fitted size).
+
     Arguments
     ---------
     gg : plotnine.ggplot.ggplot
@@ -156,6 +621,20 @@ def _select_correcting_size_svg(gg, height, width, dpi, limitsize=True,
         logic if an error should be thrown if the convergence fails. If False,
         then this will return ratios of width_requested/width_obtained,
         height_requested/height_obtained, and a boolean = False.
+    method : str
+        size solver to use, either "affine" (fit an affine model from two
+        renders, then check it) or "fixed_point" (only use the multiplicative
+        fixed-point update)
+    return_svg : boolean
+        logic if the svg object rendered with the returned width and height
+        should also be returned (avoiding another render of the ggplot)
+    reuse_figure : boolean
+        logic if the drawn plotnine figure should be resized between steps
+        (instead of being rebuilt for each step)
+    warm_start : tuple
+        optional (requested, obtained) sizes (each a (width, height) tuple in
+        inches) from a previous solve of the same ggplot object (e.g. for a
+        different desired size)
 
     Returns
     -------
@@ -165,51 +644,139 @@ def _select_correcting_size_svg(gg, height, width, dpi, limitsize=True,
         boolean value (True). if process fails to converge, either this
         functions raises an error (if throw_error is True), or a three value
         tuple of a scaled width_requested/width_obtained,
-        height_requested/height_obtained, and a boolean value (False).
+        height_requested/height_obtained, and a boolean value (False). If
+        ``return_svg`` is True, a fourth value is included, the
+        svgutils.transform object rendered with the returned width and height
+        (None if the process failed to converge).
     """
+    if method not in ["affine", "fixed_point"]:
+        raise ValueError("method must be one of \"affine\" or "+\
+                         "\"fixed_point\"")
+
+    # plotnine's build step doesn't depend on the size
+    gg = _build_gg(gg)
+
     # starting at desired values (a reasonsable starting values)
     desired_width, desired_height = width, height
     current_width, current_height = width, height
+    if warm_start is not None:
+        (start_width, start_height), (obtained_width, obtained_height) = \
+            warm_start
+        current_width += start_width - obtained_width
+        current_height += start_height - obtained_height
+        if current_width <= 0 or current_height <= 0:
+            current_width, current_height = width, height
 
     deltas = [] # how close we've gotten
-    while True:
-        actual_width, actual_height = _real_size_out_svg(gg=gg,
-                                                        height=current_height,
-                                                        width=current_width,
-                                                        dpi=dpi,
-                                                        limitsize=limitsize)
-        current_width *= desired_width / actual_width
-        current_height *= desired_height / actual_height
-        deltas.append(abs(actual_width - desired_width) +
-                      abs(actual_height - desired_height))
-
-        # decisions to terminate interation
-        if deltas[-1] < eps:
-            return current_width, current_height, True
-        elif len(deltas) > maxIter:
-            error_str = "unable to get correct size within "+\
-                                "epsilon and number of interations"
-            break
-        elif current_width * dpi < min_size_px or \
-            current_height * dpi < min_size_px:
-            error_str = "height or width is too small for "+\
-                             "acceptable image"
-            break
+    measured = [] # (requested, obtained) sizes, for the affine model
+    converged = False
+    with _live_gg_figure(gg, width=width, height=height, dpi=dpi,
+                         limitsize=limitsize, resize=reuse_figure) as live:
+        while True:
+            actual_width, actual_height = live.measure(width=current_width,
+                                                       height=current_height)
+            measured.append(((current_width, current_height),
+                             (actual_width, actual_height)))
+
+            # a warm start counts as the first point of the affine model
+            affine_points = measured if warm_start is None \
+                                else [warm_start] + measured
+            if method == "affine" and len(affine_points) == 2:
+                current_width, current_height = \
+                    _affine_size_step(affine_points[0], affine_points[1],
+                                      desired=(desired_width, desired_height))
+            else:
+                current_width *= desired_width / actual_width
+                current_height *= desired_height / actual_height
+            deltas.append(abs(actual_width - desired_width) +
+                          abs(actual_height - desired_height))
+
+            # decisions to terminate interation
+            if deltas[-1] < eps:
+                converged = True
+                break
+            elif len(deltas) > maxIter:
+                error_str = "unable to get correct size within "+\
+                                    "epsilon and number of interations"
+                break
+            elif current_width * dpi < min_size_px or \
+                current_height * dpi < min_size_px:
+                error_str = "height or width is too small for "+\
+                                 "acceptable image"
+                break
+
+    if converged:
+        # the size that created the (accepted) rendered image
+        rendered_width, rendered_height = measured[-1][0]
+        if return_svg:
+            img = _raw_gg_to_svg(gg,
+                                 height=rendered_height,
+                                 width=rendered_width,
+                                 dpi=dpi, limitsize=limitsize)
+            return rendered_width, rendered_height, True, img
+        return rendered_width, rendered_height, True
 
     if throw_error:
         raise StopIteration(error_str)
     else:
-        actual_width, actual_height = _real_size_out_svg(gg=gg,
-                                            height=desired_height,
-                                            width=desired_width,
-                                            dpi=dpi,
-                                            limitsize=limitsize)
+        # first render was made with the desired width and height (or is
+        # shifted to it with the warm start's assumption)
+        (first_width, first_height), (actual_width, actual_height) = \
+            measured[0]
+        actual_width += desired_width - first_width
+        actual_height += desired_height - first_height
+        if return_svg:
+            return desired_width/actual_width, \
+                desired_height/actual_height, \
+                False, None
         return desired_width/actual_width, \
             desired_height/actual_height, \
             False
 
+def _affine_size_step(first, second, desired):
+    """
+    Propose a requested size from an affine fit of two (requested, obtained)
+    size measurements
+
+    Arguments
+    ---------
+    first : tuple
+        tuple of the requested (width, height) and obtained (width, height)
+        sizes (in inches) of the first render
+    second : tuple
+        tuple of the requested (width, height) and obtained (width, height)
+        sizes (in inches) of the second render
+    desired : tuple
+        desired (width, height) of the output (in inches)
+
+    Returns
+    -------
+    tuple
+        proposed (width, height) to request. For each dimension where the
+        affine fit is degenerate (no change in the requested size or a
+        non-positive slope), the fixed-point update from the second
+        measurement is used instead.
+    """
+    proposal = []
+    for d_idx in [0, 1]:
+        requested_1, obtained_1 = first[0][d_idx], first[1][d_idx]
+        requested_2, obtained_2 = second[0][d_idx], second[1][d_idx]
+
+        if requested_2 != requested_1:
+            slope = (obtained_2 - obtained_1) / (requested_2 - requested_1)
+        else:
+            slope = 0
+
+        if slope > 0:
+            proposal.append(requested_2 +
+                            (desired[d_idx] - obtained_2) / slope)
+        else:
+            proposal.append(requested_2 * desired[d_idx] / obtained_2)
+
+    return proposal[0], proposal[1]
+
 def gg_to_svg(gg, width, height, dpi, limitsize=True,
-              eps=1e-2, maxIter=20, min_size_px=10):
+              eps=1e-2, maxIter=20, min_size_px=10, method="affine"):
     """
     Convert plotnine ggplot figure to svg and return it (with close to perfect
     sizing).
@@ -237,7 +804,9 @@ def gg_to_svg(gg, width, height, dpi, limitsize=True,
     min_size_px : int
         early stopping rule if converging height or width has a pixel size
         smaller than or equal to this value (assumes process will not converge)
-
+    method : str
+        size solver to use, either "affine" or "fixed_point" (see
+        ``_select_correcting_size_svg``)
 
     Returns
     -------
@@ -250,19 +819,16 @@ def gg_to_svg(gg, width, height, dpi, limitsize=True,
     and truly influenced by svgutils.transform.from_mpl function.
     """
     correct_width_in, \
-        correct_height_in, _ = _select_correcting_size_svg(gg=gg,
+        correct_height_in, _, svg = _select_correcting_size_svg(gg=gg,
                                                        height=height,
                                                        width=width,
                                                        dpi=dpi,
                                                        limitsize=limitsize,
                                                        maxIter=maxIter,
                                                        eps=eps,
-                                                       min_size_px=min_size_px)
-
-    svg = _raw_gg_to_svg(gg,
-                    width=correct_width_in,
-                    height=correct_height_in,
-                    dpi=dpi)
+                                                       min_size_px=min_size_px,
+                                                       method=method,
+                                                       return_svg=True)
 
     current_size_raw = svg.get_size()
     current_size = _transform_size_to_pt(current_size_raw)
@@ -314,19 +880,28 @@ def mpt_to_svg(gg, width, height, dpi):
     # if width and height aren't defined (does that belong here.)
     raise ValueError("Todo: impliment")
 
-_file_options = ["pdf", "png", "ps", "eps", "jpg", "jpeg", "svg"]
+_file_options = ["pdf", "png", "ps", "eps", "jpg", "jpeg", "svg", "svgz",
+                 "webp", "tiff", "tif"]
+_raster_file_options = ["png", "jpg", "jpeg", "webp", "tiff", "tif"]
+_pil_formats = {"png": "PNG", "jpg": "JPEG", "jpeg": "JPEG", "webp": "WEBP",
+                "tiff": "TIFF", "tif": "TIFF"}
 
 def _save_svg_wrapper(svg, filename, width, height, dpi=300,
-                      _format=None, verbose=True):
+                      _format=None, verbose=True, minify=False,
+                      precision=None, max_workers=None, quality=None,
+                      subsampling=None, tile_rows=None):
     """
     save svg object to a range of different file names
 
     Arguments
     ---------
-    svg: svgutils.transform.SVGFigure
-        svg object to save
-    filename : str
-        local string to save the file to (this can also be at least io.BytesIO)
+    svg: svgutils.transform.SVGFigure or function
+        svg object to save. This can also be a function that streams the svg
+        to a file name or binary file object (its only argument), see Notes.
+    filename : str or list
+        local string to save the file to (this can also be at least
+        io.BytesIO). This can also be a list of file names (and file
+        objects), in which case the svg object is saved to each of them.
     width : float
         width of output image in inches (this should actually be associated
         with the svg...)
@@ -335,78 +910,761 @@ def _save_svg_wrapper(svg, filename, width, height, dpi=300,
         with the svg...)
     dpi : int or float
         dots per square inch, default is 300
-    _format : str
+    _format : str or list
         string of format (error tells options). If provided this is the format
-        used, if None, then we'll try to use the filename extension.
+        used, if None, then we'll try to use the filename extension. If
+        ``filename`` is a list, this can be a list of formats (or None
+        values) for each file.
     verbose : bool
             If `True`, print the saving information.
+    minify : bool
+        If `True`, the svg object is minified before saving (see
+        ``_minify_svg``), and the number of bytes saved is included in the
+        saving information.
+    precision : int
+        number of decimals of coordinates if ``minify`` is True (see
+        ``_minify_svg``)
+    max_workers : int
+        maximum number of threads used to convert the svg into the requested
+        pdf, ps, eps and raster files at the same time. If None, cowpatch's
+        rcParams's ``max_workers`` is used.
+    quality : int
+        quality of jpeg and webp files (see ``_save_image``)
+    subsampling : int or str
+        chroma subsampling of jpeg files (see ``_save_image``)
+    tile_rows : int
+        If not None, png and tiff files are rasterized in tiles of
+        ``tile_rows`` pixel rows (see ``_convert_svg_bytes_tiled``), with up
+        to ``max_workers`` worker processes.
+
+    Returns
+    -------
+    None
+        saves to a file
+
+    Notes
+    -----
+    If ``svg`` is a function, svg files are written directly by the function
+    (without holding the complete svg object in memory). For other formats
+    (or multiple files), the streamed svg is collected into bytes once before
+    being converted. The function is responsible for its own minification.
+
+    svgz files (gzip compressed svgs) are compressed while the svg is
+    written, the uncompressed svg is never stored as a whole.
+
+    With multiple files, the svg object is minified and serialized once for
+    all of them.
+    """
+    if type(filename) is list:
+        filenames = filename
+    else:
+        filenames = [filename]
+
+    if type(_format) is list:
+        if len(_format) != len(filenames):
+            raise ValueError("_format must have a format for each file name")
+        formats = _format
+    else:
+        formats = [_format] * len(filenames)
+
+    formats = [_file_format(f, _format=inner_format)
+                    for f, inner_format in zip(filenames, formats)]
+
+    # verbosity
+    if verbose:
+        warnings.warn("Saving {0:,.2g} x {1:,.2g} inch image.".format(
+             width, height), CowpatchWarning)
+        for f in filenames:
+            warnings.warn('Filename: {}'.format(f), CowpatchWarning)
+
+    if minify and not callable(svg):
+        # (both sizes are of the svg without indentation, as minified svgs
+        # are written)
+        if verbose:
+            num_bytes = len(etree.tostring(svg.root, xml_declaration=True,
+                                           standalone=True,
+                                           encoding="ASCII"))
+        _minify_svg(svg, precision=precision)
+        if verbose:
+            num_bytes_saved = num_bytes - len(
+                etree.tostring(svg.root, xml_declaration=True,
+                               standalone=True, encoding="ASCII"))
+            warnings.warn("Minified svg: {0:,} bytes saved ({1:.0%}).".format(
+                num_bytes_saved, num_bytes_saved / num_bytes),
+                CowpatchWarning)
+
+    convert_formats = [f for f in formats if f not in ["svg", "svgz"]]
+
+    # the svg's bytes are only created once (if needed)
+    base_image_string = None
+    if callable(svg) and len(filenames) > 1:
+        svg_fid = io.BytesIO()
+        svg(svg_fid)
+        base_image_string = svg_fid.getvalue()
+        svg = base_image_string
+    elif len(convert_formats) > 0:
+        if callable(svg):
+            svg_fid = io.BytesIO()
+            svg(svg_fid)
+            base_image_string = svg_fid.getvalue()
+        else:
+            base_image_string = svg.to_str()
+
+    # svg files
+    for f, inner_format in zip(filenames, formats):
+        if inner_format in ["svg", "svgz"]:
+            _write_svg_file(svg, f, _format=inner_format, minify=minify)
+
+    # converted files (which can be converted at the same time)
+    converts = [(f, inner_format) for f, inner_format in zip(filenames, formats)
+                    if inner_format not in ["svg", "svgz"]]
+    if len(converts) == 0:
+        return None
+
+    if max_workers is None:
+        max_workers = rcParams["max_workers"]
+
+    if tile_rows is not None:
+        # (tiles of each file are rendered in parallel instead of files)
+        for f, inner_format in converts:
+            if inner_format in _tiled_file_options:
+                _convert_svg_bytes_tiled(base_image_string, f,
+                                         _format=inner_format,
+                                         width=width, height=height, dpi=dpi,
+                                         tile_rows=tile_rows,
+                                         max_workers=max_workers)
+        converts = [(f, inner_format) for f, inner_format in converts
+                        if inner_format not in _tiled_file_options]
+        max_workers = 1
+
+    def _convert(f_and_format):
+        return _convert_svg_bytes(base_image_string, f_and_format[0],
+                                  _format=f_and_format[1],
+                                  width=width, height=height, dpi=dpi,
+                                  quality=quality, subsampling=subsampling)
+
+    if max_workers > 1 and len(converts) > 1:
+        # (cairo's drawing doesn't hold python's global interpreter lock)
+        with ThreadPoolExecutor(
+                max_workers=min(max_workers, len(converts))) as executor:
+            list(executor.map(_convert, converts))
+    else:
+        for f_and_format in converts:
+            _convert(f_and_format)
+
+def _save_image_wrapper(image, filename, width, height, dpi=300,
+                        _format=None, verbose=True, quality=None,
+                        subsampling=None):
+    """
+    save raster image to a range of different (raster) file names
+
+    Arguments
+    ---------
+    image: PIL.Image.Image
+        RGB image to save
+    filename : str or list
+        local string to save the file to (this can also be at least
+        io.BytesIO), or a list of them
+    width : float
+        width of output image in inches
+    height : float
+        height of output image in inches
+    dpi : int or float
+        dots per square inch of the image, default is 300
+    _format : str or list
+        string of format (one of ``_raster_file_options``). If None, then
+        we'll try to use the filename extension (see ``_save_svg_wrapper``).
+    verbose : bool
+        If `True`, print the saving information.
+    quality : int
+        quality of jpeg and webp files (see ``_save_image``)
+    subsampling : int or str
+        chroma subsampling of jpeg files (see ``_save_image``)
 
     Returns
     -------
     None
         saves to a file
     """
+    if type(filename) is list:
+        filenames = filename
+    else:
+        filenames = [filename]
+
+    if type(_format) is list:
+        if len(_format) != len(filenames):
+            raise ValueError("_format must have a format for each file name")
+        formats = _format
+    else:
+        formats = [_format] * len(filenames)
+
+    formats = [_file_format(f, _format=inner_format)
+                    for f, inner_format in zip(filenames, formats)]
+
+    if np.any([f not in _raster_file_options for f in formats]):
+        raise ValueError("format / end of file name must be one of\n{}".format(
+            _raster_file_options))
+
+    if verbose:
+        warnings.warn("Saving {0:,.2g} x {1:,.2g} inch image.".format(
+             width, height), CowpatchWarning)
+        for f in filenames:
+            warnings.warn('Filename: {}'.format(f), CowpatchWarning)
+
+    for f, inner_format in zip(filenames, formats):
+        _save_image(image, f, _format=inner_format, dpi=dpi, quality=quality,
+                    subsampling=subsampling)
 
-    # format checking
+def _save_image(image, filename, _format, dpi=300, quality=None,
+                subsampling=None):
+    """
+    (Internal) encode a raster image into a file
+
+    Arguments
+    ---------
+    image: PIL.Image.Image
+        RGB (or RGBA) image to save
+    filename : str
+        local string to save the file to (this can also be at least
+        io.BytesIO)
+    _format : str
+        format of the file (one of ``_raster_file_options``)
+    dpi : int or float
+        dots per square inch of the image (stored in the file)
+    quality : int
+        quality of jpeg (1 to 95) and webp (1 to 100) files. If None, PIL's
+        default is used.
+    subsampling : int or str
+        chroma subsampling of jpeg files (0 or "4:4:4", 1 or "4:2:2", 2 or
+        "4:2:0"). If None, PIL's default is used.
+    """
+    options = dict()
+    if quality is not None and _format in ["jpg", "jpeg", "webp"]:
+        options["quality"] = quality
+    if subsampling is not None and _format in ["jpg", "jpeg"]:
+        options["subsampling"] = subsampling
+
+    if _format in ["jpg", "jpeg"] and image.mode != "RGB":
+        # (jpeg has no transparency, the svg's background is white)
+        image = image.convert("RGB")
+
+    image.save(filename, format=_pil_formats[_format], dpi=(dpi, dpi),
+               **options)
+
+def _svg_bytes_to_image(base_image_string, width=None, height=None, dpi=300):
+    """
+    (Internal) rasterize svg bytes into an image (with cairosvg, without
+    encoding the image)
+
+    Arguments
+    ---------
+    base_image_string : bytes
+        svg to rasterize
+    width : float
+        width of output image in inches. If width and height are None, the
+        image has the svg's own size (in pixels, at 96 dpi).
+    height : float
+        height of output image in inches
+    dpi : int or float
+        dots per square inch
+
+    Returns
+    -------
+    PIL.Image.Image
+        RGBA image
+
+    Notes
+    -----
+    The pixels are read directly from the cairo image surface that cairosvg
+    draws on (instead of through a png file).
+    """
+    tree = cairosvg.parser.Tree(bytestring=base_image_string)
+    if width is None and height is None:
+        surface = cairosvg.surface.PNGSurface(tree, output=None, dpi=96)
+    else:
+        scale = dpi / 96
+        surface = cairosvg.surface.PNGSurface(tree, output=None, dpi=96,
+                                          scale=scale,
+                                          output_width=width * 96 * scale,
+                                          output_height=height * 96 * scale)
+    cairo_surface = surface.cairo
+    cairo_surface.flush()
+    mode, raw_mode = _cairo_argb32_modes[sys.byteorder]
+    image = Image.frombuffer(mode,
+                             (cairo_surface.get_width(),
+                              cairo_surface.get_height()),
+                             bytes(cairo_surface.get_data()),
+                             "raw", raw_mode, cairo_surface.get_stride(), 1)
+    surface.finish()
+
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+
+    return image
+
+# PIL (image mode, raw mode) of cairo's ARGB32 pixels (premultiplied alpha,
+# native endian words) w.r.t. the machine's byte order
+_cairo_argb32_modes = {"little": ("RGBA", "BGRa"),
+                       "big": ("RGBa", "aRGB")}
+
+def _file_format(filename, _format=None):
+    """
+    (Internal) format of a file to save to
+
+    Arguments
+    ---------
+    filename : str
+        local string to save the file to (or a file object if ``_format`` is
+        provided)
+    _format : str
+        string of format. If None, the ``filename`` extension is used.
+
+    Returns
+    -------
+    str
+        lower case format (one of ``_file_options``)
+    """
     if _format is None:
-        dot_ending = re.findall("\\..+$", filename)[0]
-        _format = re.sub("\\.", "", dot_ending)
+        if type(filename) is not str:
+            raise ValueError("_format must be provided to save to a file "+\
+                             "object")
+        extension = re.findall("\\.([^./\\\\]+)$", filename)
+        if len(extension) == 0:
+            raise ValueError("file name has no extension, _format must be "+\
+                             "provided")
+        _format = extension[0]
 
     _format = _format.lower()
 
     if _format not in _file_options:
         raise ValueError("format / end of file name must be one of\n{}".format(_file_options))
 
-    # verbosity
-    if verbose:
-        warnings.warn("Saving {0:,.2g} x {1:,.2g} inch image.".format(
-             width, height), CowpatchWarning)
-        warnings.warn('Filename: {}'.format(filename), CowpatchWarning)
+    return _format
 
+def _write_svg_file(svg, filename, _format="svg", minify=False):
+    """
+    (Internal) write an svg (or svgz) file
 
+    Arguments
+    ---------
+    svg: svgutils.transform.SVGFigure, function or bytes
+        svg object to save (see ``_save_svg_wrapper``), or its bytes
+    filename : str
+        local string to save the file to (this can also be a binary file
+        object)
+    _format : str
+        "svg" or "svgz" (gzip compressed svg)
+    minify : bool
+        logic if the svg object was minified (which is then written without
+        indentation)
+    """
+    if _format == "svgz":
+        # (mtime=0 so the same svg creates the same file)
+        if type(filename) is str:
+            fid = gzip.GzipFile(filename, mode="wb", mtime=0)
+        else:
+            fid = gzip.GzipFile(fileobj=filename, mode="wb", mtime=0)
+    else:
+        fid = filename
 
-    if _format == "svg":
-        svg.save(filename)
-    elif _format == "pdf":
-        base_image_string = svg.to_str()
+    try:
+        if type(svg) is bytes:
+            if type(fid) is str:
+                with open(fid, "wb") as inner_fid:
+                    inner_fid.write(svg)
+            else:
+                fid.write(svg)
+        elif callable(svg):
+            svg(fid)
+        elif minify or _format == "svgz" or type(fid) is not str:
+            # (svgutils's save only takes file names)
+            with etree.xmlfile(fid, encoding="ASCII") as xf:
+                xf.write_declaration(standalone=True)
+                xf.write(svg.root, pretty_print=not minify)
+        else:
+            svg.save(fid)
+    finally:
+        if _format == "svgz":
+            fid.close()
+
+def _convert_svg_bytes(base_image_string, filename, _format, width, height,
+                       dpi=300, quality=None, subsampling=None):
+    """
+    (Internal) convert svg bytes into a pdf, ps, eps or raster file
+
+    Arguments
+    ---------
+    base_image_string : bytes
+        svg to convert
+    filename : str
+        local string to save the file to (this can also be at least io.BytesIO)
+    _format : str
+        format of the file (see ``_file_options``)
+    width : float
+        width of output image in inches
+    height : float
+        height of output image in inches
+    dpi : int or float
+        dots per square inch (for raster formats)
+    quality : int
+        quality of jpeg and webp files (see ``_save_image``)
+    subsampling : int or str
+        chroma subsampling of jpeg files (see ``_save_image``)
+    """
+    if _format == "pdf":
         cairosvg.svg2pdf(bytestring=base_image_string,
                  write_to=filename,
                  output_width=width * 96,
                  output_height=height * 96)
     elif _format == "ps":
-        base_image_string = svg.to_str()
         cairosvg.svg2ps(bytestring=base_image_string,
                         write_to=filename,
                         output_width=width * 96,
                         output_height=height * 96)
     elif _format == "eps":
-        base_image_string = svg.to_str()
         cairosvg.svg2eps(bytestring=base_image_string,
                          write_to=filename,
                          output_width=width * 96,
                          output_height=height * 96)
-    else: # raster
-        base_image_string = svg.to_str()
-
+    elif _format == "png":
         if dpi != 96:
             scale = dpi / 96
         else:
             scale = 1
 
-        if _format == "png":
-            cairosvg.svg2png(bytestring=base_image_string,
-                 write_to=filename, scale=scale,
-                 output_width=width * 96 * scale,
-                 output_height=height * 96 * scale)
-        elif _format == "jpeg" or _format == "jpg":
-            fid = io.BytesIO()
-            out_bytes = cairosvg.svg2png(bytestring=base_image_string,
-                                         write_to=fid,
-                                         scale=scale,
-                                         output_width=width * 96 * scale,
-                                         output_height=height * 96 * scale)
-            img_png = Image.open(io.BytesIO(fid.getvalue()))
-            img_png.save(filename)
+        cairosvg.svg2png(bytestring=base_image_string,
+             write_to=filename, scale=scale,
+             output_width=width * 96 * scale,
+             output_height=height * 96 * scale)
+    else: # other raster formats (from the pixels, without a png)
+        image = _svg_bytes_to_image(base_image_string, width=width,
+                                    height=height, dpi=dpi)
+        _save_image(image, filename, _format=_format, dpi=dpi,
+                    quality=quality, subsampling=subsampling)
+
+_tiled_file_options = ["png", "tiff", "tif"]
+
+# svg being tiled by a (forked) worker process of _convert_svg_bytes_tiled
+# (only set in worker processes, see _pool_init_tile_svg)
+_tile_svg = None
+
+def _convert_svg_bytes_tiled(base_image_string, filename, _format, width,
+                             height, dpi=300, tile_rows=1024,
+                             max_workers=None):
+    """
+    (Internal) convert svg bytes into a png or tiff file, one tile of rows at
+    a time
+
+    Arguments
+    ---------
+    base_image_string : bytes
+        svg to convert
+    filename : str
+        local string to save the file to (this can also be at least io.BytesIO)
+    _format : str
+        format of the file (one of ``_tiled_file_options``)
+    width : float
+        width of output image in inches
+    height : float
+        height of output image in inches
+    dpi : int or float
+        dots per square inch
+    tile_rows : int
+        number of pixel rows of each tile
+    max_workers : int
+        maximum number of worker processes rendering tiles at the same time.
+        If None, cowpatch's rcParams's ``max_workers`` is used.
+
+    Notes
+    -----
+    Each tile spans the full width of the image and is rendered with cairosvg
+    by restricting the svg's ``viewBox`` to the tile's rows. The tiles' rows
+    are passed to the png or tiff encoder as soon as they are rendered, so
+    that (beyond the svg itself) only a few tiles are held in memory.
+
+    The svg is parsed and serialized once, only the root's start tag (with
+    the tile's ``viewBox``, ``width`` and ``height``) is rewritten per tile.
+    cairosvg still parses (and clips) the whole document for each tile, so
+    the run time grows with the number of tiles times the size of the svg.
+
+    Worker processes are forked (after the svg is serialized) and receive
+    the serialized svg from the pool's initializer, so that concurrent
+    conversions don't share any state. If forking isn't available, the tiles
+    are rendered in this process (with a warning).
+    """
+    if max_workers is None:
+        max_workers = rcParams["max_workers"]
+
+    width_px = int(np.round(width * dpi))
+    height_px = int(np.round(height * dpi))
+
+    root = etree.fromstring(base_image_string,
+                            parser=etree.XMLParser(huge_tree=True))
+    if root.get("viewBox") is not None:
+        viewbox = [float(v) for v in
+                    re.split(r"[\s,]+", root.get("viewBox").strip())]
+    else:
+        # (user units are pixels, at 96 dpi)
+        viewbox = [0, 0, width * 96, height * 96]
+    root.set("preserveAspectRatio", "none")
+
+    # serialize once, leaving placeholders for the root's per tile attributes
+    for attr in ["viewBox", "width", "height"]:
+        root.set(attr, "{%s}" % attr)
+    svg_bytes = etree.tostring(root)
+    del root
+    head_end = svg_bytes.index(b">", svg_bytes.index(b"{height}")) + 1
+    head = svg_bytes[:head_end].decode("utf-8").replace("{", "{{").\
+            replace("}", "}}")
+    for attr in ["viewBox", "width", "height"]:
+        head = head.replace("{{%s}}" % attr, "{%s}" % attr)
+
+    tiles = [(row_start, min(tile_rows, height_px - row_start))
+                for row_start in range(0, height_px, tile_rows)]
+
+    if max_workers > 1 and len(tiles) > 1 and \
+        "fork" not in multiprocessing.get_all_start_methods():
+        warnings.warn("forked worker processes aren't available on this "+\
+                      "platform, rendering tiles in serial",
+                      CowpatchWarning)
+        max_workers = 1
+
+    if _format == "png":
+        def _write(fid, row_chunks):
+            _write_png_rows(fid, width_px, height_px, row_chunks, dpi=dpi)
+    else:
+        def _write(fid, row_chunks):
+            _write_tiff_rows(fid, width_px, height_px, tile_rows,
+                             row_chunks, dpi=dpi)
+
+    tile_svg = (head, svg_bytes[head_end:], viewbox, width_px, height_px)
+
+    if hasattr(filename, "write"):
+        fid = filename
+    else:
+        fid = open(filename, "wb")
+
+    try:
+        if max_workers > 1 and len(tiles) > 1:
+            with ProcessPoolExecutor(
+                    max_workers=min(max_workers, len(tiles)),
+                    mp_context=multiprocessing.get_context("fork"),
+                    initializer=_pool_init_tile_svg,
+                    initargs=(tile_svg,)) as pool:
+                _write(fid, _bounded_ordered_map(pool, _pool_svg_tile_rows,
+                                                 tiles,
+                                                 max_pending=2*max_workers))
+        else:
+            _write(fid, (_svg_tile_rows(tile_svg, *tile) for tile in tiles))
+    finally:
+        if fid is not filename:
+            fid.close()
+
+def _bounded_ordered_map(pool, fn, args_list, max_pending):
+    """
+    (Internal) map a function across arguments with a worker pool, yielding
+    the outputs in order with at most ``max_pending`` outstanding outputs
+
+    Arguments
+    ---------
+    pool : concurrent.futures.Executor
+        worker pool
+    fn : function
+        function to apply
+    args_list : list
+        list of argument tuples
+    max_pending : int
+        maximum number of submitted (and not yet yielded) arguments
+
+    Returns
+    -------
+    generator
+        outputs of ``fn`` (in the order of ``args_list``)
+    """
+    pending = collections.deque()
+    for args in args_list:
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+        pending.append(pool.submit(fn, *args))
+
+    while len(pending) > 0:
+        yield pending.popleft().result()
+
+def _pool_init_tile_svg(tile_svg):
+    """
+    (Internal) worker process initializer of ``_convert_svg_bytes_tiled``,
+    stores the svg being tiled in the worker process
+    """
+    global _tile_svg
+    _tile_svg = tile_svg
+
+def _pool_svg_tile_rows(row_start, num_rows):
+    """
+    (Internal) worker process function of ``_convert_svg_bytes_tiled`` (see
+    ``_svg_tile_rows``)
+    """
+    return _svg_tile_rows(_tile_svg, row_start, num_rows)
+
+def _svg_tile_rows(tile_svg, row_start, num_rows):
+    """
+    (Internal) rasterize rows of the svg being tiled
+
+    Arguments
+    ---------
+    tile_svg : tuple
+        svg being tiled (see ``_convert_svg_bytes_tiled``), the head of the
+        serialized svg (with placeholders for the root's ``viewBox``,
+        ``width`` and ``height``), the rest of it, the svg's viewBox and the
+        width and height of the image in pixels
+    row_start : int
+        first pixel row of the tile
+    num_rows : int
+        number of pixel rows of the tile
+
+    Returns
+    -------
+    bytes
+        RGBA pixels of the tile's rows
+    """
+    head, tail, viewbox, width_px, height_px = tile_svg
+    row_height = viewbox[3] / height_px
+
+    head = head.format(viewBox=" ".join(["%r" % v for v in
+                            [viewbox[0], viewbox[1] + row_start * row_height,
+                             viewbox[2], num_rows * row_height]]),
+                       width="%ipx" % width_px,
+                       height="%ipx" % num_rows)
+
+    image = _svg_bytes_to_image(head.encode("utf-8") + tail)
+    if image.size != (width_px, num_rows):
+        raise ValueError("tile rendered with size {} instead of {}".format(
+                            image.size, (width_px, num_rows)))
+    return image.tobytes()
+
+def _write_png_rows(fid, width_px, height_px, row_chunks, dpi=300):
+    """
+    (Internal) write a RGBA png file from chunks of pixel rows
+
+    Arguments
+    ---------
+    fid : file object
+        binary file object to write to
+    width_px : int
+        width of the image in pixels
+    height_px : int
+        height of the image in pixels
+    row_chunks : iterable
+        bytes of consecutive RGBA pixel rows (compressed and written as they
+        are obtained)
+    dpi : int or float
+        dots per square inch of the image (stored in the file)
+    """
+    def _chunk(tag, data):
+        fid.write(struct.pack(">I", len(data)) + tag + data +\
+                  struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff))
+
+    fid.write(b"\x89PNG\r\n\x1a\n")
+    _chunk(b"IHDR", struct.pack(">IIBBBBB", width_px, height_px, 8, 6,
+                                0, 0, 0))
+    pixels_per_meter = int(np.round(dpi / .0254))
+    _chunk(b"pHYs", struct.pack(">IIB", pixels_per_meter, pixels_per_meter,
+                                1))
+
+    row_bytes = width_px * 4
+    compressor = zlib.compressobj()
+    for rows in row_chunks:
+        # (each row starts with its filter type, 0: none)
+        data = compressor.compress(b"".join(
+                    [b"\x00" + rows[start:(start + row_bytes)]
+                        for start in range(0, len(rows), row_bytes)]))
+        if len(data) > 0:
+            _chunk(b"IDAT", data)
+    _chunk(b"IDAT", compressor.flush())
+    _chunk(b"IEND", b"")
+
+def _write_tiff_rows(fid, width_px, height_px, rows_per_strip, row_chunks,
+                     dpi=300):
+    """
+    (Internal) write a RGBA (deflate compressed) tiff file from chunks of
+    pixel rows
+
+    Arguments
+    ---------
+    fid : file object
+        binary (seekable) file object to write to
+    width_px : int
+        width of the image in pixels
+    height_px : int
+        height of the image in pixels
+    rows_per_strip : int
+        number of pixel rows in each chunk (except the last one)
+    row_chunks : iterable
+        bytes of consecutive RGBA pixel rows (each chunk is compressed and
+        written as a tiff strip as it is obtained)
+    dpi : int or float
+        dots per square inch of the image (stored in the file)
+
+    Notes
+    -----
+    The image file directory is written after the strips, and the header is
+    updated to point to it at the end.
+    """
+    start = fid.tell()
+    fid.write(b"II*\x00" + struct.pack("<I", 0))
+
+    strip_offsets = []
+    strip_byte_counts = []
+    for rows in row_chunks:
+        data = zlib.compress(rows)
+        strip_offsets.append(fid.tell() - start)
+        strip_byte_counts.append(len(data))
+        fid.write(data)
+
+    if (fid.tell() - start) % 2 == 1:
+        fid.write(b"\x00")
+    ifd_offset = fid.tell() - start
+    if ifd_offset > 2**32 - 2**20:
+        raise ValueError("compressed image is too large for a tiff file "+\
+                         "(over 4GB)")
+
+    resolution = [int(np.round(dpi * 1000)), 1000]
+    # (tag, field type (3: short, 4: long, 5: rational), values)
+    entries = [(256, 4, [width_px]),
+               (257, 4, [height_px]),
+               (258, 3, [8, 8, 8, 8]),
+               (259, 3, [8]), # deflate
+               (262, 3, [2]), # rgb
+               (273, 4, strip_offsets),
+               (277, 3, [4]),
+               (278, 4, [rows_per_strip]),
+               (279, 4, strip_byte_counts),
+               (282, 5, resolution),
+               (283, 5, resolution),
+               (296, 3, [2]), # inches
+               (338, 3, [2])] # unassociated alpha
+
+    extra_offset = ifd_offset + 2 + 12 * len(entries) + 4
+    ifd = struct.pack("<H", len(entries))
+    extra = b""
+    for tag, field_type, values in entries:
+        value_bytes = struct.pack("<%i%s" % (len(values),
+                                             "H" if field_type == 3 else "I"),
+                                  *values)
+        count = len(values) // 2 if field_type == 5 else len(values)
+        if len(value_bytes) <= 4:
+            ifd += struct.pack("<HHI", tag, field_type, count) +\
+                value_bytes.ljust(4, b"\x00")
+        else:
+            ifd += struct.pack("<HHII", tag, field_type, count,
+                               extra_offset + len(extra))
+            extra += value_bytes
+    ifd += struct.pack("<I", 0)
+    fid.write(ifd + extra)
+
+    end = fid.tell()
+    fid.seek(start + 4)
+    fid.write(struct.pack("<I", ifd_offset))
+    fid.seek(end)
 
 def _show_image(svg, width, height, dpi=300, verbose=True):
     """
@@ -471,6 +1729,7 @@ def _show_image(svg, width, height, dpi=300, verbose=True):
 def _uniquify_svg_safe(svg_obj, str_update):
     """
     Update svg code to 'uniquify' svg but by making sure 'url(#___)'
+    and 'href="#___"' references (and the referenced ids) are updated
 
     Arguments
     ---------
@@ -482,33 +1741,74 @@ def _uniquify_svg_safe(svg_obj, str_update):
     Return
     ------
     svg_obj : svg object
-        updated svg object, svgutils.transform.SVGFigure
-
+        updated svg object, svgutils.transform.SVGFigure (the same object as
+        the input, which is updated in place)
 
     Details
     -------
-    Internally this function calls "_uniquify_svg_str_safe" for
-    the vast majority of the heavy lifting
+    The attributes of the underlying lxml tree are updated in place (see
+    ``_uniquify_svg_str_safe`` for the string version), which avoids
+    copying, serializing and re-parsing the svg. Only the attributes with
+    references and the elements with ids are updated.
     """
-
-    # string collection
-    inner_svg = copy.deepcopy(svg_obj)
-    svg_str = str(inner_svg.to_str())
-
-    # updating string
-    updated_svg_str = _uniquify_svg_str_safe(svg_str, str_update=str_update)
-
-    # need to identify start and end of svg to re-convert it to and svg_object
-    start = re.search("<svg", updated_svg_str)
-    end = re.search("</svg>", updated_svg_str)
-
-    updated_end_svg = sg.fromstring(updated_svg_str[start.start():end.end()])
-
-    return updated_end_svg
+    # single walk over the elements to collect references and ids
+    url_attributes = [] # (element, attribute name, value)
+    href_attributes = []
+    id_elements = []
+    for element in svg_obj.root.iter("*"):
+        for name, value in element.items():
+            if "url(#" in value:
+                url_attributes.append((element, name, value))
+            elif value.startswith("#") and name.endswith("href"):
+                href_attributes.append((element, name, value))
+            elif name == "id":
+                id_elements.append(element)
+
+    # identify which ids are referenced and must be extended
+    ids_to_extend = set([value[1:] for _, _, value in href_attributes])
+    for value in set([value for _, _, value in url_attributes]):
+        ids_to_extend.update(_svg_id_reference_regexes[0].findall(value))
+
+    if len(ids_to_extend) == 0:
+        return svg_obj
+
+    new_ids = {old_id_name: old_id_name + str_update
+                for old_id_name in ids_to_extend}
+
+    def _extend_id(match):
+        prefix, old_id_name, suffix = match.groups()
+        return prefix + new_ids.get(old_id_name, old_id_name) + suffix
+
+    # (many attributes share the same value, e.g. clip paths)
+    new_values = dict()
+    for element, name, value in url_attributes:
+        new_value = new_values.get(value)
+        if new_value is None:
+            new_value = _svg_id_regexes[1].sub(_extend_id, value)
+            new_values[value] = new_value
+        element.set(name, new_value)
+    for element, name, value in href_attributes:
+        element.set(name, "#" + new_ids[value[1:]])
+    for element in id_elements:
+        old_id_name = element.get("id")
+        if old_id_name in new_ids:
+            element.set("id", new_ids[old_id_name])
+
+    return svg_obj
+
+# references to ids (``url(#id)`` and ``xlink:href="#id"``) and the ids
+# themselves (``id="id"``). Each pattern starts with a literal (alternations
+# of the prefixes are much slower to scan with python's re module)
+_svg_id_reference_regexes = [re.compile(r'url\(#([\w.:-]+)\)'),
+                             re.compile(r'xlink:href="#([\w.:-]+)"')]
+_svg_id_regexes = [re.compile(r'(id=")([\w.:-]+)(")'),
+                   re.compile(r'(url\(#)([\w.:-]+)(\))'),
+                   re.compile(r'(xlink:href="#)([\w.:-]+)(")')]
 
 def _uniquify_svg_str_safe(svg_str, str_update):
     """
     Update svg code to 'uniquify' svg but by making sure 'url(#___)'
+    and 'xlink:href="#___"' references (and the referenced ids) are updated
 
     Arguments
     ---------
@@ -521,27 +1821,294 @@ def _uniquify_svg_str_safe(svg_str, str_update):
     ------
     svg_str : str
         updated svg code
+
+    Notes
+    -----
+    Only ids that are referenced are updated. Each kind of reference (and
+    the ids) is updated in a single scan of the string with a lookup table,
+    so the cost is linear in the length of the string (and doesn't grow
+    with the number of ids).
     """
 
-    # identify which ids are linked to "url(#___)" and must be extended
-    ids_to_extend = \
-        np.unique(
-            [re.sub("(url\(\#)|(\))", "", x)
-             for x in re.findall("url\(\#[A-Za-z0-9\_]+\)", svg_str)])
+    # identify which ids are referenced and must be extended
+    ids_to_extend = set()
+    for reference_regex in _svg_id_reference_regexes:
+        ids_to_extend.update(reference_regex.findall(svg_str))
 
+    if len(ids_to_extend) == 0:
+        return svg_str
 
-    for old_id_name in ids_to_extend:
-        new_id_name = old_id_name + str_update
-        # id
-        svg_str = re.sub("id=\"{0}\"".format(old_id_name),
-                       "id=\"{0}\"".format(new_id_name),
-                       svg_str)
+    new_ids = {old_id_name: old_id_name + str_update
+                for old_id_name in ids_to_extend}
 
-        # url(#)
-        svg_str = re.sub("url\(\#{0}\)".format(old_id_name),
-                      "url(#{0})".format(new_id_name),
-                       svg_str)
+    def _extend_id(match):
+        prefix, old_id_name, suffix = match.groups()
+        return prefix + new_ids.get(old_id_name, old_id_name) + suffix
+
+    for id_regex in _svg_id_regexes:
+        svg_str = id_regex.sub(_extend_id, svg_str)
 
     return svg_str
 
+def _dedup_svg_defs(svg_obj, seen_defs=None, to_top=True):
+    """
+    Remove duplicated definitions (within ``<defs>`` elements) of an svg
+    object and point their references to a single shared copy
+
+    Arguments
+    ---------
+    svg_obj : svg object
+        svg object, svgutils.transform.SVGFigure (or an element of one, e.g.
+        from ``.getroot()``)
+    seen_defs : dict
+        optional dictionary mapping the content of definitions already kept
+        (e.g. in previously written svg objects) to their ids. This is
+        updated in place.
+    to_top : boolean
+        logic if the kept definitions should be moved into a single
+        ``<defs>`` element at the start of the svg object (otherwise they
+        stay where they first appear)
+
+    Return
+    ------
+    svg_obj : svg object
+        updated svg object (the same object as the input, which is updated
+        in place)
+
+    Details
+    -------
+    Each plotnine object's svg has its own definitions of font glyphs, clip
+    paths and markers, many of which are identical across the plotnine
+    objects of an arrangement (up to their ids, see ``_uniquify_svg_safe``).
+    Two definitions are the same if their serialized content (without their
+    id) is the same. Definitions in the user space of the referencing element
+    (like matplotlib's clip paths) can be shared by plotnine objects at
+    different locations.
+    """
+    if seen_defs is None:
+        seen_defs = dict()
+
+    root = svg_obj.root
+    defs_tag = sg.SVG + "defs"
+
+    top_defs = None
+    if to_top:
+        top_defs = etree.Element(defs_tag)
+
+    # collect kept definitions and the ids of duplicates
+    replaced_ids = dict()
+    for defs in list(root.iter(defs_tag)):
+        for definition in list(defs):
+            def_id = definition.get("id")
+            if def_id is None:
+                continue
+            key = etree.tostring(definition, with_tail=False).replace(
+                (' id="%s"' % def_id).encode(), b"", 1)
+            kept_id = seen_defs.get(key)
+            if kept_id is None:
+                seen_defs[key] = def_id
+                if to_top:
+                    top_defs.append(definition)
+            else:
+                replaced_ids[def_id] = kept_id
+                defs.remove(definition)
+
+        if len(defs) == 0 and defs.getparent() is not None:
+            defs.getparent().remove(defs)
+
+    if to_top and len(top_defs) > 0:
+        root.insert(0, top_defs)
+
+    if len(replaced_ids) == 0:
+        return svg_obj
+
+    def _replace_id(match):
+        prefix, old_id_name, suffix = match.groups()
+        return prefix + replaced_ids.get(old_id_name, old_id_name) + suffix
+
+    # (many attributes share the same value, e.g. clip paths)
+    new_values = dict()
+    for element in root.iter("*"):
+        for name, value in element.items():
+            if "url(#" in value:
+                new_value = new_values.get(value)
+                if new_value is None:
+                    new_value = _svg_id_regexes[1].sub(_replace_id, value)
+                    new_values[value] = new_value
+                if new_value != value:
+                    element.set(name, new_value)
+            elif value.startswith("#") and name.endswith("href") and \
+                value[1:] in replaced_ids:
+                element.set(name, "#" + replaced_ids[value[1:]])
+
+    return svg_obj
+
+# attributes with coordinates (rounded by ``_minify_svg``, the arguments of
+# ``translate`` in ``transform`` attributes are also rounded)
+_svg_coordinate_attributes = set(["d", "points", "x", "y", "x1", "y1", "x2",
+                                  "y2", "cx", "cy", "r", "rx", "ry", "width",
+                                  "height", "viewBox"])
+_svg_number_regex = re.compile(r'-?\d*\.\d+(?:[eE][-+]?\d+)?')
+_svg_spaces_regex = re.compile(r'  +')
+_svg_translate_regex = re.compile(r'translate\(([^)]*)\)')
+
+def _svg_short_id(idx):
+    """
+    (Internal) short id name ("a", "b", ..., "z", "aa", "ab", ...)
+
+    Arguments
+    ---------
+    idx : int
+        index of the id (starting at 0)
+
+    Returns
+    -------
+    str
+    """
+    name = ""
+    idx += 1
+    while idx > 0:
+        idx, remainder = divmod(idx - 1, 26)
+        name = chr(97 + remainder) + name
+    return name
+
+def _minify_svg(svg_obj, precision=None, short_ids=None):
+    """
+    Reduce the size of an svg object (rounding coordinates, removing
+    metadata and whitespace and shortening ids)
+
+    Arguments
+    ---------
+    svg_obj : svg object
+        svg object, svgutils.transform.SVGFigure (or an element of one, e.g.
+        from ``.getroot()``)
+    precision : int
+        number of decimals of coordinates (path data, positions, sizes and
+        translations). If None, coordinates are not rounded.
+    short_ids : dict
+        optional dictionary mapping ids to their short ids, shared across svg
+        objects that are written into the same file (e.g. with references
+        across them, see ``_dedup_svg_defs``). This is updated in place.
 
+    Return
+    ------
+    svg_obj : svg object
+        updated svg object (the same object as the input, which is updated
+        in place)
+
+    Details
+    -------
+    Path data (``d`` attributes) also have repeated spaces removed. Whitespace
+    between elements is removed, but ``.to_str()`` and ``.save()`` of
+    svgutils re-indent the svg (see ``_save_svg_wrapper``). Only ids that are
+    referenced (or that are definitions) are kept, and
+    they are renamed to short ids (see ``_svg_short_id``). Scales (and other
+    transforms than translations) aren't rounded, as they multiply the
+    rounding error of the elements they transform.
+    """
+    if short_ids is None:
+        short_ids = dict()
+
+    root = svg_obj.root
+    text_tags = set([sg.SVG + "text", sg.SVG + "tspan", sg.SVG + "style"])
+
+    # metadata and comments
+    for element in list(root.iter(sg.SVG + "metadata", etree.Comment)):
+        element.getparent().remove(element)
+
+    # single walk over the elements for whitespace, coordinates and ids
+    rounded_values = dict()
+    if precision is not None:
+        rounded_numbers = dict()
+        def _round_number(match):
+            number = match.group(0)
+            rounded = rounded_numbers.get(number)
+            if rounded is None:
+                rounded = ("%.*f" % (precision, float(number)))
+                if "." in rounded:
+                    rounded = rounded.rstrip("0").rstrip(".")
+                if rounded == "-0":
+                    rounded = "0"
+                rounded_numbers[number] = rounded
+            return rounded
+        def _round_translate(match):
+            return "translate(" + \
+                _svg_number_regex.sub(_round_number, match.group(1)) + ")"
+
+    url_attributes = [] # (element, attribute name, value)
+    href_attributes = []
+    id_elements = []
+    for element in root.iter("*"):
+        if element.tag not in text_tags:
+            if element.text is not None and element.text.strip() == "":
+                element.text = None
+            if element.tail is not None and element.tail.strip() == "":
+                element.tail = None
+
+        for name, value in element.items():
+            if "url(#" in value:
+                url_attributes.append((element, name, value))
+            elif value.startswith("#") and name.endswith("href"):
+                href_attributes.append((element, name, value))
+            elif name == "id":
+                id_elements.append(element)
+            elif name == "d":
+                # (matplotlib separates path commands with two spaces)
+                new_value = rounded_values.get(value)
+                if new_value is None:
+                    new_value = _svg_spaces_regex.sub(" ", value).strip()
+                    if precision is not None:
+                        new_value = _svg_number_regex.sub(_round_number,
+                                                          new_value)
+                    rounded_values[value] = new_value
+                element.set(name, new_value)
+            elif precision is not None and "." in value and \
+                (name in _svg_coordinate_attributes or name == "transform"):
+                new_value = rounded_values.get(value)
+                if new_value is None:
+                    if name == "transform":
+                        new_value = _svg_translate_regex.sub(_round_translate,
+                                                             value)
+                    else:
+                        new_value = _svg_number_regex.sub(_round_number,
+                                                          value)
+                    rounded_values[value] = new_value
+                element.set(name, new_value)
+
+    # shorten (or remove) ids
+    referenced_ids = set([value[1:] for _, _, value in href_attributes])
+    for value in set([value for _, _, value in url_attributes]):
+        referenced_ids.update(_svg_id_reference_regexes[0].findall(value))
+
+    def _short_id(id_name):
+        short_id = short_ids.get(id_name)
+        if short_id is None:
+            short_id = _svg_short_id(len(short_ids))
+            short_ids[id_name] = short_id
+        return short_id
+
+    defs_tag = sg.SVG + "defs"
+    for element in id_elements:
+        id_name = element.get("id")
+        if id_name in referenced_ids or \
+            element.getparent() is not None and \
+                element.getparent().tag == defs_tag:
+            element.set("id", _short_id(id_name))
+        else:
+            del element.attrib["id"]
+
+    def _replace_id(match):
+        prefix, old_id_name, suffix = match.groups()
+        return prefix + _short_id(old_id_name) + suffix
+
+    new_values = dict()
+    for element, name, value in url_attributes:
+        new_value = new_values.get(value)
+        if new_value is None:
+            new_value = _svg_id_regexes[1].sub(_replace_id, value)
+            new_values[value] = new_value
+        element.set(name, new_value)
+    for element, name, value in href_attributes:
+        element.set(name, "#" + _short_id(value[1:]))
+
+    return svg_obj
@@ -2,6 +2,15 @@ import numpy as np
 import plotnine as p9
 import inspect
 import re
+import asyncio
+import threading
+
+from .config import _rcParams_context
+
+# matplotlib (and plotnine's themes) rely on global state (e.g. pyplot's
+# figures and matplotlib's rcParams), so stages that draw figures for
+# asynchronous requests run one at a time
+_pyplot_lock = threading.RLock()
 
 def val_range(x):
     return (np.min(x), np.max(x))
@@ -238,3 +247,41 @@ def _flatten_nested_list(x):
         else:
             out.append(xi)
     return out
+
+async def _run_in_executor(executor, params, fn, *args, use_lock=True,
+                           **kwargs):
+    """
+    (Internal) run a (cpu bound) function in an executor without blocking
+    the event loop
+
+    Arguments
+    ---------
+    executor : concurrent.futures.Executor
+        executor to run the function in (a thread pool, None uses the event
+        loop's default executor)
+    params : dict
+        snapshot of cowpatch's rcParams to run the function with (see
+        ``config._rcParams_context``)
+    fn : function
+        function to run
+    *args
+        arguments of ``fn``
+    use_lock : boolean
+        logic if the function should hold ``_pyplot_lock`` (if it draws with
+        matplotlib, cowpatch's caches are guarded by their own locks)
+    **kwargs
+        keyword arguments of ``fn``
+
+    Returns
+    -------
+    output of ``fn``
+    """
+    def _stage():
+        with _rcParams_context(params):
+            if not use_lock:
+                return fn(*args, **kwargs)
+            with _pyplot_lock:
+                return fn(*args, **kwargs)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _stage)
@@ -2,6 +2,7 @@ import numpy as np
 from .base_elements import patch
 from .svg_utils import gg_to_svg
 from .utils import inherits_plotnine
+from .cache import _discard_built_gg
 
 
 # TODO notes:
@@ -52,6 +53,8 @@ class wrapper_plotnine(patch):
         # this allows for the object to has specially addition properties
         # that still provide ggplot structure (not just patch structure)
         if inherits_plotnine(other):
+            # the stored build of the previous ggplot is no longer needed
+            _discard_built_gg(self.gg)
             self.gg = self.gg + other
         else:
             super().__add__(other)
@@ -2,19 +2,29 @@ from pytest_regressions import image_regression
 from hypothesis import given, strategies as st, settings
 
 import numpy as np
+import pandas as pd
 import cowpatch as cow
+import cowpatch.cache
+import cowpatch.svg_utils
 from cowpatch.utils import inherits, _flatten_nested_list, \
                             _transform_size_to_pt
 import pytest
 import io
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import gzip
+import time
+import asyncio
 
 import plotnine as p9
 import plotnine.data as p9_data
 
 import re
+import matplotlib
 import matplotlib.pyplot as plt
 
 import svgutils.transform as sg
+from PIL import Image
 
 
 # inner functions -----
@@ -777,6 +787,705 @@ def test_patch__svg():
         "expected failure to create correct size image to be a certain "+\
         "class of error"
 
+def test_patch__svg__renders(monkeypatch):
+    """
+    plotnine objects rendered while solving sizes should be reused when
+    creating the svg object
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 0')
+
+    g1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 1')
+
+    vis_patch = cow.patch(g0, cow.patch(g1, g0) + cow.layout(ncol = 1)) +\
+        cow.layout(nrow = 1)
+
+    monkeypatch.setitem(cow.rcParams, "size_cache_maxsize", 0)
+
+    num_renders = {"count": 0}
+    base_svg_leaf_render = cow.patch._svg_leaf_render
+    def counting_svg_leaf_render(self, *args, **kwargs):
+        num_renders["count"] += 1
+        return base_svg_leaf_render(self, *args, **kwargs)
+
+    monkeypatch.setattr(cow.patch, "_svg_leaf_render",
+                        counting_svg_leaf_render)
+
+    svg_out, size = vis_patch._svg(width_pt = 10*72, height_pt = 6*72)
+
+    assert num_renders["count"] == 0, \
+        "expected no additional renders of plotnine objects after sizing"
+
+    sizes, logics, renders = vis_patch._svg_get_sizes(width_pt = 10*72,
+                                                      height_pt = 6*72,
+                                                      return_renders = True)
+    assert type(renders) is list and len(renders) == 2 and \
+        type(renders[1]) is list and len(renders[1]) == 2 and \
+        np.all([r is not None for r in _flatten_nested_list(renders)]), \
+        "expected renders to have the same nested structure as sizes"
+
+def test_patch__svg__warm_starts(monkeypatch):
+    """
+    retries with a rescaled global size should start from the previous
+    solutions (and agree with retries that start from scratch)
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ", color="class")) +\
+        p9.labs(title = 'Plot 0')
+
+    g1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 1')
+
+    vis_patch = cow.patch(g1, cow.patch(g0, g1) + cow.layout(ncol = 1)) +\
+        cow.layout(nrow = 1)
+
+    monkeypatch.setitem(cow.rcParams, "size_cache_maxsize", 0)
+
+    # requires a rescale
+    sizes, logics = vis_patch._svg_get_sizes(width_pt = 3*72,
+                                             height_pt = 2.5*72)
+    assert not np.all(_flatten_nested_list(logics)), \
+        "expected some plotnine objects to fail to be correctly sized"
+
+    warm_starts = vis_patch._svg_warm_starts(width_pt = 3*72,
+                                             height_pt = 2.5*72,
+                                             sizes = sizes,
+                                             logics = logics)
+    assert len(warm_starts) == 2 and len(warm_starts[1]) == 2 and \
+        np.all([w is None or len(w) == 2
+                    for w in _flatten_nested_list(warm_starts)]), \
+        "expected warm starts to have the same nested structure as sizes"
+
+    num_renders = {"count": 0}
+    base_measure = cow.svg_utils._live_gg_figure.measure
+    def counting_measure(*args, **kwargs):
+        num_renders["count"] += 1
+        return base_measure(*args, **kwargs)
+
+    monkeypatch.setattr(cow.svg_utils._live_gg_figure, "measure",
+                        counting_measure)
+
+    svg_out, size = vis_patch._svg(width_pt = 3*72, height_pt = 2.5*72)
+    num_renders_warm = num_renders["count"]
+
+    num_renders["count"] = 0
+    monkeypatch.setattr(cow.patch, "_svg_warm_starts",
+                        lambda self, **kwargs: None)
+    svg_out_cold, size_cold = vis_patch._svg(width_pt = 3*72,
+                                             height_pt = 2.5*72)
+
+    assert np.allclose(size, size_cold), \
+        "expected warm started retries to lead to the same global size"
+    assert num_renders_warm < num_renders["count"], \
+        "expected warm started retries to need fewer renders"
+
+def test_patch__svg__max_workers(monkeypatch):
+    """
+    solving and rendering plotnine objects in a process pool should create
+    the same svg object as the serial approach
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 0')
+
+    g1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 1')
+
+    vis_patch = cow.patch(g0, cow.patch(g1, g0) + cow.layout(ncol = 1)) +\
+        cow.layout(nrow = 1)
+
+    # svg ids are random unless a salt is provided
+    monkeypatch.setitem(matplotlib.rcParams, "svg.hashsalt", "cowpatch")
+    monkeypatch.setitem(cow.rcParams, "size_cache_maxsize", 0)
+
+    sizes, logics = vis_patch._svg_get_sizes(width_pt = 10*72,
+                                             height_pt = 6*72)
+    sizes_p, logics_p, renders_p = \
+        vis_patch._svg_get_sizes(width_pt = 10*72,
+                                 height_pt = 6*72,
+                                 return_renders = True,
+                                 max_workers = 2)
+    assert sizes == sizes_p and logics == logics_p and \
+        np.all([r is not None for r in _flatten_nested_list(renders_p)]), \
+        "expected parallel sizes to match serial sizes (with renders)"
+
+    # the svg metadata contains the date and time of creation
+    def _remove_date(svg_obj):
+        return re.sub("<dc:date>.*?</dc:date>", "",
+                      svg_obj.to_str().decode())
+
+    svg_out, size = vis_patch._svg(width_pt = 10*72, height_pt = 6*72)
+    svg_out_p, size_p = vis_patch._svg(width_pt = 10*72, height_pt = 6*72,
+                                       max_workers = 2)
+
+    assert size == size_p and \
+        _remove_date(svg_out) == _remove_date(svg_out_p), \
+        "expected parallel svg object to be byte-identical to the serial one"
+
+    # solved sizes are stored in the main process ------
+    monkeypatch.setitem(cow.rcParams, "size_cache_maxsize", 4)
+    cow.clear_size_cache()
+    _ = vis_patch._svg_get_sizes(width_pt = 10*72, height_pt = 6*72,
+                                 max_workers = 2)
+    _ = vis_patch._svg_get_sizes(width_pt = 10*72, height_pt = 6*72)
+    assert cow.size_cache_info().hits == 3 and \
+        cow.size_cache_info().currsize == 3, \
+        "expected sizes solved in parallel to be cached in the main process"
+    cow.clear_size_cache()
+
+
+def test_patch__svg__max_workers_threads(monkeypatch):
+    """
+    size requests solved in process pools from different threads at the
+    same time shouldn't be mixed up
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 0')
+
+    g1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 1', y = "a much longer label\nof the y axis")
+
+    vis_patches = [cow.patch(g0, g1) + cow.layout(nrow = 1),
+                   cow.patch(g1, g0) + cow.layout(ncol = 1)]
+
+    monkeypatch.setitem(cow.rcParams, "size_cache_maxsize", 0)
+
+    sizes = [vis_patch._svg_get_sizes(width_pt = 10*72, height_pt = 6*72)
+                for vis_patch in vis_patches]
+
+    # (both threads look up their requests before either starts a pool)
+    barrier = threading.Barrier(2)
+    base_size_cache_lookup = cowpatch.cache._size_cache_lookup
+    def waiting_size_cache_lookup(*args, **kwargs):
+        barrier.wait(timeout = 10)
+        return base_size_cache_lookup(*args, **kwargs)
+    monkeypatch.setattr(cowpatch.cache, "_size_cache_lookup",
+                        waiting_size_cache_lookup)
+
+    with ThreadPoolExecutor(max_workers = 2) as pool:
+        sizes_p = list(pool.map(lambda vis_patch:
+                                    vis_patch._svg_get_sizes(
+                                        width_pt = 10*72,
+                                        height_pt = 6*72,
+                                        max_workers = 2),
+                                vis_patches))
+
+    assert sizes == sizes_p, \
+        "expected each thread's parallel sizes to match its serial sizes"
+
+def test_patch__svg__rasterize(monkeypatch):
+    """
+    data layers of plotnine objects should be rasterized w.r.t. the threshold
+    and per plotnine object overrides (with the same sizes)
+    """
+    df = pd.DataFrame(dict(x = np.arange(2000) % 37,
+                           y = np.arange(2000) % 41))
+    g_big = p9.ggplot(df) +\
+        p9.geom_point(p9.aes(x="x", y="y")) +\
+        p9.labs(title = 'Plot 0')
+
+    g_small = p9.ggplot(p9_data.mpg) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 1')
+
+    vis_patch = cow.patch(g_big, cow.patch(g_small, g_big) +\
+                                    cow.layout(ncol = 1)) +\
+        cow.layout(nrow = 1)
+
+    assert vis_patch._svg_rasterize_logics() == [False, [False, False]], \
+        "expected no rasterization as a default"
+
+    monkeypatch.setitem(cow.rcParams, "rasterize_threshold", 1000)
+    assert vis_patch._svg_rasterize_logics() == [True, [False, True]], \
+        "expected plotnine objects with more data elements than the "+\
+        "threshold to be rasterized"
+    assert vis_patch._svg_rasterize_logics([False, None]) == \
+        [False, [False, True]] and \
+        vis_patch._svg_rasterize_logics(True) == [True, [True, True]], \
+        "expected rasterize input to override the threshold"
+
+    svg_vector, size_vector = vis_patch._svg(width_pt = 10*72,
+                                             height_pt = 6*72,
+                                             rasterize = False)
+    svg_raster, size_raster = vis_patch._svg(width_pt = 10*72,
+                                             height_pt = 6*72,
+                                             raster_dpi = 150)
+
+    assert size_vector == size_raster, \
+        "expected rasterization to not change the size of the patch"
+    assert svg_vector.to_str().count(b"<image") == 0 and \
+        svg_raster.to_str().count(b"<image") == 2 and \
+        len(svg_raster.to_str()) < len(svg_vector.to_str()), \
+        "expected the data layers of large plotnine objects to be images"
+
+def test_patch__svg__rasterize_fragment_cache(monkeypatch):
+    """
+    rasterized renders of a plotnine object should never be reused as its
+    vector render (and vice versa)
+    """
+    df = pd.DataFrame(dict(x = np.arange(2000) % 37,
+                           y = np.arange(2000) % 41))
+    g_big = p9.ggplot(df) +\
+        p9.geom_point(p9.aes(x="x", y="y")) +\
+        p9.labs(title = 'Plot 0')
+
+    g_small = p9.ggplot(p9_data.mpg) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 1')
+
+    vis_patch = cow.patch(g_big, g_small) + cow.layout(nrow = 1)
+
+    monkeypatch.setitem(cow.rcParams, "size_cache_maxsize", 4)
+    cow.clear_size_cache()
+    cow.clear_fragment_cache()
+
+    raster_bytes = asyncio.run(vis_patch.arender_bytes("svg", width = 10,
+                                                       height = 6,
+                                                       rasterize = True))
+    vector_bytes = vis_patch.to_bytes("svg", width = 10, height = 6,
+                                      rasterize = False)
+    assert raster_bytes.count(b"<image") == 2 and \
+        vector_bytes.count(b"<image") == 0, \
+        "expected a vector svg after an (async) rasterized svg"
+
+    svg_raster, _ = vis_patch._svg(width_pt = 10*72, height_pt = 6*72,
+                                   rasterize = [True, False])
+    svg_vector, _ = vis_patch._svg(width_pt = 10*72, height_pt = 6*72,
+                                   rasterize = False)
+    assert svg_raster.to_str().count(b"<image") == 1 and \
+        svg_vector.to_str().count(b"<image") == 0, \
+        "expected the rasterization of each plotnine object to be kept "+\
+        "apart in the fragment cache"
+
+    cow.clear_size_cache()
+    cow.clear_fragment_cache()
+
+
+def test_patch_save__minify(tmp_path):
+    """
+    minified svgs should be smaller (with valid references) and report the
+    bytes saved
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 0')
+
+    g1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 1')
+
+    vis_patch = cow.patch(g0, cow.patch(g1, g0) + cow.layout(ncol = 1)) +\
+        cow.layout(nrow = 1)
+
+    vis_patch.save(str(tmp_path / "full.svg"), width = 10, height = 6,
+                   verbose = False)
+    with pytest.warns(cow.exceptions.CowpatchWarning,
+                      match = "Minified svg: [0-9,]+ bytes saved"):
+        vis_patch.save(str(tmp_path / "minify.svg"), width = 10, height = 6,
+                       verbose = True, minify = True)
+    vis_patch.save(str(tmp_path / "minify_stream.svg"), width = 10,
+                   height = 6, verbose = False, minify = True, stream = True)
+
+    def _size_ids_references(filename):
+        with open(filename, "r") as fid:
+            svg_str = fid.read()
+        ids = re.findall(' id="([^"]+)"', svg_str)
+        references = set(re.findall('url\\(#([^)]+)\\)', svg_str) +
+                         re.findall('href="#([^"]+)"', svg_str))
+        return len(svg_str), ids, references
+
+    size, _, _ = _size_ids_references(tmp_path / "full.svg")
+    for filename in ["minify.svg", "minify_stream.svg"]:
+        size_m, ids_m, references_m = \
+            _size_ids_references(tmp_path / filename)
+        assert size_m < size * .8 and \
+            references_m.issubset(set(ids_m)) and \
+            len(ids_m) == len(set(ids_m)), \
+            "expected minified svg to be smaller with valid references " +\
+            "(%s)" % filename
+
+
+def test_patch_save__multiple(monkeypatch, tmp_path):
+    """
+    saving a patch to multiple files should compose it once
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 0')
+
+    g1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 1')
+
+    vis_patch = cow.patch(g0, g1) + cow.layout(nrow = 1)
+
+    num_svg = {"count": 0}
+    base_svg = cow.patch._svg
+    def counting_svg(self, *args, **kwargs):
+        num_svg["count"] += 1
+        return base_svg(self, *args, **kwargs)
+    monkeypatch.setattr(cow.patch, "_svg", counting_svg)
+
+    vis_patch.save([str(tmp_path / "out.svg"), str(tmp_path / "out.svgz")],
+                   width = 8, height = 3, verbose = False)
+
+    assert num_svg["count"] == 1, \
+        "expected the patch to be composed once for all files"
+
+    with open(tmp_path / "out.svg", "rb") as fid:
+        svg_bytes = fid.read()
+    with open(tmp_path / "out.svgz", "rb") as fid:
+        assert gzip.decompress(fid.read()) == svg_bytes, \
+            "expected svg and svgz files to contain the same svg"
+
+    # streaming ------
+    vis_patch.save([str(tmp_path / "stream.svg"),
+                    str(tmp_path / "stream.svgz")],
+                   width = 8, height = 3, verbose = False, stream = True)
+    with open(tmp_path / "stream.svg", "rb") as fid:
+        svg_bytes = fid.read()
+    with open(tmp_path / "stream.svgz", "rb") as fid:
+        assert gzip.decompress(fid.read()) == svg_bytes, \
+            "expected streamed svg and svgz files to contain the same svg"
+
+def test_patch_save__raster_backend(tmp_path):
+    """
+    agg raster backend should paste the plotnine objects' images into an
+    image with the requested size
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 0')
+
+    g1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 1')
+
+    vis_patch = cow.patch(g0, cow.patch(g1, g0) + cow.layout(ncol = 1)) +\
+        cow.layout(nrow = 1)
+
+    vis_patch.save([str(tmp_path / "out.png"), str(tmp_path / "out.svg")],
+                   width = 10, height = 6, dpi = 100, verbose = False,
+                   raster_backend = "agg")
+
+    image = Image.open(tmp_path / "out.png")
+    svg_obj = sg.fromfile(str(tmp_path / "out.svg"))
+    width_px = int(np.round(float(svg_obj.width[:-2]) / 72 * 100))
+    height_px = int(np.round(float(svg_obj.height[:-2]) / 72 * 100))
+    assert image.size == (width_px, height_px), \
+        "expected image with the (corrected) size of the svg"
+
+    # each plotnine object's area is covered ------
+    image_array = np.array(image.convert("L"))
+    x_mid, y_mid = width_px // 2, height_px // 2
+    for x_left, x_right, y_top, y_bottom in [(0, x_mid, 0, height_px),
+                                             (x_mid, width_px, 0, y_mid),
+                                             (x_mid, width_px, y_mid,
+                                              height_px)]:
+        assert np.mean(image_array[y_top:y_bottom, x_left:x_right] < 250) \
+            > .2, \
+            "expected each plotnine object to be pasted in its area"
+
+    with pytest.raises(ValueError):
+        vis_patch.save(str(tmp_path / "out.png"), width = 10, height = 6,
+                       verbose = False, raster_backend = "cairo")
+
+def test_patch_save__raster_formats(tmp_path):
+    """
+    agg raster backend should save jpeg, webp and tiff files with the same
+    size as the png file
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 0')
+
+    vis_patch = cow.patch(g0, g0) + cow.layout(nrow = 1)
+
+    filenames = [str(tmp_path / f) for f in
+                    ["out.png", "out.jpg", "out.webp", "out.tiff"]]
+    vis_patch.save(filenames, width = 6, height = 3, dpi = 50,
+                   verbose = False, raster_backend = "agg", quality = 90,
+                   subsampling = "4:4:4")
+
+    images = [Image.open(f) for f in filenames]
+    assert [im.format for im in images] == ["PNG", "JPEG", "WEBP", "TIFF"], \
+        "expected files to be saved in the format of their extension"
+    assert len(set([im.size for im in images])) == 1, \
+        "expected all raster files to have the same size"
+
+def test_patch_asave(monkeypatch):
+    """
+    asynchronous saving should create the same svg as saving, with a
+    snapshot of rcParams, and stop between plotnine objects when cancelled
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 0')
+
+    g1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 1')
+
+    vis_patch = cow.patch(g0, cow.patch(g1, g0) + cow.layout(ncol = 1)) +\
+        cow.layout(nrow = 1)
+
+    # svg ids are random unless a salt is provided
+    monkeypatch.setitem(matplotlib.rcParams, "svg.hashsalt", "cowpatch")
+
+    def _no_date(svg_bytes):
+        return re.sub(b"<dc:date>.*?</dc:date>", b"", svg_bytes)
+
+    fid = io.BytesIO()
+    vis_patch.save(fid, width = 10, height = 6, _format = "svg",
+                   verbose = False)
+    svg_bytes = _no_date(fid.getvalue())
+
+    solves = []
+    base_svg_solve_sizes = cow.patch._svg_solve_sizes
+    def slow_svg_solve_sizes(self, *args, **kwargs):
+        solves.append(1)
+        time.sleep(.2)
+        return base_svg_solve_sizes(self, *args, **kwargs)
+    monkeypatch.setattr(cow.patch, "_svg_solve_sizes", slow_svg_solve_sizes)
+
+    async def _changing_rcParams():
+        task = asyncio.create_task(vis_patch.arender_bytes("svg", width = 10,
+                                                           height = 6))
+        while len(solves) == 0:
+            await asyncio.sleep(.01)
+        cow.rcParams["svg_dedup_defs"] = False
+        return await task
+
+    monkeypatch.setitem(cow.rcParams, "svg_dedup_defs", True)
+    async_svg_bytes = asyncio.run(_changing_rcParams())
+    assert _no_date(async_svg_bytes) == svg_bytes, \
+        "expected the same svg as saving (with the rcParams at the start " +\
+        "of the request)"
+
+    async def _concurrent():
+        return await asyncio.gather(*[vis_patch.arender_bytes("svg",
+                                                              width = 10,
+                                                              height = 6)
+                                        for _ in range(2)])
+
+    monkeypatch.setitem(cow.rcParams, "svg_dedup_defs", True)
+    assert np.all([_no_date(b) == svg_bytes
+                    for b in asyncio.run(_concurrent())]), \
+        "expected concurrent requests to create the same svg"
+
+    # cancellation ------
+    renders = []
+    base_svg_leaf_render = cow.patch._svg_leaf_render
+    def slow_svg_leaf_render(self, *args, **kwargs):
+        renders.append(1)
+        time.sleep(.2)
+        return base_svg_leaf_render(self, *args, **kwargs)
+    monkeypatch.setattr(cow.patch, "_svg_leaf_render", slow_svg_leaf_render)
+    # (sizes are solved again, without rendering the plotnine objects)
+    cow.clear_size_cache()
+
+    async def _cancelled():
+        task = asyncio.create_task(vis_patch.asave(io.BytesIO(),
+                                                   width = 10, height = 6,
+                                                   _format = "svg"))
+        while len(renders) == 0 and not task.done():
+            await asyncio.sleep(.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(.5)
+
+    asyncio.run(_cancelled())
+    assert len(renders) == 1, \
+        "expected no plotnine objects to be rendered after cancellation"
+
+
+def test_patch_asave__tiles(monkeypatch):
+    """
+    concurrent asynchronous requests that rasterize in tiles should each
+    create the same file as saving
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 0')
+
+    g1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 1')
+
+    # (red: tile's offset, green: number of paths, blue: width)
+    def fake_svg_bytes_to_image(base_image_string, **kwargs):
+        time.sleep(.01)
+        root_tag = base_image_string[:base_image_string.index(b">")]
+        y0 = float(re.search(b'viewBox="[^ ]+ ([^ ]+)', root_tag).group(1))
+        width_px = int(re.search(b' width="([0-9]+)px"', root_tag).group(1))
+        height_px = int(re.search(b' height="([0-9]+)px"',
+                                  root_tag).group(1))
+        pixels = np.full((height_px, width_px, 4), 255, dtype=np.uint8)
+        pixels[:, :, 0] = int(y0) % 256
+        pixels[:, :, 1] = base_image_string.count(b"<path") % 256
+        pixels[:, :, 2] = width_px % 256
+        return Image.fromarray(pixels, mode="RGBA")
+    monkeypatch.setattr(cowpatch.svg_utils, "_svg_bytes_to_image",
+                        fake_svg_bytes_to_image)
+
+    requests = [(cow.patch(g0, g1) + cow.layout(nrow = 1), 6, 3),
+                (cow.patch(g1, g0, g0) + cow.layout(ncol = 1), 3, 6)]
+
+    serial_images = []
+    for vis_patch, width, height in requests:
+        fid = io.BytesIO()
+        vis_patch.save(fid, width = width, height = height, dpi = 20,
+                       _format = "png", tile_rows = 7, stream = False,
+                       verbose = False)
+        serial_images.append(np.array(Image.open(fid)))
+
+    async def _concurrent():
+        return await asyncio.gather(*[vis_patch.arender_bytes("png",
+                                                              width = width,
+                                                              height = height,
+                                                              dpi = 20,
+                                                              tile_rows = 7)
+                                        for vis_patch, width, height
+                                            in requests * 2])
+
+    images = [np.array(Image.open(io.BytesIO(b)))
+                for b in asyncio.run(_concurrent())]
+    assert np.all([image.shape == serial.shape and np.all(image == serial)
+                    for image, serial in zip(images, serial_images * 2)]), \
+        "expected each concurrent request to create its own file (the " +\
+        "same as saving)"
+
+    # no worker processes are forked from the executor's threads ------
+    def no_pool(*args, **kwargs):
+        raise AssertionError("no worker processes expected")
+    monkeypatch.setattr(cowpatch.cache, "ProcessPoolExecutor", no_pool)
+    monkeypatch.setattr(cowpatch.svg_utils, "ProcessPoolExecutor", no_pool)
+    monkeypatch.setitem(cow.rcParams, "max_workers", 3)
+    monkeypatch.setitem(cow.rcParams, "size_cache_maxsize", 0)
+
+    vis_patch, width, height = requests[1]
+    with pytest.warns(cow.exceptions.CowpatchWarning):
+        image_bytes = asyncio.run(vis_patch.arender_bytes("png",
+                                                          width = width,
+                                                          height = height,
+                                                          dpi = 20,
+                                                          tile_rows = 7,
+                                                          max_workers = 2))
+    assert np.all(np.array(Image.open(io.BytesIO(image_bytes))) ==
+                    serial_images[1]), \
+        "expected max_workers to be ignored by asynchronous requests"
+
+def test_patch_to_bytes(monkeypatch, tmp_path):
+    """
+    to_bytes should return the content of the saved file (or the raw
+    pixels of the image)
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 0')
+
+    vis_patch = cow.patch(g0, g0) + cow.layout(nrow = 1)
+
+    # svg ids are random unless a salt is provided
+    monkeypatch.setitem(matplotlib.rcParams, "svg.hashsalt", "cowpatch")
+
+    vis_patch.save(str(tmp_path / "out.svg"), width = 6, height = 3,
+                   verbose = False)
+    vis_patch.save(str(tmp_path / "out.png"), width = 6, height = 3,
+                   dpi = 50, verbose = False, raster_backend = "agg")
+
+    with open(tmp_path / "out.svg", "rb") as fid:
+        assert re.sub(b"<dc:date>.*?</dc:date>", b"", fid.read()) == \
+            re.sub(b"<dc:date>.*?</dc:date>", b"",
+                   vis_patch.to_bytes("svg", width = 6, height = 3)), \
+            "expected the svg file's content"
+
+    png_bytes = vis_patch.to_bytes("png", width = 6, height = 3, dpi = 50,
+                                   raster_backend = "agg")
+    with open(tmp_path / "out.png", "rb") as fid:
+        assert fid.read() == png_bytes, \
+            "expected the png file's content"
+
+    pixels = vis_patch.to_bytes("rgba", width = 6, height = 3, dpi = 50,
+                                raster_backend = "agg")
+    image = Image.open(io.BytesIO(png_bytes)).convert("RGBA")
+    assert type(pixels) is memoryview and \
+        pixels.shape == (image.size[1], image.size[0], 4) and \
+        np.all(np.asarray(pixels) == np.array(image)), \
+        "expected the image's pixels"
+
+    with pytest.raises(ValueError):
+        vis_patch.save(io.BytesIO(), width = 6, height = 3, verbose = False)
+
+def test_patch_save__stream(monkeypatch, tmp_path):
+    """
+    streaming the svg (one plotnine object at a time) should create the same
+    svg as composing the full svg object first
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 0')
+
+    g1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 1')
+
+    vis_patch = cow.patch(g0, cow.patch(g1, g0) + cow.layout(ncol = 1)) +\
+        cow.layout(nrow = 1)
+
+    # svg ids are random unless a salt is provided
+    monkeypatch.setitem(matplotlib.rcParams, "svg.hashsalt", "cowpatch")
+    # (shared definitions are placed differently when streaming)
+    monkeypatch.setitem(cow.rcParams, "svg_dedup_defs", False)
+    # (cached sizes don't come with renders)
+    monkeypatch.setitem(cow.rcParams, "size_cache_maxsize", 0)
+
+    # leaves are only rendered once sizes are solved ------
+    renders = []
+    base_svg_leaf = cow.patch._svg_leaf
+    def tracking_svg_leaf(self, *args, **kwargs):
+        renders.append(kwargs.get("render"))
+        return base_svg_leaf(self, *args, **kwargs)
+    monkeypatch.setattr(cow.patch, "_svg_leaf", tracking_svg_leaf)
+
+    vis_patch.save(str(tmp_path / "full.svg"), width = 10, height = 6,
+                   verbose = False)
+    vis_patch.save(str(tmp_path / "stream.svg"), width = 10, height = 6,
+                   verbose = False, stream = True)
+
+    assert len(renders) == 6 and \
+        np.all([r is not None for r in renders[:3]]) and \
+        np.all([r is None for r in renders[3:]]), \
+        "expected streaming to render each plotnine object after sizing"
+
+    # the svg metadata contains the date and time of creation (and the
+    # streamed svg has different whitespace / namespace declarations)
+    def _elements(filename):
+        with open(filename, "rb") as fid:
+            svg_bytes = re.sub(b"<dc:date>.*?</dc:date>", b"", fid.read())
+        return [(e.tag, dict(e.attrib), (e.text or "").strip())
+                    for e in sg.fromstring(svg_bytes.decode()).root.iter()]
+
+    assert _elements(tmp_path / "full.svg") == \
+        _elements(tmp_path / "stream.svg"), \
+        "expected streamed svg to match the composed svg"
+
+    # rcParams default ------
+    monkeypatch.setitem(cow.rcParams, "save_stream", True)
+    vis_patch.save(str(tmp_path / "stream2.svg"), width = 10, height = 6,
+                   verbose = False)
+    assert len(renders) == 9 and np.all([r is None for r in renders[6:]]), \
+        "expected cow.rcParams[\"save_stream\"] to define the default"
+
+
 # printing ----------
 
 def test_patch__repr__(monkeypatch,capsys):
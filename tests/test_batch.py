@@ -0,0 +1,106 @@
+import pytest
+import numpy as np
+
+import cowpatch as cow
+import cowpatch.batch
+
+import plotnine as p9
+import plotnine.data as p9_data
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_save_all(tmp_path, max_workers):
+    """
+    save_all should save the same files as patch.save and report failures
+    without stopping the batch
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 0')
+
+    g1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 1')
+
+    vis_patch0 = cow.patch(g0, g1) + cow.layout(nrow = 1)
+    vis_patch1 = cow.patch(g1, g0) + cow.layout(ncol = 1)
+
+    items = [(vis_patch0, str(tmp_path / "out0.png"), 6, 3),
+             (vis_patch1, str(tmp_path / "out1.unknown"), 3, 6),
+             (vis_patch1, str(tmp_path / "out1.png"), 3, 6)]
+
+    progress = []
+    with pytest.warns(cow.exceptions.CowpatchWarning):
+        results = cow.save_all(items, max_workers=max_workers, dpi=50,
+                               raster_backend="agg",
+                               progress=lambda done, total, result:
+                                    progress.append((done, total)))
+
+    assert [r.filename for r in results] == [item[1] for item in items] and \
+        [r.error is None for r in results] == [True, False, True] and \
+        np.all([r.seconds > 0 for r in results]), \
+        "expected a result (with timing) per item, in order, with the " +\
+        "failure of the unknown format"
+
+    assert sorted(progress) == [(1, 3), (2, 3), (3, 3)], \
+        "expected progress to be reported after each item"
+
+    for patch, filename, width, height in [items[0], items[2]]:
+        direct_filename = filename.replace(".png", "_direct.png")
+        patch.save(direct_filename, width=width, height=height, dpi=50,
+                   verbose=False, raster_backend="agg")
+        with open(filename, "rb") as fid_batch, \
+            open(direct_filename, "rb") as fid_direct:
+            assert fid_batch.read() == fid_direct.read(), \
+                "expected the same file as patch.save " +\
+                "(max_workers = %i)" % max_workers
+
+def test_save_all__threads(monkeypatch, tmp_path):
+    """
+    save_all calls from different threads at the same time should each save
+    their own items
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 0')
+
+    g1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 1')
+
+    items_list = [[(cow.patch(g0, g1) + cow.layout(nrow = 1),
+                    str(tmp_path / ("a%i.png" % i)), 6, 3)
+                        for i in range(2)],
+                  [(cow.patch(g1, g0) + cow.layout(ncol = 1),
+                    str(tmp_path / ("b%i.png" % i)), 3, 6)
+                        for i in range(2)]]
+
+    # (both threads have their items before either starts a pool)
+    barrier = threading.Barrier(2)
+    base_pool = cowpatch.batch.ProcessPoolExecutor
+    def waiting_pool(*args, **kwargs):
+        barrier.wait(timeout = 10)
+        return base_pool(*args, **kwargs)
+    monkeypatch.setattr(cowpatch.batch, "ProcessPoolExecutor", waiting_pool)
+
+    with ThreadPoolExecutor(max_workers = 2) as pool:
+        results_list = list(pool.map(lambda items:
+                                        cow.save_all(items, max_workers = 2,
+                                                     verbose = False,
+                                                     dpi = 50,
+                                                     raster_backend = "agg"),
+                                     items_list))
+
+    for items, results in zip(items_list, results_list):
+        assert [r.error for r in results] == [None, None], \
+            "expected each item to be saved"
+        for patch, filename, width, height in items:
+            direct_filename = filename.replace(".png", "_direct.png")
+            patch.save(direct_filename, width=width, height=height, dpi=50,
+                       verbose=False, raster_backend="agg")
+            with open(filename, "rb") as fid_batch, \
+                open(direct_filename, "rb") as fid_direct:
+                assert fid_batch.read() == fid_direct.read(), \
+                    "expected each thread's files to be of its own items"
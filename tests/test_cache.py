@@ -0,0 +1,492 @@
+import pytest
+import numpy as np
+
+import cowpatch as cow
+import cowpatch.cache
+import cowpatch.svg_utils
+
+import plotnine as p9
+import plotnine.data as p9_data
+import matplotlib
+
+import copy
+import os
+import time
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+def test__gg_fingerprint():
+    """
+    fingerprint should only depend on the content of the ggplot object
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 0')
+
+    g0_same = p9.ggplot(p9_data.mpg.copy()) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 0')
+
+    assert cowpatch.cache._gg_fingerprint(g0) == \
+            cowpatch.cache._gg_fingerprint(g0_same) and \
+        cowpatch.cache._gg_fingerprint(g0) == \
+            cowpatch.cache._gg_fingerprint(copy.deepcopy(g0)), \
+        "expected ggplot objects with the same content to have the same "+\
+        "fingerprint"
+
+    g0_theme = g0 + p9.theme_bw()
+    g0_label = g0 + p9.labs(title = 'Plot 0 (again)')
+    g0_layer = g0 + p9.geom_smooth(p9.aes(x="hwy", y = "displ"))
+    g0_data = p9.ggplot(p9_data.mpg.iloc[1:]) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 0')
+    g0_mapping = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "cty")) +\
+        p9.labs(title = 'Plot 0')
+
+    fingerprints = [cowpatch.cache._gg_fingerprint(g)
+                        for g in [g0, g0_theme, g0_label, g0_layer,
+                                  g0_data, g0_mapping]]
+
+    assert len(np.unique(fingerprints)) == len(fingerprints), \
+        "expected changes to theme, labels, layers, data or mapping to "+\
+        "change the fingerprint"
+
+def test__lru_cache():
+    cache = cowpatch.cache._lru_cache()
+
+    assert cache.get("a") is None and cache.info().misses == 1, \
+        "expected empty cache to miss"
+
+    cache.put("a", 1, maxsize=2)
+    cache.put("b", 2, maxsize=2)
+    assert cache.get("a") == 1 and cache.info().hits == 1, \
+        "expected stored value to be returned"
+
+    cache.put("c", 3, maxsize=2)
+    assert cache.get("b") is None and cache.get("a") == 1 and \
+        cache.get("c") == 3, \
+        "expected least recently used value to be evicted"
+
+    assert cache.info() == cowpatch.cache.CacheInfo(hits=3, misses=2,
+                                                    maxsize=2, currsize=2), \
+        "expected cache info to track hits, misses and sizes"
+
+    cache.clear()
+    assert cache.info() == cowpatch.cache.CacheInfo(hits=0, misses=0,
+                                                    maxsize=2, currsize=0), \
+        "expected clear to remove values and reset counters"
+
+def test__cached_select_correcting_size_svg(monkeypatch):
+    """
+    repeated size requests of the same ggplot content should not re-solve
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 0')
+
+    num_solves = {"count": 0}
+    base_select = cowpatch.cache._select_correcting_size_svg
+    def counting_select(*args, **kwargs):
+        num_solves["count"] += 1
+        return base_select(*args, **kwargs)
+
+    monkeypatch.setattr(cowpatch.cache, "_select_correcting_size_svg",
+                        counting_select)
+    monkeypatch.setitem(cow.rcParams, "size_cache_maxsize", 4)
+    cow.clear_size_cache()
+
+    out1 = cowpatch.cache._cached_select_correcting_size_svg(g0,
+                                                             width=5,
+                                                             height=4,
+                                                             dpi=96)
+    out2 = cowpatch.cache._cached_select_correcting_size_svg(
+                                                    copy.deepcopy(g0),
+                                                    width=5,
+                                                    height=4,
+                                                    dpi=96)
+
+    assert out1 == out2 and num_solves["count"] == 1 and \
+        cow.size_cache_info().hits == 1 and \
+        cow.size_cache_info().misses == 1, \
+        "expected second request to be obtained from the cache"
+
+    _ = cowpatch.cache._cached_select_correcting_size_svg(g0,
+                                                          width=4,
+                                                          height=4,
+                                                          dpi=96)
+    assert num_solves["count"] == 2, \
+        "expected a different requested size to be solved"
+
+    # turning off the cache ------
+    monkeypatch.setitem(cow.rcParams, "size_cache_maxsize", 0)
+    _ = cowpatch.cache._cached_select_correcting_size_svg(g0,
+                                                          width=5,
+                                                          height=4,
+                                                          dpi=96)
+    assert num_solves["count"] == 3, \
+        "expected size_cache_maxsize = 0 to turn off the cache"
+
+    cow.clear_size_cache()
+
+def test__disk_cache(tmp_path):
+    cache = cowpatch.cache._disk_cache()
+    directory = str(tmp_path / "sizes")
+
+    assert cache.get(directory, ("a", 1.0)) is None and cache.misses == 1, \
+        "expected missing directory / value to miss"
+
+    cache.put(directory, ("a", 1.0), [1.5, 2.5, True])
+    assert cache.get(directory, ("a", 1.0)) == [1.5, 2.5, True] and \
+        cache.hits == 1, \
+        "expected stored value to be returned"
+
+    assert [f for f in os.listdir(directory) if f.endswith(".tmp")] == [], \
+        "expected no temporary files to remain after writing"
+
+    # eviction w.r.t. size -------
+    entry_bytes = os.path.getsize(cache._path(directory, ("a", 1.0)))
+    old_time = time.time() - 100
+    os.utime(cache._path(directory, ("a", 1.0)), (old_time, old_time))
+
+    cache.put(directory, ("b", 1.0), [1.5, 2.5, True],
+              max_bytes=entry_bytes)
+    assert cache.get(directory, ("a", 1.0)) is None and \
+        cache.get(directory, ("b", 1.0)) is not None, \
+        "expected oldest value to be removed when beyond max_bytes"
+
+    # eviction w.r.t. age -------
+    os.utime(cache._path(directory, ("b", 1.0)), (old_time, old_time))
+    cache.put(directory, ("c", 1.0), [1.5, 2.5, True], max_age=50)
+    assert cache.get(directory, ("b", 1.0)) is None and \
+        cache.get(directory, ("c", 1.0)) is not None, \
+        "expected values older than max_age to be removed"
+
+def test__cached_select_correcting_size_svg__disk(monkeypatch, tmp_path):
+    """
+    solved sizes stored on disk should be reused when the in-process cache
+    is empty (e.g. in a different process)
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 0')
+
+    num_solves = {"count": 0}
+    base_select = cowpatch.cache._select_correcting_size_svg
+    def counting_select(*args, **kwargs):
+        num_solves["count"] += 1
+        return base_select(*args, **kwargs)
+
+    monkeypatch.setattr(cowpatch.cache, "_select_correcting_size_svg",
+                        counting_select)
+    monkeypatch.setitem(cow.rcParams, "size_cache_dir", str(tmp_path))
+    cow.clear_size_cache()
+
+    out1 = cowpatch.cache._cached_select_correcting_size_svg(g0,
+                                                             width=5,
+                                                             height=4,
+                                                             dpi=96)
+    cow.clear_size_cache()
+    out2 = cowpatch.cache._cached_select_correcting_size_svg(g0,
+                                                             width=5,
+                                                             height=4,
+                                                             dpi=96)
+
+    assert out1 == out2 and type(out2) is tuple and \
+        num_solves["count"] == 1, \
+        "expected second request to be obtained from the disk cache"
+
+    # different rendering environment ------
+    monkeypatch.setitem(matplotlib.rcParams, "font.size",
+                        matplotlib.rcParams["font.size"] + 4)
+    cow.clear_size_cache()
+    _ = cowpatch.cache._cached_select_correcting_size_svg(g0,
+                                                          width=5,
+                                                          height=4,
+                                                          dpi=96)
+    assert num_solves["count"] == 2, \
+        "expected sizes solved with different matplotlib rcParams to not "+\
+        "be reused"
+
+    cow.clear_size_cache()
+
+def test__render_environment_fingerprint(monkeypatch):
+    fingerprint = cowpatch.cache._render_environment_fingerprint()
+    assert fingerprint == cowpatch.cache._render_environment_fingerprint(), \
+        "expected fingerprint to be deterministic"
+
+    for name, value in [("svg.hashsalt", "cowpatch"),
+                        ("svg.fonttype", "none"),
+                        ("font.family", ["serif"])]:
+        with monkeypatch.context() as m:
+            m.setitem(matplotlib.rcParams, name, value)
+            assert cowpatch.cache._render_environment_fingerprint() != \
+                fingerprint, \
+                "expected matplotlib rcParams %s to change the fingerprint" %\
+                name
+
+    monkeypatch.setitem(matplotlib.rcParams, "keymap.quit", ["z"])
+    assert cowpatch.cache._render_environment_fingerprint() == fingerprint, \
+        "expected interactive matplotlib rcParams to not change the "+\
+        "fingerprint"
+
+def test__cached_build_gg(monkeypatch):
+    """
+    ggplot objects should only be built once across size requests
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 0')
+
+    num_builds = {"count": 0}
+    base_build_gg = cowpatch.cache._build_gg
+    def counting_build_gg(*args, **kwargs):
+        num_builds["count"] += 1
+        return base_build_gg(*args, **kwargs)
+
+    monkeypatch.setattr(cowpatch.cache, "_build_gg", counting_build_gg)
+    monkeypatch.setitem(cow.rcParams, "build_cache_maxsize", 2)
+    cowpatch.cache._build_cache.clear()
+    cow.clear_size_cache()
+
+    for width in [5, 4, 3]:
+        _ = cowpatch.cache._cached_select_correcting_size_svg(g0,
+                                                              width=width,
+                                                              height=4,
+                                                              dpi=96)
+    assert num_builds["count"] == 1, \
+        "expected different sizes of the same ggplot to share a build"
+
+    g0_built = cowpatch.cache._cached_build_gg(copy.deepcopy(g0))
+    assert num_builds["count"] == 1 and \
+        cowpatch.svg_utils._is_built_gg(g0_built), \
+        "expected ggplot with the same content to share a build"
+
+    # ggplot updates ------
+    g1 = g0 + p9.labs(title = 'Plot 1')
+    _ = cowpatch.cache._cached_build_gg(g1)
+    assert num_builds["count"] == 2, \
+        "expected updated ggplot to be built again"
+
+    cowpatch.cache._discard_built_gg(g0)
+    _ = cowpatch.cache._cached_build_gg(g0)
+    assert num_builds["count"] == 3, \
+        "expected discarded ggplot to be built again"
+
+    # turning off the cache ------
+    monkeypatch.setitem(cow.rcParams, "build_cache_maxsize", 0)
+    _ = cowpatch.cache._cached_build_gg(g0)
+    assert num_builds["count"] == 4, \
+        "expected build_cache_maxsize = 0 to turn off the cache"
+
+    cowpatch.cache._build_cache.clear()
+    cow.clear_size_cache()
+
+def test__bytes_lru_cache():
+    cache = cowpatch.cache._bytes_lru_cache()
+
+    cache.put("a", b"12345", maxsize=8)
+    cache.put("b", b"123", maxsize=8)
+    assert cache.get("a") == b"12345" and cache.info().currsize == 8, \
+        "expected stored values (and their bytes) to be tracked"
+
+    cache.put("c", b"12", maxsize=8)
+    assert cache.get("b") is None and cache.get("a") is not None and \
+        cache.get("c") is not None and cache.info().currsize == 7, \
+        "expected least recently used values to be evicted beyond maxsize"
+
+    cache.put("d", b"123456789", maxsize=8)
+    assert cache.get("d") is None and cache.info().currsize == 7, \
+        "expected values larger than maxsize to not be stored"
+
+    cache.clear()
+    assert cache.info() == cowpatch.cache.CacheInfo(hits=0, misses=0,
+                                                    maxsize=8, currsize=0), \
+        "expected clear to remove values and reset counters"
+
+
+def test__bytes_lru_cache__threads():
+    """
+    the byte count should stay consistent when threads share the cache
+    """
+    cache = cowpatch.cache._bytes_lru_cache()
+
+    def _work(t_idx):
+        for i in range(2000):
+            key = (t_idx + i) % 50
+            cache.put(key, b"x" * (key + 1), maxsize=500)
+            cache.get((key + 7) % 50)
+            if i % 10 == 0:
+                cache.discard((key + 3) % 50)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(_work, range(8)))
+
+    assert cache.info().currsize == \
+        np.sum([len(v) for v in cache.store.values()]) and \
+        cache.info().currsize <= 500, \
+        "expected the tracked bytes to match the stored values"
+    assert cache.info().hits + cache.info().misses == 8 * 2000, \
+        "expected each lookup to be counted"
+
+def test_patch_svg__fragment_cache(monkeypatch):
+    """
+    only the plotnine objects that changed should be rendered again
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 0')
+    g1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 1')
+    g1_changed = p9.ggplot(p9_data.mpg[p9_data.mpg.year == 2008]) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 1 (changed)')
+
+    rendered = []
+    base_raw_gg_to_svg = cowpatch.svg_utils._raw_gg_to_svg
+    def tracking_raw_gg_to_svg(gg, *args, **kwargs):
+        rendered.append(gg.labels["title"])
+        return base_raw_gg_to_svg(gg, *args, **kwargs)
+    monkeypatch.setattr(cowpatch.svg_utils, "_raw_gg_to_svg",
+                        tracking_raw_gg_to_svg)
+    monkeypatch.setattr(cowpatch.cache, "_raw_gg_to_svg",
+                        tracking_raw_gg_to_svg)
+    cow.clear_size_cache()
+    cow.clear_fragment_cache()
+
+    vis_patch = cow.patch(g0, g1, g0) + cow.layout(nrow = 1)
+    svg_str = vis_patch._svg(width_pt = 700, height_pt = 200)[0].to_str()
+    assert set(rendered) == set(["Plot 0", "Plot 1"]), \
+        "expected all plotnine objects to be rendered at first"
+
+    rendered.clear()
+    hits = cow.fragment_cache_info().hits
+    assert vis_patch._svg(width_pt = 700, height_pt = 200)[0].to_str() == \
+        svg_str and rendered == [], \
+        "expected the same svg without rendering plotnine objects again"
+    assert cow.fragment_cache_info().hits == hits + 3, \
+        "expected each plotnine object's svg to be obtained from the cache"
+
+    vis_patch_changed = cow.patch(g0, g1_changed, g0) + cow.layout(nrow = 1)
+    _ = vis_patch_changed._svg(width_pt = 700, height_pt = 200)
+    assert set(rendered) == set(["Plot 1 (changed)"]), \
+        "expected only the changed plotnine object to be rendered again"
+
+    # different matplotlib rcParams ------
+    rendered.clear()
+    with monkeypatch.context() as m:
+        m.setitem(matplotlib.rcParams, "svg.hashsalt", "cowpatch")
+        _ = vis_patch._svg(width_pt = 700, height_pt = 200)
+    assert set(rendered) == set(["Plot 0", "Plot 1"]), \
+        "expected svgs rendered with a different svg.hashsalt to not be "+\
+        "reused"
+
+    # turning off the cache ------
+    rendered.clear()
+    monkeypatch.setitem(cow.rcParams, "fragment_cache_maxbytes", 0)
+    _ = vis_patch._svg(width_pt = 700, height_pt = 200)
+    assert len(rendered) == 3, \
+        "expected fragment_cache_maxbytes = 0 to turn off the cache"
+
+    cow.clear_size_cache()
+    cow.clear_fragment_cache()
+
+def test__patch_fingerprint():
+    """
+    patch fingerprint should depend on the layouts and ggplots' content
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 0')
+    g1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_bar(p9.aes(x="hwy")) +\
+        p9.labs(title = 'Plot 1')
+
+    vis_patch = cow.patch(g0, cow.patch(g1, g0) + cow.layout(ncol = 1)) +\
+        cow.layout(nrow = 1)
+    vis_patch_same = cow.patch(copy.deepcopy(g0),
+                               cow.patch(g1, g0) + cow.layout(ncol = 1)) +\
+        cow.layout(nrow = 1)
+
+    assert cowpatch.cache._patch_fingerprint(vis_patch) == \
+        cowpatch.cache._patch_fingerprint(vis_patch_same), \
+        "expected patches with the same content to have the same fingerprint"
+
+    others = [cow.patch(g0, cow.patch(g1, g0) + cow.layout(ncol = 1)) +\
+                cow.layout(nrow = 1, rel_widths = [1, 2]),
+              cow.patch(g0, cow.patch(g1, g0) + cow.layout(nrow = 1)) +\
+                cow.layout(nrow = 1),
+              cow.patch(g0, cow.patch(g1, g1) + cow.layout(ncol = 1)) +\
+                cow.layout(nrow = 1),
+              cow.patch(g0, cow.patch(g1, g0) + cow.layout(ncol = 1)) +\
+                cow.layout(design = np.array([[0, 1, 1]]))]
+
+    fingerprints = [cowpatch.cache._patch_fingerprint(p)
+                        for p in [vis_patch] + others]
+    assert len(np.unique(fingerprints)) == len(fingerprints), \
+        "expected changes to layouts (and nested patches / ggplots) to " +\
+        "change the fingerprint"
+
+def test_patch_save__output_cache(monkeypatch, tmp_path):
+    """
+    saving the same patch again should copy the stored file
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 0')
+
+    vis_patch = cow.patch(g0, g0) + cow.layout(nrow = 1)
+
+    monkeypatch.setitem(cow.rcParams, "output_cache_dir",
+                        str(tmp_path / "outputs"))
+    cow.clear_output_cache()
+
+    vis_patch.save(str(tmp_path / "out0.svg"), width = 6, height = 3,
+                   verbose = False)
+    assert cow.output_cache_info().misses == 1 and \
+        cow.output_cache_info().currsize == \
+            os.path.getsize(tmp_path / "out0.svg"), \
+        "expected saved file to be stored"
+
+    def no_svg(*args, **kwargs):
+        raise AssertionError("no rendering expected")
+    monkeypatch.setattr(cow.patch, "_svg", no_svg)
+
+    fid = io.BytesIO()
+    vis_patch_same = cow.patch(copy.deepcopy(g0), g0) + cow.layout(nrow = 1)
+    vis_patch_same.save([str(tmp_path / "out1.svg"), fid],
+                        _format = [None, "svg"], width = 6, height = 3,
+                        verbose = False)
+    with open(tmp_path / "out0.svg", "rb") as fid0, \
+        open(tmp_path / "out1.svg", "rb") as fid1:
+        svg_bytes = fid0.read()
+        assert fid1.read() == svg_bytes and fid.getvalue() == svg_bytes, \
+            "expected the stored file to be copied"
+    assert cow.output_cache_info() == cowpatch.cache.CacheInfo(hits=2,
+                misses=1, maxsize=cow.rcParams["output_cache_dir_max_bytes"],
+                currsize=len(svg_bytes)), \
+        "expected hits to be counted"
+
+    # changes to the request ------
+    for kwargs in [dict(width = 5), dict(dpi = 100), dict(minify = True)]:
+        inner_kwargs = dict(width = 6, height = 3, verbose = False)
+        inner_kwargs.update(kwargs)
+        with pytest.raises(AssertionError):
+            vis_patch.save(str(tmp_path / "out2.svg"), **inner_kwargs)
+
+    with monkeypatch.context() as m:
+        m.setitem(matplotlib.rcParams, "svg.fonttype", "none")
+        with pytest.raises(AssertionError):
+            vis_patch.save(str(tmp_path / "out2.svg"), width = 6, height = 3,
+                           verbose = False)
+
+    monkeypatch.setitem(cow.rcParams, "minify_precision", 3)
+    with pytest.raises(AssertionError):
+        vis_patch.save(str(tmp_path / "out2.svg"), width = 6, height = 3,
+                       verbose = False)
+
+    cow.clear_output_cache()
+    assert cow.output_cache_info().currsize == 0 and \
+        cow.output_cache_info().hits == 0, \
+        "expected clear to remove stored files and reset counters"
@@ -4,14 +4,20 @@ import pytest
 import numpy as np
 
 import io
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import re
 import cowpatch.svg_utils
 import cowpatch.utils
 import cowpatch.layout_elements
 
 import svgutils.transform as sg
+from lxml import etree
+from PIL import Image
 
 import plotnine as p9
 import plotnine.data as p9_data
+import matplotlib.pyplot as plt
 
 import copy
 
@@ -48,6 +54,138 @@ def test__save_svg_wrapper(image_regression):
 
             image_regression.check(fid2.getvalue(), diff_threshold=.1)
 
+def test__save_svg_wrapper__svgz(tmp_path):
+    """
+    svgz files should be the gzip compression of the svg (for svg objects
+    and streaming functions)
+    """
+    vis1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y="displ")) +\
+        p9.labs(title = "Plot 1")
+
+    svg_obj = cowpatch.svg_utils._raw_gg_to_svg(vis1, width=5, height=4,
+                                                dpi=96)
+
+    cowpatch.svg_utils._save_svg_wrapper(svg_obj,
+                                         filename=str(tmp_path / "out.svg"),
+                                         width=5, height=4, verbose=False)
+    cowpatch.svg_utils._save_svg_wrapper(svg_obj,
+                                         filename=str(tmp_path / "out.svgz"),
+                                         width=5, height=4, verbose=False)
+
+    with open(tmp_path / "out.svg", "rb") as fid:
+        svg_bytes = fid.read()
+    with open(tmp_path / "out.svgz", "rb") as fid:
+        svgz_bytes = fid.read()
+
+    assert gzip.decompress(svgz_bytes) == svg_bytes, \
+        "expected svgz file to be the compressed svg file"
+    assert len(svgz_bytes) * 3 < len(svg_bytes), \
+        "expected svgz file to be much smaller than the svg file"
+
+    # streaming function ------
+    fid = io.BytesIO()
+    cowpatch.svg_utils._save_svg_wrapper(lambda f: f.write(svg_bytes),
+                                         filename=fid, width=5, height=4,
+                                         _format="svgz", verbose=False)
+    assert gzip.decompress(fid.getvalue()) == svg_bytes, \
+        "expected streamed svg to be compressed into the file object"
+
+def test__save_svg_wrapper__minify_report(monkeypatch):
+    """
+    bytes saved by minification should compare svgs serialized the same way
+    (without a pretty printed serialization)
+    """
+    vis1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y="displ")) +\
+        p9.labs(title = "Plot 1")
+
+    svg_obj = cowpatch.svg_utils._raw_gg_to_svg(vis1, width=5, height=4,
+                                                dpi=96)
+    num_bytes = len(etree.tostring(svg_obj.root, xml_declaration=True,
+                                   standalone=True, encoding="ASCII"))
+
+    def no_to_str():
+        raise AssertionError("no pretty printed serialization expected")
+    monkeypatch.setattr(svg_obj, "to_str", no_to_str)
+
+    fid = io.BytesIO()
+    with pytest.warns(cowpatch.exceptions.CowpatchWarning) as record:
+        cowpatch.svg_utils._save_svg_wrapper(svg_obj, filename=fid,
+                                             width=5, height=4,
+                                             _format="svg", verbose=True,
+                                             minify=True, precision=2)
+
+    reports = [re.findall("Minified svg: ([0-9,]+) bytes saved",
+                          str(w.message)) for w in record]
+    num_bytes_saved = [int(r[0].replace(",", "")) for r in reports
+                        if len(r) > 0]
+    assert num_bytes_saved == [num_bytes - len(fid.getvalue())], \
+        "expected bytes saved w.r.t. the svg without indentation"
+
+def test__save_svg_wrapper__multiple(monkeypatch, tmp_path):
+    """
+    saving to multiple files should serialize the svg once and convert it for
+    each requested format (in serial or in parallel)
+    """
+    vis1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y="displ")) +\
+        p9.labs(title = "Plot 1")
+
+    svg_obj = cowpatch.svg_utils._raw_gg_to_svg(vis1, width=5, height=4,
+                                                dpi=96)
+
+    conversions = []
+    def recording_convert(base_image_string, filename, _format, **kwargs):
+        conversions.append((base_image_string, filename, _format))
+    monkeypatch.setattr(cowpatch.svg_utils, "_convert_svg_bytes",
+                        recording_convert)
+
+    num_to_str = {"count": 0}
+    base_to_str = svg_obj.to_str
+    def counting_to_str():
+        num_to_str["count"] += 1
+        return base_to_str()
+    monkeypatch.setattr(svg_obj, "to_str", counting_to_str)
+
+    filenames = [str(tmp_path / f) for f in
+                    ["out.svg", "out.svgz", "out.pdf", "out.png", "out.jpg"]]
+    for max_workers in [1, 3]:
+        conversions.clear()
+        num_to_str["count"] = 0
+        cowpatch.svg_utils._save_svg_wrapper(svg_obj, filename=filenames,
+                                             width=5, height=4,
+                                             verbose=False,
+                                             max_workers=max_workers)
+
+        assert num_to_str["count"] == 1 and \
+            sorted([c[2] for c in conversions]) == ["jpg", "pdf", "png"] and \
+            np.all([c[0] == base_to_str() for c in conversions]), \
+            "expected the svg to be serialized once for all conversions " +\
+            "(max_workers = %i)" % max_workers
+
+    with open(filenames[0], "rb") as fid:
+        svg_bytes = fid.read()
+    with open(filenames[1], "rb") as fid:
+        assert gzip.decompress(fid.read()) == svg_bytes, \
+            "expected svg and svgz files to contain the same svg"
+
+    # formats for file objects ------
+    fids = [io.BytesIO(), io.BytesIO()]
+    cowpatch.svg_utils._save_svg_wrapper(svg_obj, filename=fids,
+                                         width=5, height=4,
+                                         _format=["svg", "svgz"],
+                                         verbose=False)
+    assert fids[0].getvalue() == svg_bytes and \
+        gzip.decompress(fids[1].getvalue()) == svg_bytes, \
+        "expected list of formats to define each file object's format"
+
+    with pytest.raises(ValueError):
+        cowpatch.svg_utils._save_svg_wrapper(svg_obj, filename=fids,
+                                             width=5, height=4,
+                                             _format=["svg"],
+                                             verbose=False)
+
 def test__raw_gg_to_svg(image_regression):
     """
     image regression for _raw_gg_to_svg
@@ -182,6 +320,395 @@ def test_gg_to_svg__image(image_regression):
 
         image_regression.check(fid.getvalue(), diff_threshold=.1)
 
+def test__real_size_out_bbox():
+    """
+    size calculated from the bounding box should match the size of the
+    svg object
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ", color="class")) +\
+        p9.facet_wrap("cyl") +\
+        p9.labs(title = 'Plot 0')
+
+    for width, height, dpi in [(5, 4, 96), (3, 2, 96), (7, 3, 300)]:
+        size_bbox = cowpatch.svg_utils._real_size_out_bbox(g0,
+                                                           width=width,
+                                                           height=height,
+                                                           dpi=dpi)
+        size_svg = cowpatch.svg_utils._real_size_out_svg(g0,
+                                                         width=width,
+                                                         height=height,
+                                                         dpi=dpi)
+        assert np.allclose(size_bbox, size_svg, atol=1e-6), \
+            "expected bounding box size to match svg size " +\
+            "(w={}, h={}, dpi={})".format(width, height, dpi)
+
+    with pytest.raises(Exception) as e_info:
+        cowpatch.svg_utils._real_size_out_bbox(g0, width=30, height=4,
+                                               dpi=96)
+
+
+def test__convert_svg_bytes__pixels(monkeypatch):
+    """
+    jpeg, webp and tiff files should be encoded from the rendered pixels
+    (without a png), with the requested quality and subsampling
+    """
+    image = Image.fromarray(np.random.RandomState(0).randint(0, 256,
+                                                  size=(60, 80, 4),
+                                                  dtype=np.uint8),
+                            mode="RGBA")
+    monkeypatch.setattr(cowpatch.svg_utils, "_svg_bytes_to_image",
+                        lambda base_image_string, **kwargs: image)
+
+    def no_png(*args, **kwargs):
+        raise AssertionError("no png expected")
+    monkeypatch.setattr(cowpatch.svg_utils.cairosvg, "svg2png", no_png)
+
+    for _format, pil_format in [("jpg", "JPEG"), ("webp", "WEBP"),
+                                ("tiff", "TIFF")]:
+        fid = io.BytesIO()
+        cowpatch.svg_utils._convert_svg_bytes(b"<svg/>", fid,
+                                              _format=_format,
+                                              width=1, height=1, dpi=80)
+        out = Image.open(io.BytesIO(fid.getvalue()))
+        assert out.format == pil_format and out.size == image.size, \
+            "expected %s file with the image's size" % _format
+
+    file_sizes = []
+    for quality in [20, 90]:
+        fid = io.BytesIO()
+        cowpatch.svg_utils._convert_svg_bytes(b"<svg/>", fid, _format="jpg",
+                                              width=1, height=1, dpi=80,
+                                              quality=quality,
+                                              subsampling="4:4:4")
+        file_sizes.append(len(fid.getvalue()))
+        assert Image.open(fid).layer[0][1:3] == (1, 1), \
+            "expected jpeg without chroma subsampling"
+
+    assert file_sizes[0] < file_sizes[1], \
+        "expected lower quality jpeg to be smaller"
+
+def test__write_png_rows__tiff_rows():
+    """
+    png and tiff files written from chunks of rows should contain the rows
+    """
+    pixels = np.random.RandomState(0).randint(0, 256, size=(23, 17, 4),
+                                              dtype=np.uint8)
+    row_chunks = [pixels[start:(start + 5)].tobytes()
+                    for start in range(0, 23, 5)]
+
+    fid = io.BytesIO()
+    cowpatch.svg_utils._write_png_rows(fid, 17, 23, row_chunks, dpi=50)
+    image = Image.open(io.BytesIO(fid.getvalue()))
+    assert image.format == "PNG" and np.all(np.array(image) == pixels) and \
+        np.allclose(image.info["dpi"], 50, atol=.05), \
+        "expected png with the rows' pixels (and dpi)"
+
+    fid = io.BytesIO()
+    fid.write(b"prefix")
+    cowpatch.svg_utils._write_tiff_rows(fid, 17, 23, 5, row_chunks, dpi=50)
+    image = Image.open(io.BytesIO(fid.getvalue()[len(b"prefix"):]))
+    assert image.format == "TIFF" and image.mode == "RGBA" and \
+        np.all(np.array(image) == pixels) and \
+        np.allclose([float(d) for d in image.info["dpi"]], 50), \
+        "expected tiff with the rows' pixels (and dpi)"
+
+def test__convert_svg_bytes_tiled(monkeypatch):
+    """
+    tiles (rendered in serial or in parallel) should be assembled into the
+    full image
+    """
+    def fake_svg_bytes_to_image(base_image_string, **kwargs):
+        # (red: svg's row, green: column)
+        root = etree.fromstring(base_image_string)
+        y0 = float(root.get("viewBox").split(" ")[1])
+        num_rows = int(root.get("height")[:-2])
+        pixels = np.full((num_rows, int(root.get("width")[:-2]), 4), 255,
+                         dtype=np.uint8)
+        pixels[:, :, 0] = (np.round(y0) + np.arange(num_rows))[:, np.newaxis]
+        pixels[:, :, 1] = np.arange(pixels.shape[1])[np.newaxis, :]
+        return Image.fromarray(pixels, mode="RGBA")
+    monkeypatch.setattr(cowpatch.svg_utils, "_svg_bytes_to_image",
+                        fake_svg_bytes_to_image)
+
+    svg_bytes = b'<svg xmlns="http://www.w3.org/2000/svg" width="72pt" ' +\
+        b'height="36pt" viewBox="0 0 100 50"><rect width="100" ' +\
+        b'height="50"/></svg>'
+
+    expected = np.full((50, 100, 4), 255, dtype=np.uint8)
+    expected[:, :, 0] = np.arange(50)[:, np.newaxis]
+    expected[:, :, 1] = np.arange(100)[np.newaxis, :]
+
+    for _format, max_workers in [("png", 1), ("tiff", 1), ("png", 3)]:
+        fid = io.BytesIO()
+        cowpatch.svg_utils._convert_svg_bytes_tiled(svg_bytes, fid,
+                                                    _format=_format,
+                                                    width=1, height=.5,
+                                                    dpi=100, tile_rows=7,
+                                                    max_workers=max_workers)
+        image = Image.open(io.BytesIO(fid.getvalue()))
+        assert np.all(np.array(image) == expected), \
+            "expected tiles to be assembled in order " +\
+            "(%s, max_workers = %i)" % (_format, max_workers)
+
+    assert cowpatch.svg_utils._tile_svg is None, \
+        "expected the tiled svg to only be stored in worker processes"
+
+    # concurrent conversions ------
+    svg_bytes_shifted = svg_bytes.replace(b'viewBox="0 0 100 50"',
+                                          b'viewBox="0 100 100 50"')
+    expected_shifted = expected.copy()
+    expected_shifted[:, :, 0] += 100
+
+    def _convert(inputs):
+        inner_svg_bytes, max_workers = inputs
+        fid = io.BytesIO()
+        cowpatch.svg_utils._convert_svg_bytes_tiled(inner_svg_bytes, fid,
+                                                    _format="png",
+                                                    width=1, height=.5,
+                                                    dpi=100, tile_rows=7,
+                                                    max_workers=max_workers)
+        return np.array(Image.open(io.BytesIO(fid.getvalue())))
+
+    for max_workers in [1, 3]:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            images = list(pool.map(_convert,
+                                   [(svg_bytes, max_workers),
+                                    (svg_bytes_shifted, max_workers)] * 2))
+        assert np.all([np.all(image == e) for image, e in
+                        zip(images, [expected, expected_shifted] * 2)]), \
+            "expected concurrent conversions to keep their own tiles " +\
+            "(max_workers = %i)" % max_workers
+
+    # tiles of an unexpected size ------
+    def wrong_size_svg_bytes_to_image(base_image_string, **kwargs):
+        return fake_svg_bytes_to_image(base_image_string).resize((100, 8))
+    monkeypatch.setattr(cowpatch.svg_utils, "_svg_bytes_to_image",
+                        wrong_size_svg_bytes_to_image)
+    with pytest.raises(ValueError):
+        cowpatch.svg_utils._convert_svg_bytes_tiled(svg_bytes, io.BytesIO(),
+                                                    _format="png",
+                                                    width=1, height=.5,
+                                                    dpi=100, tile_rows=7,
+                                                    max_workers=1)
+
+def test__file_format():
+    """
+    format should be the file name's extension (or the provided format)
+    """
+    assert cowpatch.svg_utils._file_format("fig.v2.PNG") == "png" and \
+        cowpatch.svg_utils._file_format("dir.v2/fig.svgz") == "svgz" and \
+        cowpatch.svg_utils._file_format(io.BytesIO(), _format="pdf") == \
+            "pdf", \
+        "expected the (lower case) last extension or the provided format"
+
+    for filename in ["fig", "dir.v2/fig", io.BytesIO(), "fig.gif"]:
+        with pytest.raises(ValueError):
+            cowpatch.svg_utils._file_format(filename)
+
+def test__save_image_wrapper(tmp_path):
+    """
+    image should be saved in the format of each file (with a format for
+    each file)
+    """
+    image = Image.new("RGB", (40, 30), "#FF0000")
+
+    filenames = [str(tmp_path / "out.png"), str(tmp_path / "out.jpg")]
+    cowpatch.svg_utils._save_image_wrapper(image, filename=filenames,
+                                           width=1, height=.75, dpi=40,
+                                           verbose=False)
+    assert [Image.open(f).format for f in filenames] == ["PNG", "JPEG"], \
+        "expected files to be saved in the format of their extension"
+
+    with pytest.raises(ValueError):
+        cowpatch.svg_utils._save_image_wrapper(image, filename=filenames,
+                                               width=1, height=.75, dpi=40,
+                                               _format=["png"],
+                                               verbose=False)
+
+def test__cairo_argb32_modes():
+    """
+    cairo's (premultiplied, native endian) ARGB32 pixels should be read as
+    the same RGBA pixel on little and big endian machines
+    """
+    # (red with alpha 128: 0x80800000 as a 32 bit word)
+    for byteorder in ["little", "big"]:
+        mode, raw_mode = cowpatch.svg_utils._cairo_argb32_modes[byteorder]
+        pixel_bytes = (0x80800000).to_bytes(4, byteorder)
+        image = Image.frombuffer(mode, (1, 1), pixel_bytes, "raw", raw_mode,
+                                 0, 1).convert("RGBA")
+        assert image.getpixel((0, 0)) == (255, 0, 0, 128), \
+            "expected unpremultiplied red pixel (%s endian)" % byteorder
+
+def test__raw_gg_to_image():
+    """
+    raster image should have the size of the svg (at the requested dpi)
+    """
+    vis1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y="displ")) +\
+        p9.labs(title = "Plot 1")
+
+    svg_obj = cowpatch.svg_utils._raw_gg_to_svg(vis1, width=5, height=4,
+                                                dpi=96)
+    image = cowpatch.svg_utils._raw_gg_to_image(vis1, width=5, height=4,
+                                                dpi=96, raster_dpi=200)
+
+    svg_width_px = float(svg_obj.width[:-2]) / 72 * 200
+    svg_height_px = float(svg_obj.height[:-2]) / 72 * 200
+
+    assert image.mode == "RGBA" and \
+        np.abs(image.size[0] - svg_width_px) < 2 and \
+        np.abs(image.size[1] - svg_height_px) < 2, \
+        "expected image size to match the svg's size (up to a pixel)"
+
+def test__raw_gg_to_svg__rasterize():
+    """
+    rasterizing the data layers should keep the svg's size, text and axes
+    """
+    vis1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y="displ")) +\
+        p9.labs(title = "Plot 1")
+
+    built = cowpatch.svg_utils._build_gg(vis1)
+    assert cowpatch.svg_utils._gg_num_elements(built) == p9_data.mpg.shape[0], \
+        "expected a data element per row of the layer data"
+
+    svg_vector = cowpatch.svg_utils._raw_gg_to_svg(built, width=5, height=4,
+                                                   dpi=96)
+    svg_raster = cowpatch.svg_utils._raw_gg_to_svg(vis1, width=5, height=4,
+                                                   dpi=96, rasterize=True,
+                                                   raster_dpi=200)
+
+    assert svg_vector.width == svg_raster.width and \
+        svg_vector.height == svg_raster.height, \
+        "expected rasterization to not change the size of the svg"
+
+    vector_str = svg_vector.to_str().decode()
+    raster_str = svg_raster.to_str().decode()
+    assert vector_str.count("<image") == 0 and \
+        raster_str.count("<image") == 1 and \
+        raster_str.count("<path") < vector_str.count("<path") - 100, \
+        "expected points to be replaced by an image"
+    assert len(re.findall("<g id=\"text_", raster_str)) == \
+        len(re.findall("<g id=\"text_", vector_str)), \
+        "expected text to stay vector graphics"
+
+def test__build_gg():
+    """
+    rendering a built ggplot object should be the same as rendering the
+    original ggplot object
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ", color="class")) +\
+        p9.geom_smooth(p9.aes(x="hwy", y = "displ"), method="lm") +\
+        p9.facet_wrap("cyl") +\
+        p9.labs(title = 'Plot 0')
+
+    g0_built = cowpatch.svg_utils._build_gg(g0)
+
+    assert cowpatch.svg_utils._is_built_gg(g0_built) and \
+        not cowpatch.svg_utils._is_built_gg(g0), \
+        "expected only the returned copy to be built"
+    assert cowpatch.svg_utils._build_gg(g0_built) is g0_built, \
+        "expected a built ggplot object to not be built again"
+
+    for width, height in [(5, 4), (3, 2)]:
+        size_built = cowpatch.svg_utils._real_size_out_bbox(g0_built,
+                                                            width=width,
+                                                            height=height,
+                                                            dpi=96)
+        size = cowpatch.svg_utils._real_size_out_bbox(g0,
+                                                      width=width,
+                                                      height=height,
+                                                      dpi=96)
+        assert np.allclose(size_built, size), \
+            "expected built ggplot object to have the same size " +\
+            "(w={}, h={})".format(width, height)
+
+    num_figures = len(plt.get_fignums())
+    fig, plot = cowpatch.svg_utils._draw_gg(g0_built, width=5, height=4,
+                                            dpi=96)
+    assert len(plot.axs) == 4 and \
+        tuple(fig.get_size_inches()) == (5, 4), \
+        "expected built ggplot to be drawn with the requested size"
+    plt.close(fig)
+    assert len(plt.get_fignums()) == num_figures, \
+        "expected drawn figure to be closed"
+
+    assert cowpatch.svg_utils._is_built_gg(g0_built), \
+        "expected drawing to not modify the built ggplot object"
+
+def test__live_gg_figure():
+    """
+    sizes measured from a resized figure should match sizes from a freshly
+    drawn figure (and the figure should be closed after)
+    """
+    g_wrap = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ", color="class")) +\
+        p9.facet_wrap("cyl") +\
+        p9.labs(title = 'Plot 0', caption = "caption") +\
+        p9.theme(legend_position="bottom")
+    g_grid = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.facet_grid("drv ~ cyl") +\
+        p9.labs(title = 'Plot 1\n(second line)')
+
+    num_figures = len(plt.get_fignums())
+    for g in [g_wrap, g_grid]:
+        with cowpatch.svg_utils._live_gg_figure(g, width=5, height=4,
+                                                dpi=96) as live:
+            assert live.resizable, \
+                "expected plot without watermarks or arrows to be resized"
+
+            for width, height in [(5, 4), (3, 2), (7, 3), (5, 4)]:
+                size_live = live.measure(width=width, height=height)
+                size_fresh = cowpatch.svg_utils._real_size_out_bbox(g,
+                                                            width=width,
+                                                            height=height,
+                                                            dpi=96)
+                assert np.allclose(size_live, size_fresh, atol=1e-6), \
+                    "expected resized figure size to match freshly drawn " +\
+                    "figure size (w={}, h={})".format(width, height)
+
+            with pytest.raises(Exception) as e_info:
+                live.measure(width=30, height=4)
+
+    assert len(plt.get_fignums()) == num_figures, \
+        "expected drawn figures to be closed"
+
+    # arrows depend on the size of the figure -------
+    g_arrow = p9.ggplot(p9_data.mpg) +\
+        p9.geom_segment(p9.aes(x="hwy", y = "displ",
+                               xend="cty", yend="displ"),
+                        arrow=p9.arrow())
+    with cowpatch.svg_utils._live_gg_figure(g_arrow, width=5, height=4,
+                                            dpi=96) as live:
+        assert not live.resizable, \
+            "expected plot with arrows to be drawn from scratch"
+
+def test__select_correcting_size_svg__reuse_figure():
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ", color="class")) +\
+        p9.labs(title = 'Plot 0')
+
+    num_figures = len(plt.get_fignums())
+    for method in ["affine", "fixed_point"]:
+        out_reuse = cowpatch.svg_utils._select_correcting_size_svg(g0,
+                                                    height=4, width=5,
+                                                    dpi=96, method=method,
+                                                    reuse_figure=True)
+        out_fresh = cowpatch.svg_utils._select_correcting_size_svg(g0,
+                                                    height=4, width=5,
+                                                    dpi=96, method=method,
+                                                    reuse_figure=False)
+        assert out_reuse[2] and out_fresh[2] and \
+            np.allclose(out_reuse[:2], out_fresh[:2], atol=1e-6), \
+            "expected reusing the figure to not change the solved size " +\
+            "(method={})".format(method)
+
+    assert len(plt.get_fignums()) == num_figures, \
+        "expected drawn figures to be closed"
+
 def test__select_correcting_size_svg():
     # don't expect error -------
 
@@ -265,6 +792,164 @@ def test__select_correcting_size_svg():
         "expected error when throw_error =True (not enough interations "+\
         "to succeed) not observed"
 
+def test__uniquify_svg_str_safe():
+    """
+    referenced ids (with url(#___) and xlink:href="#___") should be updated
+    along with their references, other ids should not be changed
+    """
+    svg_str = '<svg xmlns:xlink="http://www.w3.org/1999/xlink">' +\
+        '<defs><clipPath id="p1a"><rect/></clipPath>' +\
+        '<path id="DejaVuSans-73" d="M 0 0"/>' +\
+        '<linearGradient id="g_2"/></defs>' +\
+        '<g id="figure_1" clip-path="url(#p1a)">' +\
+        '<use xlink:href="#DejaVuSans-73" x="1"/>' +\
+        '<rect style="fill: url(#g_2)"/>' +\
+        '<g clip-path="url(#p1a)"/></g></svg>'
+
+    out = cowpatch.svg_utils._uniquify_svg_str_safe(svg_str, "_1_0")
+
+    assert out == svg_str.replace('p1a', 'p1a_1_0').\
+                replace('DejaVuSans-73', 'DejaVuSans-73_1_0').\
+                replace('g_2', 'g_2_1_0'), \
+        "expected referenced ids and references to be updated"
+
+    assert cowpatch.svg_utils._uniquify_svg_str_safe(
+                '<svg><g id="figure_1"/></svg>', "_1_0") == \
+            '<svg><g id="figure_1"/></svg>', \
+        "expected unreferenced ids to not be updated"
+
+def test__uniquify_svg_safe__tree():
+    """
+    updating the svg object's tree should be the same as updating its
+    string representation
+    """
+    vis1 = p9.ggplot(p9_data.mtcars) +\
+        p9.aes('wt', 'mpg', color='hp') +\
+        p9.geom_point() +\
+        p9.labs(title = "Plot 1")
+
+    svg_obj = cowpatch.svg_utils._raw_gg_to_svg(vis1, width=5, height=4,
+                                                dpi=96)
+    svg_str = svg_obj.to_str().decode()
+    svg_str = svg_str[svg_str.index("<svg"):]
+
+    updated_str = cowpatch.svg_utils._uniquify_svg_str_safe(svg_str,
+                                                            "_bpl_0")
+    updated_svg_obj = cowpatch.svg_utils._uniquify_svg_safe(svg_obj,
+                                                            "_bpl_0")
+
+    assert updated_svg_obj is svg_obj, \
+        "expected svg object to be updated in place"
+    assert updated_svg_obj.to_str() == sg.fromstring(updated_str).to_str(), \
+        "expected tree update to match the string update"
+    assert updated_str != svg_str, \
+        "expected ids to be updated"
+
+def test__dedup_svg_defs():
+    """
+    identical definitions of multiple plotnine objects should be stored once
+    (with all references pointing to the kept definition)
+    """
+    vis1 = p9.ggplot(p9_data.mtcars) +\
+        p9.aes('wt', 'mpg', color='hp') +\
+        p9.geom_point() +\
+        p9.labs(title = "Plot 1")
+
+    base_image = sg.SVGFigure()
+    for str_update in ["_bpl_0", "_bpl_1"]:
+        svg_obj = cowpatch.svg_utils._raw_gg_to_svg(vis1, width=5, height=4,
+                                                    dpi=96)
+        svg_obj = cowpatch.svg_utils._uniquify_svg_safe(svg_obj, str_update)
+        base_image.append(svg_obj.getroot())
+
+    def _ids_and_references(svg_obj):
+        svg_str = svg_obj.to_str().decode()
+        ids = re.findall('id="([^"]+)"', svg_str)
+        references = set(re.findall('url\\(#([^)]+)\\)', svg_str) +
+                         re.findall('href="#([^"]+)"', svg_str))
+        return ids, references
+
+    _, references_before = _ids_and_references(base_image)
+    num_defs_before = len([d for d in base_image.root.iter(sg.SVG + "defs")
+                                for e in d if e.get("id") is not None])
+
+    out = cowpatch.svg_utils._dedup_svg_defs(base_image)
+    assert out is base_image, \
+        "expected svg object to be updated in place"
+
+    ids, references = _ids_and_references(base_image)
+    top_defs = base_image.root[0]
+    assert top_defs.tag == sg.SVG + "defs" and \
+        2 * len(top_defs) == num_defs_before, \
+        "expected a single copy of each definition in the top defs"
+    assert references.issubset(set(ids)) and \
+        np.all([not e.get("id").endswith("_bpl_1") for e in top_defs]) and \
+        len(references) < len(references_before), \
+        "expected all references to point to kept definitions"
+    assert len([d for d in base_image.root.iter(sg.SVG + "defs")
+                    if len(d) == 0]) == 0, \
+        "expected emptied defs to be removed"
+
+    # definitions across svg objects ------
+    seen_defs = dict()
+    for str_update in ["_bpl_0", "_bpl_1"]:
+        svg_obj = cowpatch.svg_utils._raw_gg_to_svg(vis1, width=5, height=4,
+                                                    dpi=96)
+        svg_obj = cowpatch.svg_utils._uniquify_svg_safe(svg_obj, str_update)
+        cowpatch.svg_utils._dedup_svg_defs(svg_obj, seen_defs=seen_defs,
+                                           to_top=False)
+        ids, references = _ids_and_references(svg_obj)
+        if str_update == "_bpl_1":
+            assert len([e for d in svg_obj.root.iter(sg.SVG + "defs")
+                            for e in d if e.get("id") is not None]) == 0 and \
+                np.all([r.endswith("_bpl_0") or r in ids
+                            for r in references]), \
+                "expected second svg to reference the first's definitions"
+
+
+def test__minify_svg():
+    """
+    minifying should round coordinates, remove metadata and keep (shortened)
+    references valid
+    """
+    vis1 = p9.ggplot(p9_data.mtcars) +\
+        p9.aes('wt', 'mpg', color='hp') +\
+        p9.geom_point() +\
+        p9.labs(title = "Plot 1")
+
+    svg_obj = cowpatch.svg_utils._raw_gg_to_svg(vis1, width=5, height=4,
+                                                dpi=96)
+    svg_str = svg_obj.to_str().decode()
+    def _num_drawn_elements(svg_obj):
+        return len([e for e in svg_obj.root.iter("*")
+                        if type(e.tag) is str and e.tag.startswith(sg.SVG) and
+                            e.tag != sg.SVG + "metadata"])
+    num_elements = _num_drawn_elements(svg_obj)
+
+    out = cowpatch.svg_utils._minify_svg(svg_obj, precision=1)
+    assert out is svg_obj, \
+        "expected svg object to be updated in place"
+
+    minified_str = svg_obj.to_str().decode()
+    assert len(minified_str) < len(svg_str) and \
+        "<metadata" not in minified_str and \
+        len(re.findall("\\.\\d\\d", re.sub('style="[^"]*"', "",
+            re.sub('transform="[^"]*"', "", minified_str)))) == 0, \
+        "expected coordinates to be rounded and metadata to be removed"
+
+    ids = re.findall(' id="([^"]+)"', minified_str)
+    references = set(re.findall('url\\(#([^)]+)\\)', minified_str) +
+                     re.findall('href="#([^"]+)"', minified_str))
+    assert references.issubset(set(ids)) and \
+        np.all([len(i) <= 2 for i in ids]), \
+        "expected references to point to shortened ids"
+    assert _num_drawn_elements(svg_obj) == num_elements, \
+        "expected only metadata and comments to be removed"
+
+    assert [cowpatch.svg_utils._svg_short_id(i) for i in [0, 25, 26, 27]] ==\
+        ["a", "z", "aa", "ab"], \
+        "expected short ids to be sequences of letters"
+
 def test__uniquify_svg_safe(image_regression):
     """
     static test for _uniquify_svg_safe to confirm that we can have
@@ -336,3 +1021,137 @@ def test__uniquify_svg_safe(image_regression):
         image_regression.check(fid.getvalue(), diff_threshold=.1)
 
 
+
+def test__select_correcting_size_svg__affine(monkeypatch):
+    """
+    affine size solver should agree with the fixed point solver while
+    requiring fewer renders
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ", color="class")) +\
+        p9.labs(title = 'Plot 0')
+
+    desired_width = 5
+    desired_height = 4
+
+    num_renders = {"count": 0}
+    base_measure = cowpatch.svg_utils._live_gg_figure.measure
+    def counting_measure(*args, **kwargs):
+        num_renders["count"] += 1
+        return base_measure(*args, **kwargs)
+
+    monkeypatch.setattr(cowpatch.svg_utils._live_gg_figure, "measure",
+                        counting_measure)
+
+    solutions = dict()
+    renders = dict()
+    for method in ["affine", "fixed_point"]:
+        num_renders["count"] = 0
+        solutions[method] = \
+            cowpatch.svg_utils._select_correcting_size_svg(g0,
+                                                   height = desired_height,
+                                                   width = desired_width,
+                                                   dpi = 96,
+                                                   method = method)
+        renders[method] = num_renders["count"]
+
+    assert solutions["affine"][2] and solutions["fixed_point"][2], \
+        "expected both size solvers to succeed"
+
+    assert np.allclose(solutions["affine"][:2], solutions["fixed_point"][:2],
+                       atol = 1e-2), \
+        "expected affine and fixed point solvers to suggest similar sizes"
+
+    assert renders["affine"] <= 3 and \
+        renders["affine"] < renders["fixed_point"], \
+        "expected affine solver to need at most 3 renders (and fewer than "+\
+        "the fixed point solver)"
+
+    with pytest.raises(Exception) as e_info:
+        cowpatch.svg_utils._select_correcting_size_svg(g0,
+                                                   height = desired_height,
+                                                   width = desired_width,
+                                                   dpi = 96,
+                                                   method = "newton")
+
+def test__select_correcting_size_svg__warm_start(monkeypatch):
+    """
+    a warm start from a previous solution should need fewer renders and
+    agree with a cold start
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ", color="class")) +\
+        p9.labs(title = 'Plot 0')
+
+    num_renders = {"count": 0}
+    base_measure = cowpatch.svg_utils._live_gg_figure.measure
+    def counting_measure(*args, **kwargs):
+        num_renders["count"] += 1
+        return base_measure(*args, **kwargs)
+
+    monkeypatch.setattr(cowpatch.svg_utils._live_gg_figure, "measure",
+                        counting_measure)
+
+    width, height, _ = cowpatch.svg_utils._select_correcting_size_svg(g0,
+                                                        height = 4,
+                                                        width = 5,
+                                                        dpi = 96)
+
+    solutions = dict()
+    renders = dict()
+    for warm_start in [None, ((width, height), (5, 4))]:
+        num_renders["count"] = 0
+        solutions[warm_start is None] = \
+            cowpatch.svg_utils._select_correcting_size_svg(g0,
+                                                       height = 5,
+                                                       width = 6,
+                                                       dpi = 96,
+                                                       warm_start = warm_start)
+        renders[warm_start is None] = num_renders["count"]
+
+    assert solutions[True][2] and solutions[False][2] and \
+        np.allclose(solutions[True][:2], solutions[False][:2], atol = 1e-2), \
+        "expected warm and cold starts to suggest similar sizes"
+    assert renders[False] < renders[True], \
+        "expected warm start to need fewer renders"
+
+def test__select_correcting_size_svg__return_svg():
+    """
+    returned svg object should be the render with the returned sizes
+    """
+    g0 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ")) +\
+        p9.labs(title = 'Plot 0')
+
+    width, height, boolean, img = \
+        cowpatch.svg_utils._select_correcting_size_svg(g0,
+                                                   height = 4,
+                                                   width = 5,
+                                                   dpi = 96,
+                                                   return_svg = True)
+
+    inches_dim = [cowpatch.utils.to_inches(x, "pt") for x in
+            cowpatch.utils._transform_size_to_pt(img.get_size())]
+
+    assert boolean and np.allclose(inches_dim, [5, 4], atol = 1e-2), \
+        "expected returned svg object to have the desired size"
+
+    img2 = cowpatch.svg_utils._raw_gg_to_svg(g0, width=width, height=height,
+                                             dpi=96)
+    assert img2.get_size() == img.get_size(), \
+        "expected returned svg object to be the render with the returned "+\
+        "width and height"
+
+    # failed sizing ------
+    g1 = p9.ggplot(p9_data.mpg) +\
+        p9.geom_point(p9.aes(x="hwy", y = "displ",  color="class")) +\
+        p9.labs(title = 'Plot 0 color')
+
+    out = cowpatch.svg_utils._select_correcting_size_svg(g1,
+                                                   height = 1,
+                                                   width = 5/4,
+                                                   dpi = 96,
+                                                   throw_error = False,
+                                                   return_svg = True)
+    assert len(out) == 4 and not out[2] and out[3] is None, \
+        "expected no svg object to be returned if sizing fails"